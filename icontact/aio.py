@@ -0,0 +1,581 @@
+"""
+asyncio flavour of the iContact API client.
+
+`AsyncIContactClient` exposes the same operations as `IContactClient`, but
+every API method is a coroutine and the `iter_*` methods are async
+generators. Requests go through a shared `httpx.AsyncClient` connection
+pool and a per-client semaphore caps the number of requests in flight::
+
+    async with AsyncIContactClient(key, username, password, concurrency=50) as client:
+        results = await client.gather_bounded(
+            lambda contact_id: client.create_subscription(contact_id, list_id),
+            contact_ids)
+
+Requires the `httpx` package.
+"""
+import asyncio
+import inspect
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from icontact import endpoints
+from icontact.bulk import BulkRecordResult, BulkReport, iter_chunks, match_records
+from icontact.client import IContactClient, copy_json, json_to_obj
+from icontact.ratelimit import parse_retry_after
+
+# Folder scoped API methods whose blocking version returns what `_do_request`
+# returns, without looking at the result. Each of these resolves the default
+# account and client folder, then awaits the coroutine of the async
+# `_do_request`. Methods that post-process their results are coroutines of
+# `AsyncIContactClient` instead.
+FOLDER_METHODS = endpoints.method_names()
+
+ITER_METHODS = endpoints.iter_method_names()
+
+
+class AsyncSingleFlight(object):
+    """
+    asyncio counterpart of `icontact.singleflight.SingleFlight`. The shared
+    call runs as its own task, so cancelling one of the waiting tasks does
+    not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        """
+        Awaits `func()`, or the call already in flight for `key` in
+        another task.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class AsyncIContactClient(IContactClient):
+    """Perform operations on the iContact API from asyncio code."""
+
+    def __init__(self, api_key, username, password, concurrency=20, http_client=None,
+                 http2=False, **kwargs):
+        """
+        Accepts the same arguments as `IContactClient`, plus:
+
+        - concurrency: maximum number of requests this client has in
+          flight at once. Also the default bound for `gather_bounded`.
+        - http_client: (Optional) An existing `httpx.AsyncClient` to share
+          between clients. It is not closed by `aclose()`.
+        - http2: enable HTTP/2 on the connection pool created by the
+          client (requires the `h2` package).
+
+        `pool_maxsize` sizes the connection pool; `session`, `adapter` and
+        `max_retries` only apply to the blocking client. `fingerprints`,
+        `write_batcher`, `contact_index` and `write_behind` are refused, as
+        is streaming (`stream=True`). A `transport` must offer the
+        non-blocking `respond()` of `icontact.cassette.ReplayTransport`.
+        """
+        if httpx is None:
+            raise ImportError('AsyncIContactClient requires the httpx package')
+        for option in ('fingerprints', 'write_batcher', 'contact_index', 'write_behind'):
+            if kwargs.get(option) is not None:
+                raise TypeError('%s is not supported by AsyncIContactClient' % option)
+        if kwargs.get('transport') is not None and not hasattr(kwargs['transport'], 'respond'):
+            raise TypeError('AsyncIContactClient needs a transport with a respond() method')
+        super(AsyncIContactClient, self).__init__(api_key, username, password, **kwargs)
+        self.concurrency = concurrency
+        self.http2 = http2
+        self._http = http_client
+        self._owns_http = http_client is None
+        self._semaphore = None
+        self._folder_lock = None
+        if self._flights is not None:
+            self._flights = AsyncSingleFlight()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    @property
+    def http(self):
+        """The pooled `httpx.AsyncClient`, created on first use."""
+        if self._http is None:
+            limits = httpx.Limits(max_connections=max(self.pool_maxsize, self.concurrency),
+                                  max_keepalive_connections=self.pool_maxsize if self.keep_alive else 0)
+            self._http = httpx.AsyncClient(limits=limits, http2=self.http2, timeout=self.timeout)
+        return self._http
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def aclose(self):
+        """Closes pooled connections, unless the http client was passed in."""
+        if self._owns_http and self._http is not None:
+            http, self._http = self._http, None
+            await http.aclose()
+
+    def close(self):
+        raise TypeError('use "await client.aclose()" to close an AsyncIContactClient')
+
+    async def _perform_request(self, method, url, **kwargs):
+        async with self.semaphore:
+            if self.transport is not None:
+                kwargs.pop('stream', None)
+                kwargs.pop('extensions', None)
+                response, delay = self.transport.respond(method.upper(), url, **kwargs)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                return response
+            return await self.http.request(method.upper(), url, **kwargs)
+
+    async def _do_request(self, call_path, parameters=None, method='get', response_type='json',
+                          params_as_json=False, idempotent=False, stream=None, raw=False):
+        """
+        Coroutine version of `IContactClient._do_request`. Streaming is not
+        supported; responses are parsed whole.
+        """
+        if stream is not None:
+            raise TypeError('stream is not supported by AsyncIContactClient')
+        url, req_params = self._build_request(call_path, parameters, method, response_type, params_as_json)
+
+        cache_key = self._response_cache_key(call_path, url, parameters, method, response_type)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                event = self._start_event(method, call_path, url)
+                with self._reporting(event):
+                    if event is not None:
+                        event.cached = True
+                    return copy_json(cached) if raw else json_to_obj(cached)
+
+        if self._flights is not None and method.lower() == 'get':
+            result = await self._flights.do(self._flight_key(url, parameters, response_type),
+                                            lambda: self._fetch(call_path, method, url, req_params, response_type,
+                                                                idempotent, cache_key, True))
+            if response_type != 'json':
+                return result
+            return copy_json(result) if raw else json_to_obj(result)
+        return await self._fetch(call_path, method, url, req_params, response_type, idempotent, cache_key, raw)
+
+    async def _fetch(self, call_path, method, url, req_params, response_type, idempotent, cache_key, raw):
+        self.log_me(u'Invoking API method %s with URL: %s', method, url)
+        event = self._start_event(method, call_path, url)
+        if event is not None:
+            async def trace(name, info):
+                event.trace(name, info)
+            req_params = dict(req_params, extensions={'trace': trace})
+        with self._reporting(event):
+            try:
+                req, attempts = await self._send(method, url, req_params, idempotent)
+            finally:
+                if self.response_cache is not None and method.lower() != 'get':
+                    self.response_cache.invalidate(call_path)
+            if event is not None:
+                event.response(req, attempts)
+            return self._handle_response(req, response_type, attempts, cache_key, raw, event)
+
+    async def _send(self, method, url, req_params, idempotent=False):
+        policy = self.retry_policy
+        if policy is None or not policy.allows(method, idempotent):
+            return await self._send_once(method, url, req_params), 1
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            status = None
+            try:
+                req = await self._send_once(method, url, req_params)
+            except Exception as e:
+                if not policy.retryable(exception=e):
+                    raise
+                delay = policy.delay(attempt, started, now=loop.time())
+                if delay is None:
+                    e.attempts = attempt
+                    raise
+                policy.notify(attempt, delay, method, url, exception=e)
+            else:
+                if not policy.retryable(status=req.status_code):
+                    return req, attempt
+                status = req.status_code
+                retry_after = parse_retry_after(req.headers.get('Retry-After'))
+                delay = policy.delay(attempt, started, retry_after, now=loop.time())
+                if delay is None:
+                    return req, attempt
+                policy.notify(attempt, delay, method, url, status=status)
+            self.log_me(u'Retrying %s %s in %.2fs (attempt %s failed, status=%s)',
+                        method, url, delay, attempt, status)
+            await asyncio.sleep(delay)
+
+    async def _send_once(self, method, url, req_params):
+        if self.rate_limiter is None:
+            return await self._perform_request(method, url, **req_params)
+
+        wait = self.rate_limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        req = await self._perform_request(method, url, **req_params)
+        self._rate_feedback(req)
+        return req
+
+    async def _paginate(self, call_path, collection, filters=None, page_size=None, prefetch=True, stream=False,
+                        raw=False):
+        if stream:
+            raise TypeError('stream is not supported by AsyncIContactClient')
+        params = dict(filters or {})
+        limit = int(params.pop('limit', None) or page_size or self.DEFAULT_PAGE_SIZE)
+        offset = int(params.pop('offset', None) or 0)
+
+        def fetch(offset):
+            page_params = dict(params)
+            page_params.update(limit=limit, offset=offset)
+            return self._do_request(call_path, parameters=page_params, raw=raw)
+
+        def field(page, name):
+            return page.get(name) if raw else getattr(page, name, None)
+
+        pending = None
+        try:
+            page = await fetch(offset)
+            while True:
+                records = field(page, collection) or []
+                total = field(page, 'total')
+                offset += len(records)
+                if total is not None:
+                    more = bool(records) and offset < int(total)
+                else:
+                    more = len(records) >= limit
+                page = None
+                if more and prefetch:
+                    pending = asyncio.ensure_future(fetch(offset))
+                for record in records:
+                    yield record
+                if not more:
+                    break
+                if pending is not None:
+                    page, pending = await pending, None
+                else:
+                    page = await fetch(offset)
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _get_account_id(self):
+        key = self._discovery_key('account')
+        account_id = self._cached_discovery(key)
+        if account_id is None:
+            account_id = (await self.account()).accountId
+            self._store_discovery(key, account_id)
+        self.account_id = account_id
+        return self.account_id
+
+    async def _get_client_folder_id(self):
+        key = self._discovery_key('clientfolder', self.account_id)
+        client_folder_id = self._cached_discovery(key)
+        if client_folder_id is None:
+            client_folder_id = (await self.clientfolder(self.account_id)).clientFolderId
+            self._store_discovery(key, client_folder_id)
+        self.client_folder_id = client_folder_id
+        return self.client_folder_id
+
+    async def _resolve_folder(self, account_id=None, client_folder_id=None):
+        """
+        Looks up the default account and client folder a call leaves out
+        once, so that the synchronous `_required_values` never needs to
+        make a request. Ids given with the call are not looked up.
+        """
+        need_folder = client_folder_id is None and self.client_folder_id is None
+        need_account = (account_id is None or need_folder) and self.account_id is None
+        if not (need_account or need_folder):
+            return
+        if self._folder_lock is None:
+            self._folder_lock = asyncio.Lock()
+        async with self._folder_lock:
+            # The default client folder is the one of the default account.
+            if self.account_id is None and (account_id is None or need_folder):
+                await self._get_account_id()
+            if need_folder and self.client_folder_id is None:
+                await self._get_client_folder_id()
+
+    async def resolve_folder(self, account_id=None, client_folder_id=None):
+        """Coroutine version of `IContactClient.resolve_folder`."""
+        await self._resolve_folder(account_id, client_folder_id)
+        return self._required_values(account_id, client_folder_id)
+
+    async def account(self, index=0):
+        accountobj = await self._do_request('a')
+
+        return accountobj.accounts[index]
+
+    async def clientfolders(self, account_id, filters=None):
+        result = await self._do_request('a/%s/c/' % account_id, parameters=filters)
+        self.log_me("clientfolders: %s", result)
+        return result
+
+    async def clientfolder(self, account_id, index=0):
+        return (await self.clientfolders(account_id)).clientfolders[index]
+
+    async def find_contact_by_email(self, email, account_id=None, client_folder_id=None):
+        """Returns the contactId of the contact with the given email, or None."""
+        result = await self.search_contacts({'email': email}, account_id=account_id,
+                                            client_folder_id=client_folder_id)
+        contacts = getattr(result, 'contacts', None) or []
+        return contacts[0].contactId if contacts else None
+
+    async def contact_ids_for_emails(self, emails, account_id=None, client_folder_id=None, workers=None):
+        """
+        Resolves many emails at once. Returns a dict mapping each email
+        that has a contact to its contactId. Up to `workers` lookups
+        (default: the client's concurrency) run at a time.
+        """
+        emails = list(emails)
+        contact_ids = await self.gather_bounded(
+            lambda email: self.find_contact_by_email(email, account_id=account_id, client_folder_id=client_folder_id),
+            emails, limit=workers)
+        return dict((email, contact_id) for email, contact_id in zip(emails, contact_ids) if contact_id is not None)
+
+    async def _bulk_upsert(self, send, collection, records, options):
+        """
+        Coroutine version of `IContactClient._bulk_upsert`. The chunks are
+        posted from `workers` tasks; `send` returns a coroutine.
+        """
+        progress = options.pop('progress', None)
+        workers = options.pop('workers', self.BULK_WORKERS)
+        match_keys = options.pop('match_keys', None)
+        chunks = iter_chunks(records, options.pop('chunk_size', self.BULK_CHUNK_SIZE),
+                             options.pop('max_bytes', self.BULK_MAX_BYTES))
+        if options:
+            raise TypeError("unexpected bulk option '%s'" % sorted(options)[0])
+        report = BulkReport()
+        results = {}
+
+        async def post(chunk):
+            try:
+                response = await send([record for _, record in chunk])
+            except Exception as e:
+                outcomes = [BulkRecordResult(index, record, error=e) for index, record in chunk]
+                warnings = []
+            else:
+                outcomes, warnings = match_records(chunk, response, collection, match_keys)
+            for outcome in outcomes:
+                results[outcome.index] = outcome
+            report.add(outcomes, warnings)
+            if progress is not None:
+                progress(report)
+
+        await self.gather_bounded(post, chunks, limit=workers)
+        report.records = [results[i] for i in sorted(results)]
+        return report
+
+    async def _prefix(self, account_id, client_folder_id):
+        """Coroutine version of `_folder_prefix`."""
+        if account_id is None or client_folder_id is None:
+            await self._resolve_folder(account_id, client_folder_id)
+        return self._folder_prefix(account_id, client_folder_id)
+
+    async def move_subscriber(self, old_list, contact_id, new_list, account_id=None, client_folder_id=None):
+        prefix = await self._prefix(account_id, client_folder_id)
+        return await self._do_request('%ssubscriptions/%s_%s' % (prefix, old_list, contact_id),
+                                      parameters=dict(listId=new_list), method='put')
+
+    async def create_or_update_contact(self, account_id=None, client_folder_id=None, data=None):
+        """
+        Create or Update the contact
+        :param data: List of dicts holding multiple contacts data
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        if data and type(data) != list:
+            data = [data]
+        return await self._do_request('%scontacts/' % prefix, parameters=data, method='post', params_as_json=True,
+                                      idempotent=True)
+
+    async def create_contact(self, email, account_id=None, client_folder_id=None, **kwargs):
+        """
+        Creates the contact and returns the contact object.
+        email - required
+        kwargs - prefix, firstName, lastName, suffix, street, street2, city, state, postalCode
+               - phone, fax, business, status
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        contact = dict(kwargs, email=email)
+        contact.setdefault('status', 'normal')
+        return await self._do_request('%scontacts/' % prefix, parameters=dict(contact=contact), method='post')
+
+    async def update_contact(self, contact_id, account_id=None, client_folder_id=None, **kwargs):
+        """
+        Updates a contact and returns the contact object
+        contact_id - required
+        kwargs - prefix, firstName, lastName, suffix, street, street2, city, state, postalCode
+               - phone, fax, business, status
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        contact = dict(kwargs, contactId=contact_id)
+        return await self._do_request('%scontacts/' % prefix, parameters=dict(contact=contact), method='post')
+
+    async def delete_contact(self, contact_id, account_id=None, client_folder_id=None):
+        """
+        Deletes the contact and returns the result (an empty list)
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        return await self._do_request('%scontacts/%s' % (prefix, contact_id), method='delete')
+
+    async def create_subscription(self, contact_id, list_id, status='normal', account_id=None, client_folder_id=None):
+        """
+        Creates the subscription for the contact.
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        data = dict(subscription=dict(contactId=contact_id, listId=list_id, status=status))
+        return await self._do_request('%ssubscriptions/' % prefix, parameters=data, method='post')
+
+    async def create_or_update_subscription(self, account_id=None, client_folder_id=None, data=None):
+        """
+        Create or Update the subscription for the contact.
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        if data and type(data) != list:
+            data = [data]
+        return await self._do_request('%ssubscriptions/' % prefix, parameters=data, method='post',
+                                      params_as_json=True, idempotent=True)
+
+    async def create_or_update_custom_object(self, custom_object_id, account_id=None, client_folder_id=None,
+                                             data=None):
+        """
+        Create or Update the custom object data
+        :param data: List of dicts holding multiple custom objects data
+        """
+        prefix = await self._prefix(account_id, client_folder_id)
+        if data and type(data) != list:
+            data = [data]
+        return await self._do_request('%scustomobjects/%s/data/' % (prefix, custom_object_id), parameters=data,
+                                      method='post', params_as_json=True, idempotent=True)
+
+    async def bulk_create_or_update_contact(self, records, account_id=None, client_folder_id=None, **options):
+        """
+        Creates or updates any number of contacts, posting them in chunks
+        from concurrent tasks. Returns a `icontact.bulk.BulkReport`.
+
+        options - chunk_size, max_bytes, workers, progress, match_keys (see `icontact.bulk.BulkUpsert`)
+        """
+        await self._prefix(account_id, client_folder_id)
+        return await self._bulk_upsert(
+            lambda chunk: self.create_or_update_contact(account_id, client_folder_id, data=chunk),
+            'contacts', records, options)
+
+    async def bulk_create_or_update_subscription(self, records, account_id=None, client_folder_id=None, **options):
+        """
+        Creates or updates any number of subscriptions in concurrent
+        chunks. See `bulk_create_or_update_contact`.
+        """
+        await self._prefix(account_id, client_folder_id)
+        return await self._bulk_upsert(
+            lambda chunk: self.create_or_update_subscription(account_id, client_folder_id, data=chunk),
+            'subscriptions', records, options)
+
+    async def bulk_create_or_update_custom_object(self, custom_object_id, records, account_id=None,
+                                                  client_folder_id=None, **options):
+        """
+        Creates or updates any number of custom object records in
+        concurrent chunks. See `bulk_create_or_update_contact`.
+        """
+        await self._prefix(account_id, client_folder_id)
+        return await self._bulk_upsert(
+            lambda chunk: self.create_or_update_custom_object(custom_object_id, account_id, client_folder_id,
+                                                              data=chunk),
+            'data', records, options)
+
+    async def gather_bounded(self, func, iterable, limit=None, return_exceptions=False):
+        """
+        Calls the coroutine function `func` once for each item of
+        `iterable` with at most `limit` calls (default: the client's
+        concurrency) running at a time, and returns the results in input
+        order. Items are pulled from the iterable lazily, so generators of
+        any length can be mapped without creating every task up front.
+
+        With `return_exceptions` set, exceptions are returned in place of
+        results instead of cancelling the remaining calls.
+        """
+        items = enumerate(iterable)
+        results = {}
+
+        async def worker():
+            for index, item in items:
+                try:
+                    results[index] = await func(item)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(limit or self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for w in workers:
+                w.cancel()
+            raise
+        return [results[index] for index in range(len(results))]
+
+
+def _folder_ids(method):
+    """
+    Returns a function giving the `account_id` and `client_folder_id`
+    arguments of a call to `method`, or None if the call does not match
+    its signature.
+    """
+    signature = inspect.signature(method)
+
+    def folder_ids(self, args, kwargs):
+        try:
+            values = signature.bind_partial(self, *args, **kwargs).arguments
+        except TypeError:
+            return None
+        return values.get('account_id'), values.get('client_folder_id')
+    return folder_ids
+
+
+def _folder_method(name):
+    method = getattr(IContactClient, name)
+    folder_ids = _folder_ids(method)
+
+    async def wrapper(self, *args, **kwargs):
+        ids = folder_ids(self, args, kwargs)
+        if ids is not None:
+            await self._resolve_folder(*ids)
+        return await method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def _iter_method(name):
+    method = getattr(IContactClient, name)
+    folder_ids = _folder_ids(method)
+
+    async def wrapper(self, *args, **kwargs):
+        ids = folder_ids(self, args, kwargs)
+        if ids is not None:
+            await self._resolve_folder(*ids)
+        async for record in method(self, *args, **kwargs):
+            yield record
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name in FOLDER_METHODS:
+    setattr(AsyncIContactClient, _name, _folder_method(_name))
+for _name in ITER_METHODS:
+    setattr(AsyncIContactClient, _name, _iter_method(_name))
@@ -0,0 +1,146 @@
+"""
+Micro-batching of single-record writes.
+
+Application code usually creates and updates contacts one record at a
+time, often from many threads at once. A `WriteBatcher` collects those
+calls for a short window and posts them together through the list-POST
+form of the `contacts/` and `subscriptions/` endpoints, turning many
+round-trips into a few::
+
+    client = IContactClient(api_key, username, password, write_batcher=WriteBatcher(max_delay=0.1))
+    client.create_contact('jane@example.com')   # posted with the other calls of the same 100ms
+
+Every caller still receives the result of its own record, shaped like the
+response of a single-record call, or the error raised by its batch.
+"""
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from icontact.bulk import match_records
+from icontact.client import json_to_obj
+
+
+class _Batch(object):
+    __slots__ = ('send', 'collection', 'items', 'started')
+
+    def __init__(self, send, collection, started):
+        self.send = send
+        self.collection = collection
+        self.items = []
+        self.started = started
+
+
+class WriteBatcher(object):
+    """
+    Groups records submitted for the same endpoint and posts them as one
+    list once the oldest has waited `max_delay` seconds or `max_batch`
+    records are pending. Batches are posted from a pool of `workers`
+    threads; one batcher can be shared by several clients.
+    """
+
+    def __init__(self, max_delay=0.05, max_batch=500, workers=4):
+        """
+        - max_delay: seconds the first record of a batch waits for others
+        - max_batch: largest number of records posted in one call
+        - workers: number of batches posted concurrently
+        """
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.workers = workers
+        self._batches = {}
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._closed = False
+
+    def submit(self, key, send, collection, record):
+        """
+        Queues `record` for the endpoint identified by `key` and returns a
+        `Future` resolving to the record's result. `send(records)` posts a
+        list of records and returns the parsed response holding them in
+        `collection`.
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('cannot submit to a closed WriteBatcher')
+            self._start()
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(send, collection, time.time())
+            batch.items.append((record, future))
+            if len(batch.items) >= self.max_batch:
+                self._flush(key)
+            elif len(batch.items) == 1:
+                self._cond.notify()
+        return future
+
+    def _start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._thread = threading.Thread(target=self._run, name='icontact-write-batcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        with self._cond:
+            while not self._closed or self._batches:
+                now = time.time()
+                wake = None
+                for key, batch in list(self._batches.items()):
+                    due = batch.started + self.max_delay
+                    if due <= now or self._closed:
+                        self._flush(key)
+                    elif wake is None or due < wake:
+                        wake = due
+                if not self._batches and self._closed:
+                    break
+                self._cond.wait(None if wake is None else wake - now)
+
+    def _flush(self, key):
+        """Hands the pending batch for `key` to the executor. Called with the lock held."""
+        batch = self._batches.pop(key)
+        self._executor.submit(self._post, batch)
+
+    def _post(self, batch):
+        items = [(record, future) for record, future in batch.items if future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        try:
+            response = batch.send([record for record, _ in items])
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        chunk = [(index, record) for index, (record, _) in enumerate(items)]
+        outcomes, _ = match_records(chunk, response, batch.collection)
+        for outcome in outcomes:
+            result = json_to_obj({'warnings': outcome.warnings})
+            setattr(result, batch.collection, [outcome.result] if outcome.result is not None else [])
+            items[outcome.index][1].set_result(result)
+
+    def flush(self):
+        """Posts every pending batch now, without waiting for the results."""
+        with self._cond:
+            for key in list(self._batches):
+                self._flush(key)
+
+    def close(self):
+        """Posts the pending batches and waits for every batch to finish."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
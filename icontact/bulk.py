@@ -0,0 +1,258 @@
+"""
+Chunked, concurrent bulk writes for the iContact list-POST endpoints.
+
+iContact accepts a JSON list of records on the `contacts/`,
+`subscriptions/` and `customobjects/{id}/data/` endpoints, but large lists
+are rejected or time out. `BulkUpsert` splits any iterable of records into
+chunks bounded by record count and encoded size, posts the chunks from a
+pool of worker threads and reports the outcome of every record.
+"""
+import json
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Fields used to pair returned records with submitted ones when iContact
+# drops some records from a chunk (reporting them as warnings instead).
+# Custom objects have no standard key; callers may pass their own
+# `match_keys`, otherwise records are paired by the values they echo.
+MATCH_KEYS = {
+    'contacts': (('contactId',), ('email',)),
+    'subscriptions': (('subscriptionId',), ('contactId', 'listId')),
+}
+
+_SCALARS = (str, int, float)
+
+
+class BulkRecordResult(object):
+    """
+    Outcome of a single submitted record.
+
+    - index: position of the record in the submitted iterable
+    - record: the submitted data
+    - result: the record returned by iContact, or None
+    - warnings: warnings iContact returned about the record
+    - error: the exception raised when posting the record's chunk, or None
+    - skipped: True if the record was not sent because it was unchanged
+    """
+    __slots__ = ('index', 'record', 'result', 'warnings', 'error', 'skipped')
+
+    def __init__(self, index, record, result=None, warnings=None, error=None, skipped=False):
+        self.index = index
+        self.record = record
+        self.result = result
+        self.warnings = warnings or []
+        self.error = error
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.error is None and (self.result is not None or self.skipped)
+
+    def __repr__(self):
+        return 'BulkRecordResult(index=%r, ok=%r, skipped=%r, warnings=%r, error=%r)' % (
+            self.index, self.ok, self.skipped, self.warnings, self.error)
+
+
+class BulkReport(object):
+    """
+    Per-record results of a bulk write, in submission order. While the
+    write is running `records` is empty and only the `processed`, `errors`
+    and `chunks` counters are kept up to date.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.chunks = 0
+        self.processed = 0
+        self.errors = 0
+        self.warnings = []
+
+    @property
+    def succeeded(self):
+        return [r for r in self.records if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.records if not r.ok]
+
+    def add(self, outcomes, warnings):
+        """Counts the outcomes of a finished chunk."""
+        self.chunks += 1
+        self.processed += len(outcomes)
+        self.errors += len([o for o in outcomes if not o.ok])
+        self.warnings.extend(warnings)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __repr__(self):
+        return 'BulkReport(processed=%d, errors=%d, chunks=%d)' % (self.processed, self.errors, self.chunks)
+
+
+def iter_chunks(records, chunk_size, max_bytes=None):
+    """
+    Groups `records` into lists of `(index, record)` pairs holding at most
+    `chunk_size` records and, when `max_bytes` is set, at most that many
+    bytes once JSON encoded. A single record larger than `max_bytes` is
+    sent in a chunk of its own.
+    """
+    chunk, size = [], 2  # the enclosing brackets
+    for index, record in enumerate(records):
+        record_size = len(json.dumps(record)) + 1
+        if chunk and (len(chunk) >= chunk_size or
+                      (max_bytes is not None and size + record_size > max_bytes)):
+            yield chunk
+            chunk, size = [], 2
+        chunk.append((index, record))
+        size += record_size
+    if chunk:
+        yield chunk
+
+
+def _echoes(item, record):
+    """True if the returned `item` repeats every scalar value of the submitted `record`."""
+    for name, value in record.items():
+        if isinstance(value, _SCALARS) and not isinstance(value, bool):
+            returned = getattr(item, name, None)
+            if returned is None or str(returned).lower() != str(value).lower():
+                return False
+    return True
+
+
+def _mentioned(warning, record, keys):
+    """True if the text of `warning` names one of the record's identifying values."""
+    fields = set(f for key in keys for f in key) or record.keys()
+    return any(isinstance(record.get(f), _SCALARS) and len(str(record[f])) > 2 and str(record[f]) in warning
+               for f in fields)
+
+
+def match_records(chunk, response, collection, match_keys=None):
+    """
+    Pairs the `(index, record)` pairs of a posted chunk with the records
+    iContact returned in the response attribute `collection`. Returns a
+    list of `BulkRecordResult` and the warnings of the response.
+
+    When iContact rejects some records, the returned ones are paired up by
+    the identifying fields of `match_keys` (a sequence of field name
+    tuples, default: `MATCH_KEYS` of the collection), then in order by the
+    values they echo. Records left unpaired have no result and get the
+    warnings naming them, or every unattributed warning.
+    """
+    returned = list(getattr(response, collection, None) or [])
+    warnings = list(getattr(response, 'warnings', None) or [])
+    keys = MATCH_KEYS.get(collection, ()) if match_keys is None else match_keys
+
+    # Records dropped by the client's fingerprint index were never sent.
+    skipped = set(id(record) for record in getattr(response, 'skipped', None) or [])
+    outcomes = [BulkRecordResult(index, record, skipped=True) for index, record in chunk
+                if id(record) in skipped]
+    if skipped:
+        chunk = [(index, record) for index, record in chunk if id(record) not in skipped]
+
+    if len(returned) == len(chunk):
+        outcomes.extend(BulkRecordResult(index, record, result)
+                        for (index, record), result in zip(chunk, returned))
+        return outcomes, warnings
+
+    # Some records were rejected; pair up the rest by identifying fields.
+    matched = [None] * len(chunk)
+    for fields in keys:
+        by_key = {}
+        for item in returned:
+            key = tuple(str(getattr(item, f, '')) for f in fields)
+            by_key.setdefault(key, item)
+        for pos, (_, record) in enumerate(chunk):
+            if matched[pos] is None and isinstance(record, dict) and all(record.get(f) for f in fields):
+                matched[pos] = by_key.get(tuple(str(record[f]) for f in fields))
+
+    # Then in order: iContact returns the accepted records in submission order.
+    used = set(id(item) for item in matched if item is not None)
+    remaining = iter([item for item in returned if id(item) not in used])
+    item = next(remaining, None)
+    for pos, (_, record) in enumerate(chunk):
+        if item is None:
+            break
+        if matched[pos] is None and isinstance(record, dict) and _echoes(item, record):
+            matched[pos] = item
+            item = next(remaining, None)
+
+    unmatched = [record for (_, record), result in zip(chunk, matched) if result is None]
+    mentions = dict((id(record), []) for record in unmatched)
+    for warning in warnings:
+        named = [record for record in unmatched if isinstance(record, dict) and _mentioned(str(warning), record, keys)]
+        for record in named or unmatched:
+            mentions[id(record)].append(warning)
+    for (index, record), result in zip(chunk, matched):
+        outcomes.append(BulkRecordResult(index, record, result, mentions[id(record)] if result is None else None))
+    return outcomes, warnings
+
+
+class BulkUpsert(object):
+    """
+    Posts records in chunks through `send`, a callable taking a list of
+    records and returning the parsed API response (for example a bound
+    `IContactClient.create_or_update_contact`).
+
+    - collection: name of the response attribute listing the written
+      records, e.g. 'contacts'
+    - chunk_size: maximum number of records per request
+    - max_bytes: maximum JSON encoded size of a request body
+    - workers: number of chunks posted concurrently
+    - progress: (Optional) callable invoked with the `BulkReport` after
+      each chunk completes
+    - match_keys: (Optional) identifying fields of the records, see
+      `match_records`
+    """
+
+    def __init__(self, send, collection, chunk_size=500, max_bytes=1024 * 1024, workers=4,
+                 progress=None, match_keys=None):
+        self.send = send
+        self.collection = collection
+        self.match_keys = match_keys
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.progress = progress
+
+    def run(self, records):
+        """
+        Writes every record of the iterable and returns a `BulkReport`.
+        Records are read lazily; at most two chunks per worker are held
+        in memory at a time.
+        """
+        report = BulkReport()
+        lock = threading.Lock()
+        results = {}
+
+        def post(chunk):
+            try:
+                response = self.send([record for _, record in chunk])
+            except Exception as e:
+                outcomes = [BulkRecordResult(index, record, error=e) for index, record in chunk]
+                warnings = []
+            else:
+                outcomes, warnings = match_records(chunk, response, self.collection, self.match_keys)
+            with lock:
+                for outcome in outcomes:
+                    results[outcome.index] = outcome
+                report.add(outcomes, warnings)
+                if self.progress is not None:
+                    self.progress(report)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for chunk in iter_chunks(records, self.chunk_size, self.max_bytes):
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(post, chunk))
+            for future in pending:
+                future.result()
+
+        report.records = [results[i] for i in sorted(results)]
+        return report
@@ -0,0 +1,243 @@
+"""
+Cache backends shared by the iContact client features that memoize API
+results.
+
+Every backend implements the same small interface::
+
+    get(key)                -> value, or None when missing or expired
+    set(key, value, ttl)    -> stores a JSON serializable value for ttl seconds
+    delete(key)
+    clear()
+
+`MemoryCache` is a thread-safe LRU for one process, `FileCache` keeps one
+file per key in a directory shared by every process on the host, and
+`MemcacheCache` adapts any memcached-compatible client.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+
+class MemoryCache(object):
+    """
+    In-process LRU cache holding up to `maxsize` entries. Entries expire
+    after `ttl` seconds unless `set` is given its own ttl; a ttl of None
+    never expires.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.pop(key)
+            self._data[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache(object):
+    """
+    Stores each entry as a small JSON file in `directory`. Writes go to a
+    temporary file that is atomically renamed into place, so concurrent
+    processes never read a partial entry.
+    """
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                expires, value = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump([expires, value], f)
+            os.rename(tmp, self._path(key))
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class MemcacheCache(object):
+    """
+    Adapts a memcached-compatible client (anything with `get(key)`,
+    `set(key, value, expire)` and `delete(key)`, such as pymemcache's
+    `Client`) to the cache interface. Values are stored JSON encoded and
+    keys are hashed to satisfy memcached key restrictions.
+    """
+
+    def __init__(self, client, ttl=None, prefix='icontact:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self._key(key), json.dumps(value), int(ttl or 0))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        self.client.flush_all()
+
+
+class ResponseCache(object):
+    """
+    Read-through cache of JSON API responses, used by `IContactClient`
+    when passed as `response_cache`.
+
+    GET responses are cached per URL and query parameters for the TTL
+    configured for their resource, the path segment following the client
+    folder (`lists`, `segments`, `messages`, `sends`, ...). Resources
+    without a TTL are never cached. Any other call made through a client
+    using the cache invalidates every cached response of the resource it
+    writes to (and of the resources listed for it in `RELATED`).
+
+    Invalidation bumps a generation token stored in the backend, so it is
+    seen by every client and process sharing the backend. A missing token
+    is replaced by a fresh one, which makes evicting it safe.
+    """
+
+    TTLS = {
+        'lists': 300,
+        'segments': 300,
+        'messages': 300,
+        'sends': 60,
+    }
+
+    RELATED = {
+        'contacts': ('subscriptions',),
+        'subscriptions': ('contacts', 'lists'),
+        'lists': ('subscriptions',),
+    }
+
+    def __init__(self, backend=None, ttls=None):
+        """
+        - backend: any cache backend from this module (default: a 1000
+          entry `MemoryCache`)
+        - ttls: (Optional) mapping of resource name to TTL in seconds,
+          replacing `TTLS`
+        """
+        self.backend = backend if backend is not None else MemoryCache(maxsize=1000)
+        self.ttls = dict(self.TTLS if ttls is None else ttls)
+
+    @staticmethod
+    def resource(call_path):
+        """Splits a call path into its client folder prefix and resource name."""
+        parts = call_path.split('/')
+        if len(parts) > 4 and parts[0] == 'a' and parts[2] == 'c':
+            return '/'.join(parts[:4]), parts[4]
+        return None, None
+
+    def _generation(self, prefix, resource):
+        key = 'generation:%s:%s' % (prefix, resource)
+        generation = self.backend.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation)
+        return generation
+
+    def key(self, url, call_path, parameters):
+        """Returns the cache key for a GET call, or None if it is not cached."""
+        prefix, resource = self.resource(call_path)
+        if self.ttls.get(resource) is None:
+            return None
+        return 'response:%s:%s:%s?%s' % (resource, self._generation(prefix, resource), url,
+                                         json.dumps(parameters or {}, sort_keys=True))
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def store(self, key, data):
+        resource = key.split(':', 2)[1]
+        self.backend.set(key, data, self.ttls[resource])
+
+    def invalidate(self, call_path):
+        """Drops cached responses of the resource written to by `call_path`."""
+        prefix, resource = self.resource(call_path)
+        if resource is None:
+            return
+        for name in (resource,) + self.RELATED.get(resource, ()):
+            self.backend.delete('generation:%s:%s' % (prefix, name))
+
+
+# Account and client folder ids resolved by any client in this process.
+DISCOVERY_CACHE = MemoryCache(maxsize=1024, ttl=24 * 60 * 60)
@@ -0,0 +1,236 @@
+"""
+Record and replay of iContact API traffic.
+
+A client created with `transport=...` sends every request through that
+callable instead of its session. `RecordingTransport` performs requests
+with a real session and appends each request/response pair to a
+`Cassette`; `ReplayTransport` answers requests from a cassette, waiting
+the recorded response time divided by `speed`::
+
+    with Cassette('traffic.jsonl.gz') as cassette:
+        client = IContactClient(key, username, password, transport=RecordingTransport(cassette))
+        run_sync_job(client)
+
+    replay = ReplayTransport(Cassette('traffic.jsonl.gz'), speed=10)
+    run_sync_job(IContactClient('key', 'user', 'password', transport=replay))
+
+Cassettes are gzip compressed JSON lines, one interaction per line.
+Interactions are indexed by method, URL path and parameters (query, form
+or JSON body); the scheme and host are ignored and credentials are never
+stored. Replay is thread safe, so recorded traffic can be replayed from
+many threads at once. Interactions recorded several times for the same
+key are replayed in order, the last one repeating.
+"""
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+FORMAT_VERSION = 1
+
+# Response headers describing the transfer rather than the recorded content.
+_TRANSFER_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie')
+
+
+class CassetteError(LookupError):
+    """Raised when a replayed request was not recorded."""
+
+
+def interaction_key(method, url, params=None, data=None, json_body=None):
+    """Returns the index key of a request."""
+    def canonical(value):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        return json.dumps(value, sort_keys=True, default=str)
+    return '%s %s %s %s %s' % (method.upper(), urlsplit(url).path, canonical(params), canonical(data),
+                               canonical(json_body))
+
+
+class Cassette(object):
+    """
+    Interactions stored at `path`. Opening a cassette loads the existing
+    interactions; `record` appends new ones to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        try:
+            f = gzip.open(self.path, 'rt')
+        except (IOError, OSError):
+            return
+        with f:
+            try:
+                for line in f:
+                    entry = json.loads(line)
+                    if 'key' in entry:
+                        self._index.setdefault(entry['key'], []).append(entry)
+            except (IOError, OSError, EOFError):
+                # A truncated last member, e.g. after a crash while recording.
+                pass
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._index.values())
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def entries(self, key):
+        return self._index.get(key, [])
+
+    def record(self, key, response):
+        """Appends the interaction of a `requests.Response` to the cassette."""
+        content = response.content
+        try:
+            body, encoding = content.decode('utf-8'), 'text'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+        headers = dict((k, v) for k, v in response.headers.items() if k.lower() not in _TRANSFER_HEADERS)
+        entry = dict(key=key, status=response.status_code, headers=headers,
+                     body=body, encoding=encoding, elapsed=response.elapsed.total_seconds())
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, 'at')
+                if not self._index:
+                    self._file.write(json.dumps(dict(version=FORMAT_VERSION)) + '\n')
+            self._file.write(line)
+            self._index.setdefault(key, []).append(entry)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CassetteResponse(object):
+    """
+    Replayed response, offering the parts of `requests.Response` used by
+    the client: `status_code`, `headers`, `content`, `text`, `json()`,
+    `iter_content()`, `elapsed` and `close()`.
+    """
+
+    def __init__(self, entry, url, request_body=None):
+        self.url = url
+        self.status_code = entry['status']
+        self.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        if entry.get('encoding') == 'base64':
+            self.content = base64.b64decode(entry['body'])
+        else:
+            self.content = entry['body'].encode('utf-8')
+        self.elapsed = timedelta(seconds=entry.get('elapsed') or 0)
+        self.request = _RecordedRequest(request_body)
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        stream = io.BytesIO(self.content)
+        chunk = stream.read(chunk_size)
+        while chunk:
+            yield chunk.decode('utf-8') if decode_unicode else chunk
+            chunk = stream.read(chunk_size)
+
+    def close(self):
+        pass
+
+
+class _RecordedRequest(object):
+    __slots__ = ('body',)
+
+    def __init__(self, body):
+        self.body = body
+
+
+class RecordingTransport(object):
+    """
+    Sends requests through `session` (default: a new `requests.Session`)
+    and records every response in `cassette`.
+    """
+
+    def __init__(self, cassette, session=None):
+        self.cassette = cassette
+        self.session = session if session is not None else requests.Session()
+
+    def __call__(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        self.cassette.record(interaction_key(method, url, kwargs.get('params'), kwargs.get('data'),
+                                             kwargs.get('json')), response)
+        return response
+
+
+class ReplayTransport(object):
+    """
+    Answers requests from `cassette`.
+
+    - speed: replay speed multiplier; each response is returned after its
+      recorded response time divided by `speed`. None replays without delay.
+    - sleep: function used to wait (blocking callers only)
+    """
+
+    def __init__(self, cassette, speed=1.0, sleep=time.sleep):
+        self.cassette = cassette
+        self.speed = speed
+        self.sleep = sleep
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def respond(self, method, url, **kwargs):
+        """
+        Returns the replayed response and the seconds to wait before
+        returning it, for callers that cannot block (asyncio).
+        """
+        key = interaction_key(method, url, kwargs.get('params'), kwargs.get('data'), kwargs.get('json'))
+        entries = self.cassette.entries(key)
+        if not entries:
+            raise CassetteError('No recorded interaction for %s' % (key,))
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        entry = entries[min(position, len(entries) - 1)]
+        body = kwargs.get('data')
+        if kwargs.get('json') is not None:
+            body = json.dumps(kwargs['json']).encode('utf-8')
+        delay = (entry.get('elapsed') or 0) / self.speed if self.speed else 0.0
+        return CassetteResponse(entry, url, body), delay
+
+    def __call__(self, method, url, **kwargs):
+        response, delay = self.respond(method, url, **kwargs)
+        if delay > 0:
+            self.sleep(delay)
+        return response
+
+    def rewind(self):
+        """Starts replaying every key from its first recorded interaction again."""
+        with self._lock:
+            self._positions.clear()
@@ -0,0 +1,473 @@
+"""
+Command line bulk export and import::
+
+    icontact export contacts contacts.ndjson --processes 8
+    icontact export subscriptions subscriptions.csv --filter listId=5
+    icontact export customobjects orders.ndjson --custom-object-id 3
+    icontact import contacts contacts.csv --processes 4 --per-minute 600
+
+Credentials are read from `--api-key`, `--username` and `--password`, or
+from the ICONTACT_API_KEY, ICONTACT_USERNAME and ICONTACT_PASSWORD
+environment variables.
+
+An export splits the folder into offset ranges of `--shard-size` records.
+The worker processes page through the ranges and write each one to a
+part file. The parts are joined in order once every range is done. An
+import reads its input lazily and posts chunks of `--chunk-size` records
+from the worker processes. Records rejected by iContact are written to
+an errors file as NDJSON.
+
+Finished ranges and chunks are appended to a checkpoint file (by default
+the output or input path plus '.checkpoint'). Running the same command
+again skips them. The ranges of an export are planned when it starts and
+kept in the checkpoint, so a resumed export covers the same ranges even if
+records were added since. Offset ranges assume the exported records do
+not change order while the export runs.
+
+Files ending in '.csv' are read and written as CSV, anything else as
+newline delimited JSON. Empty CSV cells are not imported. Rejected records
+are reported with their line number in the input file; `--match-key` names
+the fields identifying a custom object record, which tell them apart from
+the records iContact accepted.
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from icontact.bulk import iter_chunks, match_records
+from icontact.client import IContactClient, IContactServerError
+from icontact.export import RESOURCES as EXPORT_FIELDS
+from icontact.ratelimit import FileStore, RateLimiter
+from icontact.retry import RetryPolicy
+
+RESOURCES = ('contacts', 'subscriptions', 'customobjects')
+
+# Client of the current worker process, created by `_init_worker`.
+_worker = {}
+
+
+def _collection(resource):
+    return 'data' if resource == 'customobjects' else resource
+
+
+def make_client(config):
+    """Returns an `IContactClient` for the connection settings of a job."""
+    limiter = None
+    if config['per_minute']:
+        try:
+            limiter = RateLimiter(per_minute=config['per_minute'], store=FileStore(config['rate_file']))
+        except ImportError:
+            limiter = RateLimiter(per_minute=float(config['per_minute']) / config['processes'])
+    return IContactClient(config['api_key'], config['username'], config['password'], url=config['url'],
+                          account_id=config['account_id'], client_folder_id=config['client_folder_id'],
+                          timeout=config['timeout'], rate_limiter=limiter,
+                          retry_policy=RetryPolicy(max_attempts=config['retries'] + 1, retry_upserts=True))
+
+
+def _init_worker(config):
+    _worker['config'] = config
+    _worker['client'] = make_client(config)
+
+
+def fetch_page(client, config, offset, limit):
+    """
+    Returns the parsed response and the records at `offset` of the
+    exported resource, both as plain dicts.
+    """
+    params = dict(config['filters'], offset=offset, limit=limit)
+    if config['resource'] == 'contacts':
+        result = client.search_contacts(params, raw=True)
+    elif config['resource'] == 'subscriptions':
+        result = client.subscriptions(filters=params, raw=True)
+    else:
+        result = client.get_custom_object_data(config['custom_object_id'], raw=True, **params)
+    return result, result.get(_collection(config['resource'])) or []
+
+
+def count_records(client, config):
+    result, records = fetch_page(client, config, 0, 1)
+    total = result.get('total')
+    if total is None:
+        raise SystemExit('iContact did not report the number of %s to export' % config['resource'])
+    return int(total)
+
+
+class RecordWriter(object):
+    """Writes records to a file as NDJSON, or as CSV rows of `fields`."""
+
+    def __init__(self, f, fmt, fields=None):
+        self.f = f
+        self.fields = fields
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(f, fields, extrasaction='ignore')
+        else:
+            self._csv = None
+
+    def header(self):
+        if self._csv is not None:
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            self._csv.writerow(record)
+        else:
+            self.f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def read_records(path, fmt):
+    """
+    Yields `(line, record)` pairs for the records of an NDJSON or CSV file,
+    one at a time. `line` is the 1-based line of the file the record ends on.
+    """
+    with open(path, newline='') if fmt == 'csv' else open(path) as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, dict((k, v) for k, v in row.items() if v != '')
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+
+
+def numbered_chunks(numbered, chunk_size, max_bytes=None):
+    """
+    `icontact.bulk.iter_chunks` for the `(line, record)` pairs of
+    `read_records`: the chunks pair each record with its line instead of
+    its position.
+    """
+    lines = collections.deque()
+
+    def records():
+        for line, record in numbered:
+            lines.append(line)
+            yield record
+
+    for chunk in iter_chunks(records(), chunk_size, max_bytes):
+        yield [(lines.popleft(), record) for _, record in chunk]
+
+
+def _export_shard(shard, offset, limit, path):
+    client, config = _worker['client'], _worker['config']
+    count = 0
+    with open(path + '.tmp', 'w', newline='') as f:
+        writer = RecordWriter(f, config['format'], config['fields'])
+        while count < limit:
+            wanted = min(config['page_size'], limit - count)
+            _, records = fetch_page(client, config, offset + count, wanted)
+            for record in records:
+                writer.write(record)
+            count += len(records)
+            if len(records) < wanted:
+                break
+    os.replace(path + '.tmp', path)
+    return shard, count
+
+
+def _import_chunk(number, chunk):
+    client, config = _worker['client'], _worker['config']
+    records = [record for _, record in chunk]
+    try:
+        if config['resource'] == 'contacts':
+            response = client.create_or_update_contact(data=records)
+        elif config['resource'] == 'subscriptions':
+            response = client.create_or_update_subscription(data=records)
+        else:
+            response = client.create_or_update_custom_object(config['custom_object_id'], data=records)
+    except Exception as e:
+        return number, len(chunk), 0, [], '%s: %s' % (e.__class__.__name__, e)
+    outcomes, _ = match_records(chunk, response, _collection(config['resource']), config['match_keys'])
+    # The chunk pairs records with their input line, so `o.index` is that line.
+    rejected = [(o.index, o.record, '; '.join(str(w) for w in o.warnings) or 'not returned by iContact')
+                for o in outcomes if not o.ok]
+    return number, len(chunk), len(chunk) - len(rejected), rejected, None
+
+
+class Checkpoint(object):
+    """
+    Append-only record of the finished units of a job. The first line
+    describes the job and its plan; a checkpoint of another job is refused.
+
+    - plan: (Optional) callable returning the JSON serializable plan of a
+      new job, e.g. its offset ranges. A resumed job gets the plan stored
+      in the checkpoint instead, as `self.plan`.
+    """
+
+    def __init__(self, path, job, plan=None):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                # A torn last line, written when the job was killed, lacks its newline.
+                lines = f.read().split('\n')[:-1]
+            header = json.loads(lines[0]) if lines else {}
+            if header.get('job') != job:
+                raise SystemExit('Checkpoint %s belongs to another job; remove it to start over' % path)
+            self.plan = header.get('plan')
+            self.done.update(int(line) for line in lines[1:])
+            self._file = open(path, 'a')
+        else:
+            self.plan = plan() if plan is not None else None
+            self._file = open(path, 'w')
+            self._file.write(json.dumps(dict(job=job, plan=self.plan), sort_keys=True) + '\n')
+            self._file.flush()
+
+    def add(self, unit):
+        self.done.add(unit)
+        self._file.write('%d\n' % unit)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+class Progress(object):
+    """Prints the throughput of a job to stderr, at most every `interval` seconds."""
+
+    def __init__(self, label, total=None, interval=1.0, stream=sys.stderr):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.records = 0
+        self.errors = 0
+        self.started = time.time()
+        self._printed = 0
+
+    def update(self, records, errors=0):
+        self.records += records
+        self.errors += errors
+        if time.time() - self._printed >= self.interval:
+            self.report()
+
+    def report(self):
+        self._printed = time.time()
+        elapsed = self._printed - self.started
+        done = '%d' % self.records
+        if self.total:
+            done = '%d/%d (%.0f%%)' % (self.records, self.total, 100.0 * self.records / self.total)
+        self.stream.write('%s: %s records, %.0f records/s, %d errors, %.1fs\n' % (
+            self.label, done, self.records / elapsed if elapsed else 0.0, self.errors, elapsed))
+        self.stream.flush()
+
+
+def export(args, config):
+    job = dict(command='export', resource=config['resource'], custom_object_id=config['custom_object_id'],
+               filters=config['filters'], output=os.path.abspath(args.output), format=config['format'],
+               shard_size=args.shard_size)
+
+    def plan():
+        total = count_records(make_client(config), config)
+        return [[shard, offset, min(args.shard_size, total - offset)]
+                for shard, offset in enumerate(range(0, total, args.shard_size))]
+
+    checkpoint = Checkpoint(args.checkpoint or args.output + '.checkpoint', job, plan)
+    parts = args.output + '.parts'
+    if not os.path.isdir(parts):
+        os.makedirs(parts)
+
+    def part(shard):
+        return os.path.join(parts, '%06d' % shard)
+
+    shards = [tuple(s) for s in checkpoint.plan]
+    total = sum(limit for _, _, limit in shards)
+    todo = [s for s in shards if s[0] not in checkpoint.done or not os.path.exists(part(s[0]))]
+    progress = Progress('export %s' % config['resource'], total)
+    progress.records = total - sum(limit for _, _, limit in todo)
+
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker,
+                             initargs=(config,)) as executor:
+        pending = set(executor.submit(_export_shard, shard, offset, limit, part(shard))
+                      for shard, offset, limit in todo)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard, count = future.result()
+                checkpoint.add(shard)
+                progress.update(count)
+
+    with open(args.output + '.tmp', 'w', newline='') as out:
+        RecordWriter(out, config['format'], config['fields']).header()
+        for shard, _, _ in shards:
+            with open(part(shard)) as f:
+                shutil.copyfileobj(f, out)
+    os.replace(args.output + '.tmp', args.output)
+    shutil.rmtree(parts)
+    checkpoint.remove()
+    progress.report()
+    return 0
+
+
+def import_(args, config):
+    job = dict(command='import', resource=config['resource'], custom_object_id=config['custom_object_id'],
+               input=os.path.abspath(args.input), format=config['format'], chunk_size=args.chunk_size,
+               max_bytes=args.max_bytes)
+    checkpoint = Checkpoint(args.checkpoint or args.input + '.checkpoint', job)
+    progress = Progress('import %s' % config['resource'])
+    errors_path = args.errors or args.input + '.errors'
+    state = dict(errors=None, failed_chunks=0)
+
+    def collect(futures):
+        for future in futures:
+            number, size, written, rejected, error = future.result()
+            if error is not None:
+                # Not checkpointed, so the chunk is sent again on resume.
+                sys.stderr.write('chunk %d (%d records) failed: %s\n' % (number, size, error))
+                state['failed_chunks'] += 1
+                progress.update(0, size)
+                continue
+            if rejected:
+                if state['errors'] is None:
+                    state['errors'] = open(errors_path, 'a')
+                for line, record, message in rejected:
+                    state['errors'].write(json.dumps(dict(line=line, record=record, error=message)) + '\n')
+                state['errors'].flush()
+            checkpoint.add(number)
+            progress.update(written, len(rejected))
+
+    chunks = numbered_chunks(read_records(args.input, config['format']), args.chunk_size, args.max_bytes)
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker,
+                             initargs=(config,)) as executor:
+        pending = set()
+        for number, chunk in enumerate(chunks):
+            if number in checkpoint.done:
+                continue
+            if len(pending) >= args.processes * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(_import_chunk, number, chunk))
+        collect(pending)
+
+    if state['errors'] is not None:
+        state['errors'].close()
+        sys.stderr.write('rejected records were written to %s\n' % errors_path)
+    progress.report()
+    if state['failed_chunks']:
+        sys.stderr.write('%d chunks failed; run the command again to retry them\n' % state['failed_chunks'])
+        return 1
+    checkpoint.remove()
+    return 1 if progress.errors else 0
+
+
+def _format(path, fmt):
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+
+def _filters(values):
+    filters = {}
+    for value in values or ():
+        name, sep, wanted = value.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError('filters are given as name=value, not %r' % value)
+        filters[name] = wanted
+    return filters
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='icontact', description='Bulk export and import of iContact data.')
+    parser.add_argument('--api-key', default=os.environ.get('ICONTACT_API_KEY'))
+    parser.add_argument('--username', default=os.environ.get('ICONTACT_USERNAME'))
+    parser.add_argument('--password', default=os.environ.get('ICONTACT_PASSWORD'),
+                        help='the API application password')
+    parser.add_argument('--url', default=IContactClient.ICONTACT_API_URL)
+    parser.add_argument('--sandbox', action='store_const', dest='url', const=IContactClient.ICONTACT_SANDBOX_API_URL,
+                        help='use the iContact sandbox')
+    parser.add_argument('--account-id')
+    parser.add_argument('--client-folder-id')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 4, help='worker processes')
+    parser.add_argument('--per-minute', type=int, help='API calls per minute, shared by every process')
+    parser.add_argument('--retries', type=int, default=5, help='retries of failing calls')
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds to wait for a response')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), help='default: from the file extension')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: the data file plus .checkpoint)')
+    parser.add_argument('--custom-object-id', help='custom object of the customobjects resource')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    exporter = commands.add_parser('export', help='export records to a file')
+    exporter.add_argument('resource', choices=RESOURCES)
+    exporter.add_argument('output')
+    exporter.add_argument('--filter', action='append', dest='filters', metavar='NAME=VALUE',
+                          help='search filter, may be repeated')
+    exporter.add_argument('--fields', help='comma separated CSV columns (default: the standard fields)')
+    exporter.add_argument('--shard-size', type=int, default=10000, help='records per offset range')
+    exporter.add_argument('--page-size', type=int, default=1000, help='records per API call')
+
+    importer = commands.add_parser('import', help='create or update records from a file')
+    importer.add_argument('resource', choices=RESOURCES)
+    importer.add_argument('input')
+    importer.add_argument('--chunk-size', type=int, default=IContactClient.BULK_CHUNK_SIZE,
+                          help='records per API call')
+    importer.add_argument('--max-bytes', type=int, default=IContactClient.BULK_MAX_BYTES,
+                          help='largest request body')
+    importer.add_argument('--match-key', help='comma separated fields identifying a custom object record, '
+                          'used to tell which records iContact rejected')
+    importer.add_argument('--errors', help='file receiving rejected records (default: the input plus .errors)')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    for name in ('api_key', 'username', 'password'):
+        if not getattr(args, name):
+            parser.error('--%s (or ICONTACT_%s) is required' % (name.replace('_', '-'), name.upper()))
+    if args.resource == 'customobjects' and not args.custom_object_id:
+        parser.error('--custom-object-id is required for customobjects')
+
+    path = args.output if args.command == 'export' else args.input
+    config = dict(api_key=args.api_key, username=args.username, password=args.password, url=args.url,
+                  account_id=args.account_id, client_folder_id=args.client_folder_id, timeout=args.timeout,
+                  retries=args.retries, per_minute=args.per_minute, processes=args.processes,
+                  resource=args.resource, custom_object_id=args.custom_object_id, format=_format(path, args.format),
+                  filters={}, fields=None, page_size=None, match_keys=None)
+    identity = hashlib.sha1(('%s\0%s\0%s' % (args.api_key, args.username, args.url)).encode('utf-8')).hexdigest()
+    config['rate_file'] = os.path.join(tempfile.gettempdir(), 'icontact-cli-%s.bucket' % identity[:16])
+
+    if args.command == 'export':
+        try:
+            config['filters'] = _filters(args.filters)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+        config['page_size'] = args.page_size
+        if args.fields:
+            config['fields'] = [f.strip() for f in args.fields.split(',') if f.strip()]
+        elif config['format'] == 'csv':
+            if args.resource not in EXPORT_FIELDS:
+                parser.error('--fields is required to export %s as CSV' % args.resource)
+            config['fields'] = list(EXPORT_FIELDS[args.resource])
+    elif args.match_key:
+        config['match_keys'] = [tuple(f.strip() for f in args.match_key.split(',') if f.strip())]
+
+    try:
+        # Looked up once here rather than in every process.
+        config['account_id'], config['client_folder_id'] = make_client(config).resolve_folder(
+            config['account_id'], config['client_folder_id'])
+        if args.command == 'export':
+            return export(args, config)
+        return import_(args, config)
+    except IContactServerError as e:
+        sys.stderr.write('icontact: %s\n' % e)
+        return 1
+    except requests.RequestException as e:
+        sys.stderr.write('icontact: cannot reach %s: %s\n' % (args.url, e))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,10 +11,21 @@
 #    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
+import hashlib
+import json
 import logging
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import requests
+from requests.adapters import HTTPAdapter
 
-from datetime import tzinfo, timedelta
+from datetime import datetime, tzinfo, timedelta
+from io import BytesIO
 
 # python 2.5+ has ElementTree included in it's core
 try:
@@ -26,27 +37,183 @@ except ImportError:
 
 from dateutil.parser import parse
 
+from icontact import endpoints
+from icontact.bulk import BulkUpsert, match_records
+from icontact.cache import DISCOVERY_CACHE
+from icontact.metrics import RequestEvent
+from icontact.ratelimit import THROTTLE_STATUSES, parse_retry_after
+from icontact.singleflight import SingleFlight
+from icontact.streaming import StreamedCollection
+
+
+class Object(object):
+    """
+    Attribute access view over a parsed json object.
+
+    Values are read from the wrapped dict on attribute access; nested
+    dicts and lists are converted the first time they are accessed and
+    the converted value is kept for later lookups. Attributes assigned on
+    the record are kept alongside the wrapped dict, which is never
+    modified, so records can safely share data with a response cache.
+    """
+    __slots__ = ('_data', '_attrs')
+
+    def __init__(self, data=None):
+        object.__setattr__(self, '_data', data if data is not None else {})
+        object.__setattr__(self, '_attrs', {})
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in Object.__slots__:
+            raise AttributeError(name)
+        attrs = self._attrs
+        if name in attrs:
+            value = attrs[name]
+            if value is _DELETED:
+                raise AttributeError(name)
+            return value
+        try:
+            value = self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+        if isinstance(value, (dict, list)):
+            value = attrs[name] = json_to_obj(value)
+        return value
+
+    def __setattr__(self, name, value):
+        self._attrs[name] = value
+
+    def __delattr__(self, name):
+        getattr(self, name)
+        self._attrs[name] = _DELETED
+
+    def _keys(self):
+        keys = [k for k in self._data if self._attrs.get(k) is not _DELETED]
+        keys.extend(k for k, v in self._attrs.items() if k not in self._data and v is not _DELETED)
+        return keys
+
+    @property
+    def __dict__(self):
+        return _RecordDict(self)
+
+    def __dir__(self):
+        return self._keys()
+
+    def __getstate__(self):
+        attrs = dict((k, v) for k, v in self._attrs.items() if v is not _DELETED)
+        return self._data, attrs, [k for k, v in self._attrs.items() if v is _DELETED]
+
+    def __setstate__(self, state):
+        data, attrs, deleted = state
+        attrs.update((k, _DELETED) for k in deleted)
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_attrs', attrs)
+
+    def __repr__(self):
+        return 'icontact.client.Object(%s)' % repr(self.__dict__)
+
+
+# Marks attributes deleted from an `Object` without touching its data.
+_DELETED = object()
+
+
+class _RecordDict(dict):
+    """
+    The `__dict__` of an `Object`: a dict of its current attributes that
+    writes changes through to the record, so code assigning to
+    `record.__dict__[name]` or `vars(record)` keeps working.
+    """
+    __slots__ = ('_record',)
+
+    def __init__(self, record):
+        dict.__init__(self, ((k, getattr(record, k)) for k in record._keys()))
+        self._record = record
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        setattr(self._record, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        delattr(self._record, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        delattr(self._record, key)
+        return key, value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
 
 def json_to_obj(json_data):
+    """
+    Wraps parsed json for attribute access: dicts become `Object`
+    records, lists are converted item by item and other values are
+    returned unchanged.
+    """
     if isinstance(json_data, list):
-        json_data = [json_to_obj(x) for x in json_data]
-    if not isinstance(json_data, dict):
-        return json_data
+        return [json_to_obj(x) for x in json_data]
+    if isinstance(json_data, dict):
+        return Object(json_data)
+    return json_data
 
-    class Object(object):
-        def __repr__(self):
-            return 'icontact.client.Object(%s)' % repr(self.__dict__)
 
-    o = Object()
-    for k in json_data:
-        o.__dict__[k] = json_to_obj(json_data[k])
-    return o
+def copy_json(json_data):
+    """Returns a copy of parsed json that shares no dict or list with it."""
+    if isinstance(json_data, list):
+        return [copy_json(x) for x in json_data]
+    if isinstance(json_data, dict):
+        return dict((k, copy_json(v)) for k, v in json_data.items())
+    return json_data
+
+
+# Summary elements of a 'stats' node, by tag name.
+STATS_SUMMARIES = {
+    'released': 'released',
+    'bounces': 'bounces',
+    'unsubscribes': 'unsubscribes',
+    'opens': 'opens',
+    'clicks': 'clicks',
+    'forwards': 'forwards',
+    'comments': 'comments',
+    'complaints': 'complaints',
+    'complaintss': 'complaints',
+}
 
 
 class IContactServerError(Exception):
-    def __init__(self, http_status, errors):
+    def __init__(self, http_status, errors, attempts=1):
         self.http_status = http_status
         self.errors = errors
+        self.attempts = attempts
+
+    @property
+    def retried(self):
+        """True if the call was retried before failing with this error."""
+        return self.attempts > 1
 
     def __str__(self):
         return '%s: %s' % (self.http_status, '\n'.join(self.errors))
@@ -58,10 +225,21 @@ class IContactClient(object):
     ICONTACT_API_URL = 'https://app.icontact.com/icp/'
     ICONTACT_SANDBOX_API_URL = 'https://app.sandbox.icontact.com/icp/'
     NAMESPACE = 'http://www.w3.org/1999/xlink'
+    DEFAULT_PAGE_SIZE = 500
+    STREAM_CHUNK_SIZE = 64 * 1024
+    BULK_CHUNK_SIZE = 500
+    BULK_MAX_BYTES = 1024 * 1024
+    BULK_WORKERS = 4
 
     def __init__(self, api_key, username, password, auth_handler=None,
                  account_id=None, client_folder_id=None,
-                 url=ICONTACT_API_URL, api_version='2.2', log_enabled=False):
+                 url=ICONTACT_API_URL, api_version='2.2', log_enabled=False,
+                 session=None, pool_connections=10, pool_maxsize=10,
+                 max_retries=0, keep_alive=True, adapter=None, timeout=None,
+                 rate_limiter=None, retry_policy=None, discovery_cache=DISCOVERY_CACHE,
+                 response_cache=None, fingerprints=None, write_batcher=None,
+                 single_flight=False, hooks=None, transport=None,
+                 contact_index=None, write_behind=None):
         """
         - api_key: the API Key assigned for the OA iContact client
         - username: the iContact web site login username
@@ -79,6 +257,75 @@ class IContactClient(object):
         getter and setter methods::
           get_credentials() => (token,sequence)
           set_credentials(token,sequence)
+
+        Connection pooling options. A single `requests.Session` is created
+        on first use and reused for every API call, so consecutive calls
+        share keep-alive connections instead of paying a new TCP and TLS
+        handshake each time:
+
+        - session: (Optional) An existing `requests.Session` to use. The
+          session is shared, not owned, so `close()` will not close it.
+        - pool_connections: number of per-host connection pools to cache.
+        - pool_maxsize: maximum number of connections kept open per host.
+          Set this to at least the number of threads sharing the client.
+        - max_retries: connection-level retries performed by the transport
+          adapter (failed DNS lookups, refused connections).
+        - keep_alive: set to False to close the connection after each call.
+        - adapter: (Optional) A transport adapter instance mounted for
+          both http:// and https:// URLs, e.g. an HTTP/2 capable adapter.
+          When given, the pool options above are ignored.
+        - timeout: (Optional) timeout in seconds passed to every request.
+        - rate_limiter: (Optional) An `icontact.ratelimit.RateLimiter`
+          that paces every API call made by this client. It is told about
+          throttling responses so it can slow down, and may be shared by
+          several clients.
+        - retry_policy: (Optional) An `icontact.retry.RetryPolicy` used to
+          replay calls failing with connection errors or transient
+          statuses. Errors raised after retrying carry the number of
+          attempts made in their `attempts` attribute.
+        - discovery_cache: cache of the default account and client folder
+          ids looked up when none are given, keyed by API key, username
+          and URL. Defaults to a cache shared by every client in the
+          process; pass an `icontact.cache.FileCache` to share it between
+          processes, or None to always look the ids up.
+        - response_cache: (Optional) An `icontact.cache.ResponseCache`
+          serving repeated GETs of slowly changing resources (lists,
+          segments, messages, sends) from a cache. Writes made through
+          this client invalidate the affected resources.
+        - fingerprints: (Optional) An `icontact.store.FingerprintIndex`
+          remembering the field values last written for each contact and
+          subscription. `update_contact`, `move_subscriber` and the
+          `create_or_update_contact`/`_subscription` methods then drop
+          writes that would not change anything; skipped records are
+          listed in the `skipped` attribute of the result.
+        - write_batcher: (Optional) An `icontact.batching.WriteBatcher`.
+          `create_contact`, `update_contact` and `create_subscription`
+          then queue their record and wait while it is posted together
+          with the records of concurrent calls.
+        - single_flight: if True, identical GET calls made concurrently by
+          several threads share one HTTP request and all receive its result.
+        - hooks: (Optional) callables receiving an
+          `icontact.metrics.RequestEvent` with the timings, sizes and
+          outcome of every API call once it has finished.
+        - transport: (Optional) callable sending requests in place of the
+          session, with the arguments of `requests.Session.request`, e.g.
+          the record and replay transports of `icontact.cassette`.
+        - contact_index: (Optional) An `icontact.index.ContactIndex`
+          answering `find_contact_by_email` and `contact_ids_for_emails`
+          locally. Contacts created, updated and deleted through this
+          client are kept current in it.
+        - write_behind: (Optional) An `icontact.writebehind.WriteBehindQueue`.
+          `create_contact`, `create_subscription` and
+          `create_or_update_custom_object` then journal their records and
+          return at once. The result lists the journal entry ids in its
+          `queued` attribute, and the queue posts the records in the
+          background.
+
+        The client can be used as a context manager to release pooled
+        connections when done::
+
+          with IContactClient(key, username, password) as client:
+              client.search_contacts(email='name@example.com')
         """
         self.api_key = api_key
         self.api_version = api_version
@@ -94,18 +341,115 @@ class IContactClient(object):
         self.log = logging.getLogger('icontact')
         self.log_enabled = log_enabled
 
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self.adapter = adapter
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.discovery_cache = discovery_cache
+        self.response_cache = response_cache
+        self.fingerprints = fingerprints
+        self.write_batcher = write_batcher
+        self._flights = SingleFlight() if single_flight else None
+        self.hooks = list(hooks or ())
+        self.transport = transport
+        self.contact_index = contact_index
+        self.write_behind = write_behind
+
+        self._session = session
+        self._owns_session = session is None
+        self._session_lock = threading.Lock()
+        self._header_cache = None
+        self._prefixes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        """
+        The pooled `requests.Session` used for all API calls, created on
+        first access. Creation is guarded by a lock so that threads sharing
+        the client also share a single connection pool.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = self.adapter
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                  pool_maxsize=self.pool_maxsize,
+                                  max_retries=self.max_retries)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """
+        Closes pooled connections. Sessions passed in to the constructor
+        are left open, since they may be shared with other clients.
+        """
+        if not self._owns_session:
+            return
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _discovery_key(self, *parts):
+        identity = '%s\0%s\0%s' % (self.api_key, self.username, self.url)
+        return 'discovery:%s:%s' % (hashlib.sha1(identity.encode('utf-8')).hexdigest(),
+                                    ':'.join(str(p) for p in parts))
+
+    def _cached_discovery(self, key):
+        if self.discovery_cache is None:
+            return None
+        return self.discovery_cache.get(key)
+
+    def _store_discovery(self, key, value):
+        if self.discovery_cache is not None:
+            self.discovery_cache.set(key, value)
+
     def _get_account_id(self):
-        self.account_id = self.account().accountId
+        key = self._discovery_key('account')
+        account_id = self._cached_discovery(key)
+        if account_id is None:
+            account_id = self.account().accountId
+            self._store_discovery(key, account_id)
+        self.account_id = account_id
         return self.account_id
 
     def _get_client_folder_id(self):
-        self.client_folder_id = self.clientfolder(self.account_id).clientFolderId
+        key = self._discovery_key('clientfolder', self.account_id)
+        client_folder_id = self._cached_discovery(key)
+        if client_folder_id is None:
+            client_folder_id = self.clientfolder(self.account_id).clientFolderId
+            self._store_discovery(key, client_folder_id)
+        self.client_folder_id = client_folder_id
         return self.client_folder_id
 
     def _perform_request(self, method, url, **kwargs):
-        return requests.request(method.upper(), url, **kwargs)
-
-    def _do_request(self, call_path, parameters=None, method='get', response_type='json', params_as_json=False):
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        if self.transport is not None:
+            return self.transport(method.upper(), url, **kwargs)
+        return self.session.request(method.upper(), url, **kwargs)
+
+    def _do_request(self, call_path, parameters=None, method='get', response_type='json', params_as_json=False,
+                    idempotent=False, stream=None, raw=False):
         """
         Performs an API request and returns the resultant json object.
         If type='xml' is passed in, returns XML document as an
@@ -116,24 +460,179 @@ class IContactClient(object):
         This method does all the hard work for API operations: building the
         URL path; adding auth headers; sending the request to iContact;
         evaluating the response; and parsing the response to an XML node.
+
+        Set `idempotent` for POSTs that may safely be replayed by the retry
+        policy (the `create_or_update_*` upserts).
+
+        Set `stream` to the name of the collection array of a json response
+        to receive an `icontact.streaming.StreamedCollection` that parses
+        records incrementally while the body is downloaded. Streamed
+        responses bypass the response cache.
+
+        Set `raw` to receive the parsed json as plain dicts and lists
+        instead of `Object` records. Raw results belong to the caller;
+        responses served from or stored in the response cache are copied.
         """
-        if parameters is None:
-            parameters = {}
+        url, req_params = self._build_request(call_path, parameters, method, response_type, params_as_json)
+
+        if stream is not None:
+            req_params['stream'] = True
+            self.log_me(u'Streaming API method %s with URL: %s', method, url)
+            event = self._start_event(method, call_path, url)
+            with self._reporting(event):
+                req, attempts = self._send(method, url, req_params, idempotent)
+                if event is not None:
+                    event.response(req, attempts)
+                if req.status_code >= 400:
+                    return self._handle_response(req, response_type, attempts, event=event)
+                if event is not None:
+                    event.streamed = True
+                return StreamedCollection(req.iter_content(self.STREAM_CHUNK_SIZE), stream,
+                                          wrap=None if raw else json_to_obj, close=req.close)
+
+        cache_key = self._response_cache_key(call_path, url, parameters, method, response_type)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.log_me(u'Serving API method %s with URL: %s from cache', method, url)
+                event = self._start_event(method, call_path, url)
+                with self._reporting(event):
+                    if event is not None:
+                        event.cached = True
+                    return copy_json(cached) if raw else json_to_obj(cached)
+
+        if self._flights is not None and method.lower() == 'get':
+            # Waiters share the plain parsed json, wrapped or copied separately for each.
+            result = self._flights.do(self._flight_key(url, parameters, response_type),
+                                      lambda: self._fetch(call_path, method, url, req_params, response_type,
+                                                          idempotent, cache_key, True))
+            if response_type != 'json':
+                return result
+            return copy_json(result) if raw else json_to_obj(result)
+        return self._fetch(call_path, method, url, req_params, response_type, idempotent, cache_key, raw)
+
+    def _fetch(self, call_path, method, url, req_params, response_type, idempotent, cache_key, raw):
+        """Sends a built request and parses the response."""
+        self.log_me(u'Invoking API method %s with URL: %s', method, url)
+        event = self._start_event(method, call_path, url)
+        if event is not None:
+            # Leaves the body unread, so that its download can be timed.
+            req_params = dict(req_params, stream=True)
+        with self._reporting(event):
+            try:
+                req, attempts = self._send(method, url, req_params, idempotent)
+            finally:
+                if self.response_cache is not None and method.lower() != 'get':
+                    self.response_cache.invalidate(call_path)
+            if event is not None:
+                event.response(req, attempts)
+            return self._handle_response(req, response_type, attempts, cache_key, raw, event)
+
+    def _start_event(self, method, call_path, url):
+        """Returns a `RequestEvent` for the call, or None if the client has no hooks."""
+        return RequestEvent(method, call_path, url) if self.hooks else None
+
+    @contextmanager
+    def _reporting(self, event):
+        """Passes `event` to the hooks once the enclosed call has finished."""
+        if event is None:
+            yield
+            return
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            event.finish(error)
+            for hook in self.hooks:
+                try:
+                    hook(event)
+                except Exception:
+                    self.log.exception('iContact request hook %r failed', hook)
+
+    @staticmethod
+    def _flight_key(url, parameters, response_type):
+        return url, response_type, json.dumps(parameters or {}, sort_keys=True, default=str)
+
+    def _response_cache_key(self, call_path, url, parameters, method, response_type):
+        if self.response_cache is None or method.lower() != 'get' or response_type != 'json':
+            return None
+        return self.response_cache.key(url, call_path, parameters)
+
+    def _send(self, method, url, req_params, idempotent=False):
+        """
+        Sends a built request, retrying transient failures as allowed by
+        the retry policy. Returns the response and the number of attempts.
+        """
+        policy = self.retry_policy
+        if policy is None or not policy.allows(method, idempotent):
+            return self._send_once(method, url, req_params), 1
+
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            status = retry_after = None
+            try:
+                req = self._send_once(method, url, req_params)
+            except Exception as e:
+                if not policy.retryable(exception=e):
+                    raise
+                delay = policy.delay(attempt, started)
+                if delay is None:
+                    e.attempts = attempt
+                    raise
+                policy.notify(attempt, delay, method, url, exception=e)
+            else:
+                if not policy.retryable(status=req.status_code):
+                    return req, attempt
+                status = req.status_code
+                retry_after = parse_retry_after(req.headers.get('Retry-After'))
+                delay = policy.delay(attempt, started, retry_after)
+                if delay is None:
+                    return req, attempt
+                policy.notify(attempt, delay, method, url, status=status)
+                # Releases the connection of a streamed response.
+                req.close()
+            self.log_me(u'Retrying %s %s in %.2fs (attempt %s failed, status=%s)',
+                        method, url, delay, attempt, status)
+            policy.sleep(delay)
+
+    def _send_once(self, method, url, req_params):
+        """
+        Sends a built request through the transport, pacing it with the
+        rate limiter when one is configured.
+        """
+        if self.rate_limiter is None:
+            return self._perform_request(method, url, **req_params)
 
-        url = '%s%s' % (self.url, call_path)
+        self.rate_limiter.acquire()
+        req = self._perform_request(method, url, **req_params)
+        self._rate_feedback(req)
+        return req
+
+    def _rate_feedback(self, req):
+        """Reports throttling responses, or success, to the rate limiter."""
+        retry_after = req.headers.get('Retry-After') if req.status_code >= 400 else None
+        if req.status_code in THROTTLE_STATUSES or retry_after:
+            self.log_me(u'Throttled by iContact (status=%s, Retry-After=%s)', req.status_code, retry_after)
+            self.rate_limiter.throttled(parse_retry_after(retry_after))
+        else:
+            self.rate_limiter.succeeded()
 
-        type_header = 'text/xml' if response_type == 'xml' else 'application/json'
-        headers = {
-            'Accept': type_header,
-            'Content-Type': type_header,
-            'Api-Version': self.api_version,
-            'Api-AppId': self.api_key,
-            'Api-Username': self.username,
-            'API-Password': self.password,
-        }
+    def _build_request(self, call_path, parameters, method, response_type, params_as_json):
+        """
+        Returns the full URL and the keyword arguments for the transport
+        request: auth headers plus query, form or JSON parameters.
+        """
+        if parameters is None:
+            parameters = {}
 
+        url = self.url + call_path
         req_params = {
-            'headers': headers,
+            'headers': self._headers(response_type),
         }
 
         if parameters:
@@ -145,22 +644,70 @@ class IContactClient(object):
                 else:
                     req_params['data'] = parameters
 
-        self.log_me(u'Invoking API method %s with URL: %s' % (method, url))
-        req = self._perform_request(method, url, **req_params)
-        self.log_me('response.status=%s headers=%s' % (req.status_code, req.headers,))
+        return url, req_params
+
+    def _headers(self, response_type):
+        """
+        Returns the auth headers for a response type. They are built once
+        per set of credentials and shared by every request, which never
+        modify them.
+        """
+        identity = (self.api_key, self.username, self.password, self.api_version)
+        cache = self._header_cache
+        if cache is None or cache[0] != identity:
+            headers = {}
+            for type_header in ('application/json', 'text/xml'):
+                headers[type_header] = {
+                    'Accept': type_header,
+                    'Content-Type': type_header,
+                    'Api-Version': self.api_version,
+                    'Api-AppId': self.api_key,
+                    'Api-Username': self.username,
+                    'API-Password': self.password,
+                }
+            cache = self._header_cache = (identity, headers)
+        return cache[1]['text/xml' if response_type == 'xml' else 'application/json']
+
+    def _handle_response(self, req, response_type, attempts=1, cache_key=None, raw=False, event=None):
+        """
+        Parses a transport response to an XML node or json object, raising
+        `IContactServerError` for error statuses. Successful json responses
+        are stored in the response cache under `cache_key` when given.
+        Phase timings are recorded on `event` when given.
+        """
+        self.log_me('response.status=%s headers=%s', req.status_code, req.headers)
         response_status = req.status_code
 
+        if event is not None:
+            event.response_bytes = len(req.content)
+            download = event.lap()
+            if event.download is None:
+                event.download = download
+
         if response_type == 'xml':
             result = ElementTree.fromstring(req.content)
-            self.log_me(u'Response body:\n%s' % (ElementTree.tostring(result),))
+            if self._debug_enabled():
+                self.log_me(u'Response body:\n%s', ElementTree.tostring(result))
+            if event is not None:
+                event.parse = event.lap()
         else:
             # type is json
             result = req.json()
-            self.log_me(u'json response=\n%s' % (result,))
-            result = json_to_obj(result)
+            self.log_me(u'json response=\n%s', result)
+            if event is not None:
+                event.parse = event.lap()
+            if cache_key is not None and response_status < 400:
+                self.response_cache.store(cache_key, result)
+                if raw:
+                    # Raw results may be modified; in-memory caches keep the stored one.
+                    result = copy_json(result)
+            if not raw or response_status >= 400:
+                result = json_to_obj(result)
+                if event is not None:
+                    event.convert = event.lap()
 
         if response_status >= 400:
-            raise IContactServerError(response_status, result.errors)
+            raise IContactServerError(response_status, result.errors, attempts)
 
         return result
 
@@ -170,17 +717,10 @@ class IContactClient(object):
         be present in an iContact API response to the
         message_delivery_details and message_stats methods. The parsed
         information is returned as a dictionary of dictionaries.
+
+        See `_iter_stats` to parse large responses incrementally.
         """
-        def summary_to_dict(stats_node):
-            if stats_node is None:
-                return None
-            summary = dict(
-                count=int(stats_node.get('count') or '0'),
-                percent=float(stats_node.get('percent')),
-                href=stats_node.get('{%s}href' % self.NAMESPACE))
-            if stats_node.get('unique'):
-                summary['unique'] = int(stats_node.get('unique'))
-            return summary
+        summary_to_dict = self._stats_summary
 
         results = dict(
             released=summary_to_dict(node.find('released')),
@@ -192,20 +732,234 @@ class IContactClient(object):
             comments=summary_to_dict(node.find('comments')),
             complaints=summary_to_dict(node.find('complaintss'))
         )
-        contacts = []
-        for c in node.findall('*/contact'):
-            contact = dict(
-                email=c.get('email'),
-                name=c.get('name'),
-                href=c.get('{%s}href' % self.NAMESPACE))
-            dates = []
-            for date_node in c.findall('*'):
-                dates.append(parse(date_node.get('date')))
-            contact['dates'] = dates
-            contacts.append(contact)
-        results['contacts'] = contacts
+        results['contacts'] = [self._stats_contact(c) for c in node.findall('*/contact')]
         return results
 
+    def _stats_summary(self, stats_node):
+        if stats_node is None:
+            return None
+        summary = dict(
+            count=int(stats_node.get('count') or '0'),
+            percent=float(stats_node.get('percent')),
+            href=stats_node.get('{%s}href' % self.NAMESPACE))
+        if stats_node.get('unique'):
+            summary['unique'] = int(stats_node.get('unique'))
+        return summary
+
+    def _stats_contact(self, contact_node):
+        return dict(
+            email=contact_node.get('email'),
+            name=contact_node.get('name'),
+            href=contact_node.get('{%s}href' % self.NAMESPACE),
+            dates=[parse_date(date_node.get('date')) for date_node in contact_node])
+
+    def _iter_stats(self, source, summary=None):
+        """
+        Incrementally parses a stats XML document, from a file-like object,
+        file name or bytes, yielding the contacts dictionaries described in
+        `_parse_stats` as they are read. Each contact element is discarded
+        once processed, so memory use does not grow with the number of
+        recipients.
+
+        When a `summary` dictionary is given it is filled with the summary
+        entries of the 'stats' node (released, bounces, opens, ...) as
+        their elements are reached.
+        """
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        stack = []
+        stats_depth = None
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                if stats_depth is None and elem.tag == 'stats':
+                    stats_depth = len(stack)
+                elif (summary is not None and elem.tag in STATS_SUMMARIES and
+                      len(stack) == (stats_depth or 1) + 1):
+                    summary[STATS_SUMMARIES[elem.tag]] = self._stats_summary(elem)
+                continue
+            stack.pop()
+            if elem.tag == 'contact':
+                yield self._stats_contact(elem)
+                elem.clear()
+                if stack:
+                    stack[-1].remove(elem)
+
+    def _paginate(self, call_path, collection, filters=None, page_size=None, prefetch=True, stream=False,
+                  raw=False):
+        """
+        Walks a collection endpoint page by page using the `limit` and
+        `offset` parameters, yielding one record at a time from the
+        response attribute named by `collection`.
+
+        Paging stops once the `total` reported by iContact has been read,
+        or when a short page is returned if no total is present. With
+        `prefetch` enabled the next page is requested on a background
+        thread while the current one is consumed, so at most two pages are
+        held in memory at any time.
+
+        With `stream` enabled each page is parsed incrementally and records
+        are yielded while it downloads, so only one record at a time is held
+        in memory. The page total is only known once a page is consumed, so
+        streamed pages are not prefetched.
+
+        With `raw` enabled records are yielded as plain dicts.
+        """
+        params = dict(filters or {})
+        limit = int(params.pop('limit', None) or page_size or self.DEFAULT_PAGE_SIZE)
+        offset = int(params.pop('offset', None) or 0)
+
+        if stream:
+            while True:
+                page_params = dict(params)
+                page_params.update(limit=limit, offset=offset)
+                page = self._do_request(call_path, parameters=page_params, stream=collection, raw=raw)
+                count = 0
+                for record in page:
+                    count += 1
+                    yield record
+                offset += count
+                total = page.metadata.get('total')
+                if total is not None:
+                    more = count > 0 and offset < int(total)
+                else:
+                    more = count >= limit
+                if not more:
+                    return
+
+        def fetch(offset):
+            page_params = dict(params)
+            page_params.update(limit=limit, offset=offset)
+            return self._do_request(call_path, parameters=page_params, raw=raw)
+
+        def field(page, name):
+            return page.get(name) if raw else getattr(page, name, None)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        pending = None
+        try:
+            page = fetch(offset)
+            while True:
+                records = field(page, collection) or []
+                total = field(page, 'total')
+                offset += len(records)
+                if total is not None:
+                    more = bool(records) and offset < int(total)
+                else:
+                    more = len(records) >= limit
+                page = None
+                if more and executor is not None:
+                    pending = executor.submit(fetch, offset)
+                for record in records:
+                    yield record
+                if not more:
+                    break
+                if pending is not None:
+                    page, pending = pending.result(), None
+                else:
+                    page = fetch(offset)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _fingerprint_scope(self, account_id, client_folder_id, resource):
+        return 'a/%s/c/%s/%s' % (account_id, client_folder_id, resource)
+
+    def _unchanged(self, scope, key, data):
+        return self.fingerprints is not None and key is not None and \
+            self.fingerprints.unchanged(scope, str(key), data)
+
+    def _remember(self, scope, key, data):
+        if self.fingerprints is not None and key is not None:
+            self.fingerprints.remember(scope, str(key), data)
+
+    def _post_record(self, account_id, client_folder_id, collection, params):
+        """
+        Posts the single record held in `params`, through the write
+        batcher when the client has one.
+        """
+        call_path = '%s%s/' % (self._folder_prefix(account_id, client_folder_id), collection)
+        if self.write_batcher is None:
+            return self._do_request(call_path, parameters=params, method='post')
+
+        def send(records):
+            return self._do_request(call_path, parameters=records, method='post', params_as_json=True)
+        record = list(params.values())[0]
+        return self.write_batcher.submit((id(self), call_path), send, collection, record).result()
+
+    def _queue_writes(self, account_id, client_folder_id, target, collection, records):
+        """
+        Journals `records` in the write-behind queue and returns the
+        acknowledgement, or None if the records are to be sent now.
+        """
+        if self.write_behind is None or self.write_behind.draining:
+            return None
+        self.write_behind.start(self)
+        result = json_to_obj({collection: [], 'warnings': []})
+        result.queued = self.write_behind.put(self, account_id, client_folder_id, target, records)
+        return result
+
+    def _skipped(self, collection, records):
+        """Result returned in place of a write dropped as unchanged."""
+        result = json_to_obj({collection: [], 'warnings': []})
+        result.skipped = records
+        return result
+
+    @staticmethod
+    def _contact_key(record):
+        if record.get('contactId'):
+            return record['contactId']
+        if record.get('email'):
+            return 'email:%s' % record['email'].lower()
+        return None
+
+    @staticmethod
+    def _subscription_key(record):
+        if record.get('subscriptionId'):
+            return record['subscriptionId']
+        if record.get('listId') and record.get('contactId'):
+            return '%s_%s' % (record['listId'], record['contactId'])
+        return None
+
+    def _filtered_upsert(self, scope, collection, key, data, send):
+        """
+        Sends the records of `data` that differ from their fingerprints
+        through `send` and remembers them once written.
+        """
+        if self.fingerprints is None or not data:
+            return send(data)
+
+        pending, skipped = [], []
+        for record in data:
+            (skipped if self._unchanged(scope, key(record), record) else pending).append(record)
+        if not pending:
+            return self._skipped(collection, skipped)
+
+        result = send(pending)
+        self._remember_written(scope, collection, key, pending, result)
+        result.skipped = skipped
+        return result
+
+    def _remember_written(self, scope, collection, key, records, result):
+        """
+        Remembers the records iContact returned in `result`. Records it
+        rejected are not remembered, so sending them again is not skipped.
+        """
+        if self.fingerprints is None:
+            return
+        outcomes, _ = match_records(list(enumerate(records)), result, collection)
+        for outcome in outcomes:
+            if outcome.result is None:
+                continue
+            record = outcome.record
+            self._remember(scope, key(record), record)
+            # Records sent by email are also remembered by their new contactId.
+            contact_id = getattr(outcome.result, 'contactId', None) if collection == 'contacts' else None
+            if contact_id and not record.get('contactId'):
+                self._remember(scope, contact_id, record)
+
     def account(self, index=0):
         """
         Returns the first account object in the accounts dictionary.
@@ -221,7 +975,7 @@ class IContactClient(object):
         Url: /icp/a/{accountId}/c
         """
         result = self._do_request('a/%s/c/' % account_id, parameters=filters)
-        self.log_me("clientfolders: %s" % (result,))
+        self.log_me("clientfolders: %s", result)
         return result
 
     def clientfolder(self, account_id, index=0):
@@ -230,6 +984,29 @@ class IContactClient(object):
         """
         return self.clientfolders(account_id).clientfolders[index]
 
+    def _folder_prefix(self, account_id=None, client_folder_id=None):
+        """
+        Returns the 'a/{accountId}/c/{clientFolderId}/' call path prefix,
+        resolving default ids. Prefixes are kept per pair of ids.
+        """
+        if account_id is None or client_folder_id is None:
+            account_id, client_folder_id = self._required_values(account_id, client_folder_id)
+        key = (account_id, client_folder_id)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            if len(self._prefixes) >= 1024:
+                self._prefixes.clear()
+            prefix = self._prefixes[key] = 'a/%s/c/%s/' % key
+        return prefix
+
+    def resolve_folder(self, account_id=None, client_folder_id=None):
+        """
+        Returns the `(account_id, client_folder_id)` a call with these
+        arguments goes to, looking up the client's default account and
+        client folder when they are left out.
+        """
+        return self._required_values(account_id, client_folder_id)
+
     def _required_values(self, account_id, client_folder_id):
         if account_id is None:
             if self.account_id is None:
@@ -241,124 +1018,100 @@ class IContactClient(object):
             client_folder_id = self.client_folder_id
         return account_id, client_folder_id
 
-    def search_contacts(self, params=None, account_id=None, client_folder_id=None, **kwarg_params):
-        """
-        If account_id or client_folder_id is None, then use the default (first) one.
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        if params is None:
-            params = {}
-        params.update(kwarg_params)
-
-        result = self._do_request('a/%s/c/%s/contacts/' % (account_id, client_folder_id), parameters=params)
-        return result
-
-    def lists(self, account_id=None, client_folder_id=None, filters=None):
-        """
-        Returns iContact Lists
-        params is a dictionary
-          * method = get|delete|post|put
-          * account_id
-          * client_folder_id
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/lists/' % (account_id, client_folder_id), parameters=filters)
-
-        return result
-
-    def list(self, list_id, account_id=None, client_folder_id=None):
+    def find_contact_by_email(self, email, account_id=None, client_folder_id=None):
         """
-        Returns an object representing the iContact List identified by the given id number.
-        In the json returned below, and object is created with attributes for each key.
-        Example:
-          {'list':{'listId':'123123', 'name':'name', 'description':'', 'emailOwnerOnChange':'',
-                   'welcomeOnManualAdd':'', 'welcomeOnSignupAdd':'', 'welcomeMessageId':'123123'}}
-          >>> client = IContactClient()
-          >>> mylist = client.list(123123)
-          >>> mylist.list.listId
-          u'123123'
+        Returns the contactId of the contact with the given email, or None.
+        Answered from the contact index when the client has one, falling
+        back to `search_contacts` for unknown or stale emails.
         """
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/lists/%s/' % (account_id, client_folder_id, list_id))
-
-        return result
-
-    def create_list(self, name, email_owner_on_change, welcome_on_manual_add,
-                    welcome_on_signup_add, welcome_message_id, description=None,
-                    account_id=None, client_folder_id=None):
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        params = dict(name=name,
-                      emailOwnerOnChange=email_owner_on_change,
-                      welcomeOnManualAdd=welcome_on_manual_add,
-                      welcomeOnSignupAdd=welcome_on_signup_add,
-                      welcomeMessageId=welcome_message_id)
-        if description:
-            params['description'] = description
-
-        result = self._do_request('a/%s/c/%s/lists/' % (account_id, client_folder_id),
-                                  parameters=params, method='post')
-
-        return result
-
-    def segments(self, account_id=None, client_folder_id=None, filters=None):
+        scope = self._fingerprint_scope(account_id, client_folder_id, 'contacts')
+        if self.contact_index is not None:
+            contact_id = self.contact_index.get(scope, email)
+            if contact_id is not None:
+                return contact_id
+
+        result = self.search_contacts({'email': email}, account_id=account_id, client_folder_id=client_folder_id)
+        contacts = getattr(result, 'contacts', None) or []
+        if not contacts:
+            return None
+        self._index_contacts(account_id, client_folder_id, result)
+        return contacts[0].contactId
+
+    def contact_ids_for_emails(self, emails, account_id=None, client_folder_id=None, workers=None):
         """
-        Returns iContact Segments
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/segments/' % (account_id, client_folder_id), parameters=filters)
-
-        return result
-
-    def create_segment(self, name, list_id, description=None, account_id=None,
-                       client_folder_id=None):
-        """Creates segment"""
-
-        """ TODO: this is just a temporarily note that segment creation is not
-        working with icontact.com remote API, this is confirmed issue and we're
-        waiting for icontact.com support team to fix this. They promissed us
-        to fix it as soon as possible ;)
+        Resolves many emails at once. Returns a dict mapping each email
+        that has a contact to its contactId. Emails missing from the
+        contact index are looked up with `search_contacts` from up to
+        `workers` threads (default: `BULK_WORKERS`).
         """
-
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        params = dict(name=name, listId=list_id)
-        if description:
-            params['description'] = description
-
-        result = self._do_request('a/%s/c/%s/segments/' % (account_id, client_folder_id),
-                                  parameters=params, method='post')
-
-        return result
-
-    def create_criterion(self, segment_id, field_name, operator, values,
-                         account_id=None, client_folder_id=None):
-        """Creates single criterion for a given segment"""
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
+        emails = list(emails)
+        found = {}
+        if self.contact_index is not None:
+            scope = self._fingerprint_scope(account_id, client_folder_id, 'contacts')
+            found = self.contact_index.get_many(scope, emails)
+
+        results = {}
+        missing = []
+        for email in emails:
+            contact_id = found.get(email.strip().lower())
+            if contact_id is not None:
+                results[email] = contact_id
+            else:
+                missing.append(email)
 
-        params = dict(fieldName=field_name, operator=operator, values=values)
+        def lookup(email):
+            return email, self.find_contact_by_email(email, account_id=account_id, client_folder_id=client_folder_id)
 
-        result = self._do_request('a/%s/c/%s/segments/%s/criteria/' % (
-            account_id, client_folder_id, segment_id),
-            parameters=params, method='post')
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(len(missing), workers or self.BULK_WORKERS)) as executor:
+                for email, contact_id in executor.map(lookup, missing):
+                    if contact_id is not None:
+                        results[email] = contact_id
+        return results
 
-        return result
+    def _index_contacts(self, account_id, client_folder_id, result):
+        """Adds the contacts returned by a call to the contact index."""
+        if self.contact_index is None:
+            return
+        contacts = [(getattr(c, 'email', None), getattr(c, 'contactId', None))
+                    for c in getattr(result, 'contacts', None) or []]
+        if contacts:
+            self.contact_index.put(self._fingerprint_scope(account_id, client_folder_id, 'contacts'), contacts)
 
     def move_subscriber(self, old_list, contact_id, new_list, account_id=None, client_folder_id=None):
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
 
         params = dict(listId=new_list)
 
-        result = self._do_request('a/%s/c/%s/subscriptions/%s_%s' % (account_id, client_folder_id,
-                                                                     old_list, contact_id),
-                                  parameters=params,
-                                  method='put')
+        # The move replaces the old subscription with one on the new list. It
+        # is skipped if this client moved it there and has not re-created the
+        # old one since.
+        scope = self._fingerprint_scope(account_id, client_folder_id, 'subscriptions')
+        old_key, new_key = '%s_%s' % (old_list, contact_id), '%s_%s' % (new_list, contact_id)
+        moved = dict(contactId=contact_id, listId=new_list)
+        if self._unchanged(scope, new_key, moved) and not self.fingerprints.known(scope, old_key):
+            return self._skipped('subscriptions', [params])
+
+        try:
+            result = self._do_request('%ssubscriptions/%s_%s' % (self._folder_prefix(account_id, client_folder_id),
+                                                                 old_list, contact_id),
+                                      parameters=params,
+                                      method='put')
+        except IContactServerError as e:
+            if e.http_status == 400 and 'No Changes Made' in (e.errors or []):
+                self._moved(scope, old_key, new_key, moved)
+            raise
+        self._moved(scope, old_key, new_key, moved)
 
         return result
 
+    def _moved(self, scope, old_key, new_key, record):
+        if self.fingerprints is not None:
+            self.fingerprints.forget(scope, old_key)
+            self.fingerprints.remember(scope, new_key, record)
+
     def create_or_update_contact(self, account_id=None, client_folder_id=None, data=None):
         """
         Create or Update the contact
@@ -369,13 +1122,38 @@ class IContactClient(object):
         if data and type(data) != list:
             data = [data]
 
-        result = self._do_request('a/%s/c/%s/contacts/' %
-                                  (account_id, client_folder_id),
-                                  parameters=data,
-                                  method='post',
-                                  params_as_json=True)
+        def send(data):
+            return self._do_request(self._folder_prefix(account_id, client_folder_id) + 'contacts/',
+                                    parameters=data,
+                                    method='post',
+                                    params_as_json=True,
+                                    idempotent=True)
+        result = self._filtered_upsert(self._fingerprint_scope(account_id, client_folder_id, 'contacts'),
+                                       'contacts', self._contact_key, data, send)
+        self._index_contacts(account_id, client_folder_id, result)
         return result
 
+    def bulk_create_or_update_contact(self, records, account_id=None, client_folder_id=None, **options):
+        """
+        Creates or updates any number of contacts, posting them in chunks
+        from concurrent workers. `records` may be any iterable of contact
+        dicts, including a generator. Returns a `icontact.bulk.BulkReport`
+        with the outcome of every record.
+
+        options - chunk_size, max_bytes, workers, progress, match_keys (see `icontact.bulk.BulkUpsert`)
+        """
+        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
+
+        def send(chunk):
+            return self.create_or_update_contact(account_id, client_folder_id, data=chunk)
+        return self._bulk_upsert(send, 'contacts', records, options)
+
+    def _bulk_upsert(self, send, collection, records, options):
+        options.setdefault('chunk_size', self.BULK_CHUNK_SIZE)
+        options.setdefault('max_bytes', self.BULK_MAX_BYTES)
+        options.setdefault('workers', self.BULK_WORKERS)
+        return BulkUpsert(send, collection, **options).run(records)
+
     def create_contact(self, email, account_id=None, client_folder_id=None, **kwargs):
         """
         Creates the contact and returns the contact object.
@@ -389,9 +1167,11 @@ class IContactClient(object):
         if 'status' not in params['contact']:
             params['contact']['status'] = 'normal'
 
-        result = self._do_request('a/%s/c/%s/contacts/' % (account_id, client_folder_id),
-                                  parameters=params,
-                                  method='post')
+        queued = self._queue_writes(account_id, client_folder_id, 'contacts', 'contacts', [params['contact']])
+        if queued is not None:
+            return queued
+        result = self._post_record(account_id, client_folder_id, 'contacts', params)
+        self._index_contacts(account_id, client_folder_id, result)
 
         return result
 
@@ -405,27 +1185,29 @@ class IContactClient(object):
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
         params = dict(contact=kwargs)
         params['contact']['contactId'] = contact_id
-        return self._do_request('a/%s/c/%s/contacts/' % (account_id, client_folder_id),
-                                parameters=params,
-                                method='post')
 
-    def delete_contact(self, contact_id, account_id=None, client_folder_id=None):
-        """
-        Deletes the contact and returns the result (an empty list)
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        result = self._do_request('a/%s/c/%s/contacts/%s' % (account_id, client_folder_id,
-                                  contact_id), method='delete')
+        scope = self._fingerprint_scope(account_id, client_folder_id, 'contacts')
+        if self._unchanged(scope, contact_id, params['contact']):
+            return self._skipped('contacts', [params['contact']])
 
+        result = self._post_record(account_id, client_folder_id, 'contacts', params)
+        self._remember_written(scope, 'contacts', lambda record: contact_id, [params['contact']], result)
+        self._index_contacts(account_id, client_folder_id, result)
         return result
 
-    def contact_history(self, contact_id, account_id=None, client_folder_id=None, filters=None):
+    def delete_contact(self, contact_id, account_id=None, client_folder_id=None):
         """
-        Returns action history for a contact
+        Deletes the contact and returns the result (an empty list)
         """
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        result = self._do_request('a/%s/c/%s/contacts/%s/actions/' % (account_id, client_folder_id,
-                                  contact_id), parameters=filters)
+        result = self._do_request('%scontacts/%s' % (self._folder_prefix(account_id, client_folder_id), contact_id),
+                                  method='delete')
+        if self.fingerprints is not None:
+            self.fingerprints.forget(self._fingerprint_scope(account_id, client_folder_id, 'contacts'),
+                                     str(contact_id))
+        if self.contact_index is not None:
+            self.contact_index.delete(self._fingerprint_scope(account_id, client_folder_id, 'contacts'), contact_id)
+
         return result
 
     def create_subscription(self, contact_id, list_id, status='normal', account_id=None, client_folder_id=None):
@@ -434,19 +1216,11 @@ class IContactClient(object):
         """
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
         data = dict(subscription=dict(contactId=contact_id, listId=list_id, status=status))
-        result = self._do_request('a/%s/c/%s/subscriptions/' % (account_id, client_folder_id),
-                                  parameters=data,
-                                  method='post')
-        return result
-
-    def subscriptions(self, account_id=None, client_folder_id=None, filters=None):
-        """
-        Returns iContact Subscriptions
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/subscriptions/' % (account_id, client_folder_id), parameters=filters)
-
+        queued = self._queue_writes(account_id, client_folder_id, 'subscriptions', 'subscriptions',
+                                    [data['subscription']])
+        if queued is not None:
+            return queued
+        result = self._post_record(account_id, client_folder_id, 'subscriptions', data)
         return result
 
     def create_or_update_subscription(self, account_id=None, client_folder_id=None, data=None):
@@ -458,82 +1232,25 @@ class IContactClient(object):
         if data and type(data) != list:
             data = [data]
 
-        result = self._do_request('a/%s/c/%s/subscriptions/' %
-                                  (account_id, client_folder_id),
-                                  parameters=data,
-                                  method='post',
-                                  params_as_json=True)
-        return result
-
-    def create_message(self, subject, message_type, account_id=None, client_folder_id=None, **kwargs):
-        """
-        Creates a message.  Note, the campaignId is required.
-        """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        message = dict(subject=subject, messageType=message_type)
-        message.update(kwargs)
-        data = dict(message=message)
-
-        result = self._do_request('a/%s/c/%s/messages/' % (account_id, client_folder_id),
-                                  parameters=data,
-                                  method='post')
-        return result
-
-    def messages(self, account_id=None, client_folder_id=None, filters=None):
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        result = self._do_request('a/%s/c/%s/messages/' % (account_id, client_folder_id), parameters=filters)
-        return result
-
-    def get_message(self, message_id, account_id=None, client_folder_id=None):
-        """
-        Gets message.
-        """
-        account_id, client_folder_id = self._required_values(account_id,
-                                                             client_folder_id)
+        def send(data):
+            return self._do_request(self._folder_prefix(account_id, client_folder_id) + 'subscriptions/',
+                                    parameters=data,
+                                    method='post',
+                                    params_as_json=True,
+                                    idempotent=True)
+        return self._filtered_upsert(self._fingerprint_scope(account_id, client_folder_id, 'subscriptions'),
+                                     'subscriptions', self._subscription_key, data, send)
 
-        result = self._do_request('a/%s/c/%s/messages/%s' %
-                                  (account_id, client_folder_id, message_id),
-                                  method='get')
-        return result
-
-    def create_send(self, message_id, include_list_ids, account_id=None,
-                    client_folder_id=None, **kwargs):
+    def bulk_create_or_update_subscription(self, records, account_id=None, client_folder_id=None, **options):
         """
-        Creates a send.
+        Creates or updates any number of subscriptions in concurrent
+        chunks. See `bulk_create_or_update_contact`.
         """
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        alert = dict(messageId=message_id, includeListIds=','.join(include_list_ids))
-        alert.update(kwargs)
-        data = dict(send=alert)
-
-        result = self._do_request('a/%s/c/%s/sends/' % (account_id, client_folder_id),
-                                  parameters=data,
-                                  method='post')
-        return result
 
-    def delete_send(self, send_id, account_id=None, client_folder_id=None):
-        """
-        Deletes send.
-        """
-        account_id, client_folder_id = self._required_values(account_id,
-                                                             client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/sends/%s' %
-                                  (account_id, client_folder_id, send_id),
-                                  method='delete')
-        return result
-
-    def get_send(self, send_id, account_id=None, client_folder_id=None):
-        """
-        Gets send.
-        """
-        account_id, client_folder_id = self._required_values(account_id,
-                                                             client_folder_id)
-
-        result = self._do_request('a/%s/c/%s/sends/%s' %
-                                  (account_id, client_folder_id, send_id),
-                                  method='get')
-        return result
+        def send(chunk):
+            return self.create_or_update_subscription(account_id, client_folder_id, data=chunk)
+        return self._bulk_upsert(send, 'subscriptions', records, options)
 
     def create_or_update_custom_object(self, custom_object_id, account_id=None, client_folder_id=None, data=None):
         """
@@ -545,37 +1262,48 @@ class IContactClient(object):
         if data and type(data) != list:
             data = [data]
 
-        result = self._do_request('a/%s/c/%s/customobjects/%s/data/' %
-                                  (account_id, client_folder_id, custom_object_id),
+        if data:
+            queued = self._queue_writes(account_id, client_folder_id, 'customobjects/%s/data' % custom_object_id,
+                                        'data', data)
+            if queued is not None:
+                return queued
+        result = self._do_request('%scustomobjects/%s/data/' % (self._folder_prefix(account_id, client_folder_id),
+                                                                custom_object_id),
                                   parameters=data,
                                   method='post',
-                                  params_as_json=True)
+                                  params_as_json=True,
+                                  idempotent=True)
         return result
 
-    def delete_custom_object_data(self, custom_object_id, custom_object_field_definition_id,
-                                  account_id=None, client_folder_id=None):
+    def bulk_create_or_update_custom_object(self, custom_object_id, records, account_id=None,
+                                            client_folder_id=None, **options):
         """
-        Deletes the custom object data record for custom object specified via `custom_object_id`
+        Creates or updates any number of custom object records in
+        concurrent chunks. See `bulk_create_or_update_contact`. Custom
+        objects have no standard key: pass `match_keys`, e.g.
+        `[('orderId',)]`, to pair the records iContact returns with the
+        submitted ones by their own fields.
         """
         account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        result = self._do_request('a/%s/c/%s/customobjects/%s/data/%s/' % (
-            account_id, client_folder_id, custom_object_id, custom_object_field_definition_id), method='delete')
 
-        return result
+        def send(chunk):
+            return self.create_or_update_custom_object(custom_object_id, account_id, client_folder_id, data=chunk)
+        return self._bulk_upsert(send, 'data', records, options)
+
+    def _debug_enabled(self):
+        return self.log_enabled and self.log.isEnabledFor(logging.DEBUG)
 
-    def get_custom_object_data(self, custom_object_id, account_id=None, client_folder_id=None, **kwargs):
+    def log_me(self, msg, *args):
         """
-        Get all records of a custom object defined by `custom_object_id`
+        Logs a debug message when logging is enabled. `msg` is only
+        formatted with `args` if the message is emitted.
         """
-        account_id, client_folder_id = self._required_values(account_id, client_folder_id)
-        result = self._do_request('a/%s/c/%s/customobjects/%s/data/' % (
-            account_id, client_folder_id, custom_object_id), parameters=kwargs)
+        if self.log_enabled:
+            self.log.debug(msg, *args)
 
-        return result
 
-    def log_me(self, msg):
-        if self.log_enabled:
-            self.log.debug(msg)
+# The methods of the plain endpoints (`lists`, `iter_lists`, `get_message`, `create_list`, ...).
+endpoints.install(IContactClient)
 
 
 class FixedOffset(tzinfo):
@@ -609,3 +1337,42 @@ class FixedOffset(tzinfo):
 
     def dst(self, dt):
         return timedelta(0)
+
+
+_FIXED_OFFSETS = {}
+
+
+def fixed_offset(minutes):
+    """
+    Returns a shared `FixedOffset` instance for the given offset in
+    minutes, so parsing many timestamps does not create a tzinfo for each.
+    """
+    tz = _FIXED_OFFSETS.get(minutes)
+    if tz is None:
+        tz = _FIXED_OFFSETS.setdefault(minutes, FixedOffset(minutes))
+    return tz
+
+
+_ISO_DATETIME = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+    r'(?:(Z)|([+-])(\d{2}):?(\d{2}))?$')
+
+
+def parse_date(value):
+    """
+    Parses an iContact timestamp. ISO 8601 timestamps such as
+    '2010-05-20T13:28:41-04:00' are handled by a fast path; anything else
+    falls back to `dateutil.parser.parse`.
+    """
+    match = _ISO_DATETIME.match(value)
+    if match is None:
+        return parse(value)
+    year, month, day, hour, minute, second, fraction, utc, sign, tz_hours, tz_minutes = match.groups()
+    tz = None
+    if utc:
+        tz = fixed_offset(0)
+    elif sign:
+        offset = int(tz_hours) * 60 + int(tz_minutes)
+        tz = fixed_offset(-offset if sign == '-' else offset)
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int(fraction.ljust(6, '0')) if fraction else 0, tz)
@@ -0,0 +1,263 @@
+"""
+Declarative table of the endpoints of a client folder.
+
+Each `Endpoint` names an `IContactClient` method, its HTTP method, its path
+below the client folder prefix (`a/{accountId}/c/{clientFolderId}/`), the
+way its query parameters or posted fields are passed and the response
+attribute listing its records. `install()` generates the client methods
+from `ENDPOINTS`. Endpoints with a collection also get an `iter_` method
+that pages through it with `_paginate`. Both take `raw=True` to return
+plain dicts and lists instead of `Object`s.
+
+Generated methods resolve the folder prefix once per account and client
+folder and format their path from a precompiled template. Endpoints with
+`fields` post a record built from their arguments. Writes with client side
+behaviour (fingerprints, batching, the contact index, write-behind) remain
+hand-written methods of the client.
+"""
+import re
+
+from inspect import Parameter, Signature
+
+# Ways query parameters are passed to a generated method.
+FILTERS = 'filters'   # a `filters` dict after the folder ids
+PARAMS = 'params'     # a leading `params` dict, updated with keyword arguments
+KWARGS = 'kwargs'     # keyword arguments
+
+FOLDER_ARGUMENTS = ('account_id', 'client_folder_id')
+
+CALL_ARGUMENTS = ('raw',)
+CALL_DEFAULTS = dict(raw=False)
+
+ITER_ARGUMENTS = ('page_size', 'prefetch', 'stream', 'raw')
+ITER_DEFAULTS = dict(page_size=None, prefetch=True, stream=False, raw=False)
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+class Endpoint(object):
+    """
+    - name: name of the generated client method
+    - path: path template below the client folder prefix, e.g.
+      'messages/{message_id}'; each placeholder is a required argument
+    - method: HTTP method
+    - collection: (Optional) response attribute listing the records.
+      Endpoints with one also get an `iter_name` method.
+    - params: how query parameters are passed: `FILTERS`, `PARAMS`,
+      `KWARGS` or None. With `fields`, `KWARGS` are extra posted fields.
+    - fields: (Optional) `(argument, field)` or `(argument, field,
+      convert)` tuples of the required fields of a posted record. The
+      arguments follow the path ids.
+    - optional: (Optional) `(argument, field)` pairs of fields posted
+      only when their argument is given, after the required ones
+    - record: (Optional) key the posted record is nested under, e.g.
+      'message'
+    - doc: docstring of the generated method
+    - iter_name: name of the generated generator method (default:
+      'iter_' + name)
+    - iter_doc: docstring of the generator method
+    """
+
+    def __init__(self, name, path, method='get', collection=None, params=None, doc=None, iter_name=None,
+                 iter_doc=None, fields=None, optional=(), record=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.collection = collection
+        self.params = params
+        self.doc = doc
+        self.iter_name = iter_name or ('iter_%s' % name if collection else None)
+        self.iter_doc = iter_doc
+        self.fields = tuple(field + (None,) * (3 - len(field)) for field in fields) if fields else None
+        self.optional = tuple(optional)
+        self.record = record
+        self.ids = tuple(_PLACEHOLDER.findall(path))
+        self.required = self.ids + tuple(field[0] for field in self.fields or ())
+        self.resource = path.split('/')[0]
+        self.template = _PLACEHOLDER.sub('%s', path.replace('%', '%%'))
+        self.arguments = ((('params',) if params == PARAMS else ()) + self.required +
+                          tuple(argument for argument, _ in self.optional) + FOLDER_ARGUMENTS +
+                          (('filters',) if params == FILTERS else ()))
+
+    def __repr__(self):
+        return 'Endpoint(%r, %r, method=%r)' % (self.name, self.path, self.method)
+
+    def bind(self, name, arguments, args, kwargs):
+        """
+        Maps the positional and keyword arguments of a call to `arguments`.
+        Returns the bound values and the remaining keyword arguments.
+        """
+        if len(args) > len(arguments):
+            raise TypeError('%s() takes at most %d positional arguments (%d given)' % (
+                name, len(arguments), len(args)))
+        values = dict(zip(arguments, args))
+        for argument in arguments:
+            if argument in kwargs:
+                if argument in values:
+                    raise TypeError("%s() got multiple values for argument '%s'" % (name, argument))
+                values[argument] = kwargs.pop(argument)
+        missing = [i for i in self.required if i not in values]
+        if missing:
+            raise TypeError('%s() missing required arguments: %s' % (name, ', '.join(missing)))
+        if kwargs and self.params not in (PARAMS, KWARGS):
+            raise TypeError("%s() got an unexpected keyword argument '%s'" % (name, sorted(kwargs)[0]))
+        return values, kwargs
+
+    def call_path(self, client, values):
+        prefix = client._folder_prefix(values.get('account_id'), values.get('client_folder_id'))
+        if not self.ids:
+            return prefix + self.template
+        return prefix + self.template % tuple(values[i] for i in self.ids)
+
+    def query(self, values, kwargs):
+        """The query parameters, or the posted record, of a call."""
+        if self.fields is not None:
+            return self.posted(values, kwargs)
+        if self.params == FILTERS:
+            return values.get('filters')
+        if self.params == PARAMS:
+            params = dict(values.get('params') or {})
+            params.update(kwargs)
+            return params
+        if self.params == KWARGS:
+            return kwargs
+        return None
+
+    def posted(self, values, kwargs):
+        record = {}
+        for argument, field, convert in self.fields:
+            record[field] = values[argument] if convert is None else convert(values[argument])
+        for argument, field in self.optional:
+            if values.get(argument):
+                record[field] = values[argument]
+        if self.params == KWARGS:
+            record.update(kwargs)
+        return {self.record: record} if self.record else record
+
+    def signature(self, arguments, defaults):
+        """Signature shown by `help()` for a generated method."""
+        parameters = [Parameter('self', Parameter.POSITIONAL_OR_KEYWORD)]
+        for argument in arguments:
+            if argument in self.required:
+                parameters.append(Parameter(argument, Parameter.POSITIONAL_OR_KEYWORD))
+            else:
+                parameters.append(Parameter(argument, Parameter.POSITIONAL_OR_KEYWORD,
+                                            default=defaults.get(argument)))
+        if self.params in (PARAMS, KWARGS):
+            parameters.append(Parameter('kwargs', Parameter.VAR_KEYWORD))
+        return Signature(parameters)
+
+    def client_method(self):
+        """Returns the client method performing a call to the endpoint."""
+        endpoint, name, arguments = self, self.name, self.arguments + CALL_ARGUMENTS
+
+        def method(self, *args, **kwargs):
+            values, kwargs = endpoint.bind(name, arguments, args, kwargs)
+            return self._do_request(endpoint.call_path(self, values), parameters=endpoint.query(values, kwargs),
+                                    method=endpoint.method, raw=values.get('raw', False))
+        return self._named(method, name, self.doc, arguments, CALL_DEFAULTS)
+
+    def iter_client_method(self):
+        """Returns the client generator method paging through the endpoint's collection."""
+        endpoint, name, arguments = self, self.iter_name, self.arguments + ITER_ARGUMENTS
+
+        def iter_method(self, *args, **kwargs):
+            values, kwargs = endpoint.bind(name, arguments, args, kwargs)
+            return self._paginate(endpoint.call_path(self, values), endpoint.collection,
+                                  filters=endpoint.query(values, kwargs), page_size=values.get('page_size'),
+                                  prefetch=values.get('prefetch', True), stream=values.get('stream', False),
+                                  raw=values.get('raw', False))
+        return self._named(iter_method, name, self.iter_doc, arguments, ITER_DEFAULTS)
+
+    def _named(self, func, name, doc, arguments, defaults):
+        func.__name__ = name
+        func.__doc__ = doc
+        func.endpoint = self
+        func.__signature__ = self.signature(arguments, defaults)
+        return func
+
+
+def _joined(ids):
+    return ','.join(ids)
+
+
+ENDPOINTS = (
+    Endpoint('search_contacts', 'contacts/', collection='contacts', params=PARAMS, iter_name='iter_contacts',
+             doc='If account_id or client_folder_id is None, then use the default (first) one.',
+             iter_doc='Generator counterpart of `search_contacts` that transparently pages\n'
+                      'through every matching contact, yielding them one at a time.'),
+    Endpoint('contact_history', 'contacts/{contact_id}/actions/', collection='actions', params=FILTERS,
+             doc='Returns action history for a contact',
+             iter_doc='Generator counterpart of `contact_history` yielding every action one at a time.'),
+    Endpoint('lists', 'lists/', collection='lists', params=FILTERS,
+             doc='Returns iContact Lists',
+             iter_doc='Generator counterpart of `lists` yielding every list one at a time.'),
+    Endpoint('list', 'lists/{list_id}/',
+             doc="Returns an object representing the iContact List identified by the given id number.\n"
+                 "In the json returned below, and object is created with attributes for each key.\n"
+                 "Example:\n"
+                 "  {'list':{'listId':'123123', 'name':'name', 'description':'', 'emailOwnerOnChange':'',\n"
+                 "           'welcomeOnManualAdd':'', 'welcomeOnSignupAdd':'', 'welcomeMessageId':'123123'}}\n"
+                 "  >>> client = IContactClient()\n"
+                 "  >>> mylist = client.list(123123)\n"
+                 "  >>> mylist.list.listId\n"
+                 "  u'123123'"),
+    Endpoint('create_list', 'lists/', method='post',
+             fields=(('name', 'name'), ('email_owner_on_change', 'emailOwnerOnChange'),
+                     ('welcome_on_manual_add', 'welcomeOnManualAdd'), ('welcome_on_signup_add', 'welcomeOnSignupAdd'),
+                     ('welcome_message_id', 'welcomeMessageId')),
+             optional=(('description', 'description'),),
+             doc='Creates list'),
+    Endpoint('segments', 'segments/', collection='segments', params=FILTERS,
+             doc='Returns iContact Segments',
+             iter_doc='Generator counterpart of `segments` yielding every segment one at a time.'),
+    # Segment creation has been reported to iContact as not working.
+    Endpoint('create_segment', 'segments/', method='post', fields=(('name', 'name'), ('list_id', 'listId')),
+             optional=(('description', 'description'),), doc='Creates segment'),
+    Endpoint('create_criterion', 'segments/{segment_id}/criteria/', method='post',
+             fields=(('field_name', 'fieldName'), ('operator', 'operator'), ('values', 'values')),
+             doc='Creates single criterion for a given segment'),
+    Endpoint('subscriptions', 'subscriptions/', collection='subscriptions', params=FILTERS,
+             doc='Returns iContact Subscriptions',
+             iter_doc='Generator counterpart of `subscriptions` yielding every subscription one at a time.'),
+    Endpoint('messages', 'messages/', collection='messages', params=FILTERS,
+             doc='Returns iContact Messages',
+             iter_doc='Generator counterpart of `messages` yielding every message one at a time.'),
+    Endpoint('get_message', 'messages/{message_id}', doc='Gets message.'),
+    Endpoint('create_message', 'messages/', method='post', params=KWARGS, record='message',
+             fields=(('subject', 'subject'), ('message_type', 'messageType')),
+             doc='Creates a message.  Note, the campaignId is required.'),
+    Endpoint('get_send', 'sends/{send_id}', doc='Gets send.'),
+    Endpoint('create_send', 'sends/', method='post', params=KWARGS, record='send',
+             fields=(('message_id', 'messageId'), ('include_list_ids', 'includeListIds', _joined)),
+             doc='Creates a send.'),
+    Endpoint('delete_send', 'sends/{send_id}', method='delete', doc='Deletes send.'),
+    Endpoint('get_custom_object_data', 'customobjects/{custom_object_id}/data/', collection='data',
+             params=KWARGS, iter_name='iter_custom_object_data',
+             doc='Get all records of a custom object defined by `custom_object_id`',
+             iter_doc='Generator counterpart of `get_custom_object_data` yielding every\n'
+                      'record of the custom object one at a time.'),
+    Endpoint('delete_custom_object_data',
+             'customobjects/{custom_object_id}/data/{custom_object_field_definition_id}/', method='delete',
+             doc='Deletes the custom object data record for custom object specified via `custom_object_id`'),
+)
+
+BY_NAME = dict((endpoint.name, endpoint) for endpoint in ENDPOINTS)
+
+
+def method_names():
+    """Names of the generated methods performing a single call."""
+    return tuple(endpoint.name for endpoint in ENDPOINTS)
+
+
+def iter_method_names():
+    """Names of the generated generator methods."""
+    return tuple(endpoint.iter_name for endpoint in ENDPOINTS if endpoint.iter_name)
+
+
+def install(cls):
+    """Adds the methods generated from `ENDPOINTS` to the client class `cls`."""
+    for endpoint in ENDPOINTS:
+        setattr(cls, endpoint.name, endpoint.client_method())
+        if endpoint.iter_name:
+            setattr(cls, endpoint.iter_name, endpoint.iter_client_method())
@@ -0,0 +1,110 @@
+"""
+Local email to contactId index.
+
+Resolving an email address to a contactId normally costs a
+`search_contacts` call. A client created with `contact_index=ContactIndex()`
+answers `find_contact_by_email` and `contact_ids_for_emails` from a SQLite
+table instead, falling back to the API for emails that are missing or
+older than `max_age` seconds. The index is filled by those fallbacks, by
+`populate()` scans of a whole client folder, and by the contacts the
+client creates, updates and deletes::
+
+    index = ContactIndex(SQLiteStore('contacts.db'), max_age=24 * 60 * 60)
+    client = IContactClient(key, username, password, contact_index=index)
+    index.populate(client)
+    client.find_contact_by_email('jane@example.com')   # no API call
+"""
+import time
+
+from icontact.store import SQLiteStore
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class ContactIndex(object):
+    """
+    - store: the `SQLiteStore` holding the index (default: in memory)
+    - max_age: seconds an entry is trusted before the API is asked
+      again; None trusts entries until they are replaced
+    """
+
+    def __init__(self, store=None, max_age=3600):
+        self.store = store if store is not None else SQLiteStore()
+        self.max_age = max_age
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS contact_index (
+                scope TEXT NOT NULL,
+                email TEXT NOT NULL,
+                contact_id TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (scope, email)
+            )''')
+        self.store.execute('CREATE INDEX IF NOT EXISTS contact_index_id ON contact_index (scope, contact_id)')
+
+    def _fresh_after(self):
+        return time.time() - self.max_age if self.max_age is not None else 0.0
+
+    def get(self, scope, email):
+        """Returns the contactId indexed for `email`, or None if unknown or stale."""
+        rows = self.store.execute(
+            'SELECT contact_id FROM contact_index WHERE scope = ? AND email = ? AND updated >= ?',
+            (scope, normalize_email(email), self._fresh_after()))
+        return rows[0][0] if rows else None
+
+    def get_many(self, scope, emails):
+        """Returns a dict of normalized email to contactId for the fresh entries among `emails`."""
+        emails = list(set(normalize_email(e) for e in emails))
+        found = {}
+        fresh_after = self._fresh_after()
+        # Stay below SQLite's default limit of 999 bound parameters.
+        for start in range(0, len(emails), 900):
+            chunk = emails[start:start + 900]
+            rows = self.store.execute(
+                'SELECT email, contact_id FROM contact_index WHERE scope = ? AND updated >= ? AND email IN (%s)' %
+                ','.join('?' * len(chunk)), [scope, fresh_after] + chunk)
+            found.update(rows)
+        return found
+
+    def put(self, scope, contacts):
+        """
+        Indexes `(email, contact_id)` pairs, replacing any other email
+        indexed for the same contacts.
+        """
+        now = time.time()
+        rows = [(scope, normalize_email(email), str(contact_id), now)
+                for email, contact_id in contacts if email and contact_id]
+        with self.store.transaction():
+            self.store.executemany('DELETE FROM contact_index WHERE scope = ? AND contact_id = ?',
+                                   [(row[0], row[2]) for row in rows])
+            self.store.executemany(
+                'INSERT OR REPLACE INTO contact_index (scope, email, contact_id, updated) VALUES (?, ?, ?, ?)', rows)
+
+    def delete(self, scope, contact_id):
+        self.store.execute('DELETE FROM contact_index WHERE scope = ? AND contact_id = ?', (scope, str(contact_id)))
+
+    def clear(self, scope=None):
+        if scope is None:
+            self.store.execute('DELETE FROM contact_index')
+        else:
+            self.store.execute('DELETE FROM contact_index WHERE scope = ?', (scope,))
+
+    def populate(self, client, account_id=None, client_folder_id=None, page_size=None, batch_size=5000):
+        """
+        Indexes every contact of a client folder from a paged scan and
+        returns the number of contacts indexed.
+        """
+        account_id, client_folder_id = client.resolve_folder(account_id, client_folder_id)
+        scope = client._fingerprint_scope(account_id, client_folder_id, 'contacts')
+        count = 0
+        batch = []
+        for record in client.iter_contacts(account_id=account_id, client_folder_id=client_folder_id,
+                                           page_size=page_size, stream=True, raw=True):
+            batch.append((record.get('email'), record.get('contactId')))
+            if len(batch) >= batch_size:
+                self.put(scope, batch)
+                count += len(batch)
+                batch = []
+        self.put(scope, batch)
+        return count + len(batch)
@@ -0,0 +1,295 @@
+"""
+Per-request instrumentation of the iContact client.
+
+A client created with `hooks=[...]` builds a `RequestEvent` for every API
+call and passes it to each hook once the call has finished. Hooks are
+plain callables; this module provides three:
+
+- `EndpointStats` aggregates calls, errors, retries, time and bytes per
+  endpoint in process, to find which calls dominate a job
+- `PrometheusHook` updates `prometheus_client` counters and histograms
+- `OpenTelemetryHook` records an OpenTelemetry span per call
+
+::
+
+    stats = EndpointStats()
+    client = IContactClient(key, username, password, hooks=[stats, PrometheusHook()])
+    ...
+    for row in stats.summary():
+        print(row['endpoint'], row['calls'], row['total_time'])
+
+`prometheus_client` and `opentelemetry-api` are only needed by their hooks.
+"""
+import re
+import threading
+import time
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+_ID_SEGMENT = re.compile(r'(?<=/)[0-9][0-9_]*(?=/|$)')
+
+# Phases reported by `RequestEvent.phases`, in order.
+PHASES = ('connect', 'ttfb', 'download', 'parse', 'convert')
+
+# httpx trace events marking the phases of an attempt, without their
+# 'connection.', 'http11.' or 'http2.' prefix.
+_CONNECT_STARTED = 'connect_tcp.started'
+_CONNECTED = ('connect_tcp.complete', 'start_tls.complete')
+_SENT = 'send_request_headers.started'
+_HEADERS = 'receive_response_headers.complete'
+_BODY = 'receive_response_body.complete'
+
+
+def endpoint_template(call_path):
+    """
+    Replaces the ids in a call path with '{id}', so calls to the same
+    endpoint share one label, e.g. 'a/{id}/c/{id}/contacts/{id}'.
+    """
+    return _ID_SEGMENT.sub('{id}', '/' + call_path)[1:]
+
+
+def _body_size(request):
+    body = getattr(request, 'body', None)
+    if body is None:
+        body = getattr(request, 'content', None)
+    return len(body) if body else 0
+
+
+class RequestEvent(object):
+    """
+    Describes one API call.
+
+    - method, endpoint, url: the call, `endpoint` with ids replaced
+    - status: HTTP status of the last attempt, None if no response arrived
+    - attempts: number of attempts made; `retries` is attempts - 1
+    - cached: True if served from the response cache
+    - streamed: True if the body was handed to a `StreamedCollection`,
+      in which case download and parse times are not measured
+    - error: the exception raised by the call, or None
+    - started: wall clock time the call started
+    - duration: seconds from start until the result was returned
+    - connect: seconds the last attempt spent opening a connection, 0.0
+      if it reused one. Only the async client reports it; otherwise it is
+      None and connection setup is part of `ttfb`.
+    - ttfb: seconds from sending the last attempt to receiving its headers
+    - download, parse, convert: seconds spent reading the body, decoding
+      it and wrapping it in `Object` records
+    - request_bytes, response_bytes: body sizes of the last attempt
+    """
+    __slots__ = ('method', 'endpoint', 'url', 'status', 'attempts', 'cached', 'streamed', 'error',
+                 'started', 'duration', 'connect', 'ttfb', 'download', 'parse', 'convert', 'request_bytes',
+                 'response_bytes', '_clock', '_trace')
+
+    def __init__(self, method, call_path, url):
+        self.method = method.lower()
+        self.endpoint = endpoint_template(call_path)
+        self.url = url
+        self.status = None
+        self.attempts = 0
+        self.cached = False
+        self.streamed = False
+        self.error = None
+        self.started = time.time()
+        self.duration = None
+        self.connect = self.ttfb = self.download = self.parse = self.convert = None
+        self.request_bytes = self.response_bytes = 0
+        self._clock = self.started
+        self._trace = None
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    @property
+    def phases(self):
+        """Measured phases as (name, seconds) pairs."""
+        return [(name, getattr(self, name)) for name in PHASES if getattr(self, name) is not None]
+
+    def lap(self):
+        """Returns the seconds since the previous lap (or the start)."""
+        now = time.time()
+        elapsed, self._clock = now - self._clock, now
+        return elapsed
+
+    def trace(self, name, info):
+        """
+        Receives the trace events of an httpx request (the `trace`
+        request extension), which time each phase of the call.
+        """
+        name = name.split('.', 1)[-1]
+        # Each attempt starts by connecting, or by sending on a reused connection.
+        if self._trace is None or name == _CONNECT_STARTED or (name == _SENT and _SENT in self._trace):
+            self._trace = {}
+        self._trace[name] = time.time()
+
+    def response(self, req, attempts):
+        """
+        Records the response of the last attempt. With a streamed
+        `requests` response the body is not read yet; the next `lap()`
+        times its download.
+        """
+        self.lap()
+        self.status = req.status_code
+        self.attempts = attempts
+        self.request_bytes = _body_size(getattr(req, 'request', None))
+        trace = self._trace
+        if trace is not None and _SENT in trace and _HEADERS in trace:
+            connected = [trace[name] for name in _CONNECTED if name in trace]
+            self.connect = max(connected) - trace[_CONNECT_STARTED] if connected else 0.0
+            self.ttfb = trace[_HEADERS] - trace[_SENT]
+            if _BODY in trace:
+                self.download = trace[_BODY] - trace[_HEADERS]
+            return
+        try:
+            elapsed = req.elapsed.total_seconds()
+        except (AttributeError, RuntimeError):
+            return
+        # requests times the call up to the headers, connection included.
+        self.ttfb = elapsed
+
+    def finish(self, error=None):
+        if error is not None:
+            self.error = error
+            self.attempts = max(self.attempts, getattr(error, 'attempts', 1))
+        self.duration = time.time() - self.started
+
+    def __repr__(self):
+        return 'RequestEvent(%s %s, status=%r, attempts=%r, duration=%r)' % (
+            self.method.upper(), self.endpoint, self.status, self.attempts, self.duration)
+
+
+class EndpointStats(object):
+    """
+    Hook aggregating calls per method and endpoint. `summary()` lists the
+    endpoints by total time spent, slowest first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def __call__(self, event):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            row = self._endpoints.get(key)
+            if row is None:
+                row = self._endpoints[key] = dict(method=event.method, endpoint=event.endpoint, calls=0,
+                                                  errors=0, retries=0, cached=0, total_time=0.0,
+                                                  max_time=0.0, response_bytes=0)
+            row['calls'] += 1
+            row['errors'] += event.error is not None
+            row['retries'] += event.retries
+            row['cached'] += event.cached
+            row['total_time'] += event.duration or 0.0
+            row['max_time'] = max(row['max_time'], event.duration or 0.0)
+            row['response_bytes'] += event.response_bytes
+
+    def summary(self):
+        with self._lock:
+            rows = [dict(row) for row in self._endpoints.values()]
+        for row in rows:
+            row['mean_time'] = row['total_time'] / row['calls']
+        return sorted(rows, key=lambda row: row['total_time'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+class PrometheusHook(object):
+    """
+    Hook exporting Prometheus metrics (requires `prometheus_client`):
+
+    - `<namespace>_requests_total{method,endpoint,status}`
+    - `<namespace>_request_duration_seconds{method,endpoint}`
+    - `<namespace>_request_phase_seconds{method,endpoint,phase}`
+    - `<namespace>_retries_total{method,endpoint}`
+    - `<namespace>_response_bytes_total{method,endpoint}`
+
+    Metrics are registered in `registry` (default: the global registry),
+    so create one hook per registry and share it between clients.
+    """
+
+    def __init__(self, registry=None, namespace='icontact', buckets=None):
+        if prometheus_client is None:
+            raise ImportError('PrometheusHook requires the prometheus_client package')
+        options = dict(namespace=namespace)
+        if registry is not None:
+            options['registry'] = registry
+        histogram_options = dict(options)
+        if buckets is not None:
+            histogram_options['buckets'] = buckets
+        labels = ('method', 'endpoint')
+        self.requests = prometheus_client.Counter('requests_total', 'iContact API calls',
+                                                  labels + ('status',), **options)
+        self.duration = prometheus_client.Histogram('request_duration_seconds', 'iContact API call duration',
+                                                    labels, **histogram_options)
+        self.phases = prometheus_client.Histogram('request_phase_seconds', 'iContact API call phase duration',
+                                                  labels + ('phase',), **histogram_options)
+        self.retries = prometheus_client.Counter('retries_total', 'iContact API call retries', labels, **options)
+        self.response_bytes = prometheus_client.Counter('response_bytes_total', 'iContact API response bytes',
+                                                        labels, **options)
+
+    def __call__(self, event):
+        labels = (event.method, event.endpoint)
+        if event.cached:
+            status = 'cached'
+        elif event.status is None:
+            status = 'error'
+        else:
+            status = str(event.status)
+        self.requests.labels(*(labels + (status,))).inc()
+        if event.duration is not None:
+            self.duration.labels(*labels).observe(event.duration)
+        for phase, seconds in event.phases:
+            self.phases.labels(*(labels + (phase,))).observe(seconds)
+        if event.retries:
+            self.retries.labels(*labels).inc(event.retries)
+        if event.response_bytes:
+            self.response_bytes.labels(*labels).inc(event.response_bytes)
+
+
+class OpenTelemetryHook(object):
+    """
+    Hook recording a client span per call (requires `opentelemetry-api`).
+    Spans are recorded when the call finishes, with its start and end
+    times, under the span current in the calling thread.
+    """
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise ImportError('OpenTelemetryHook requires the opentelemetry-api package')
+        self.tracer = tracer if tracer is not None else trace.get_tracer('icontact')
+
+    def __call__(self, event):
+        attributes = {
+            'http.method': event.method.upper(),
+            'http.url': event.url,
+            'icontact.endpoint': event.endpoint,
+            'icontact.attempts': event.attempts,
+            'icontact.cached': event.cached,
+            'http.response_content_length': event.response_bytes,
+            'http.request_content_length': event.request_bytes,
+        }
+        if event.status is not None:
+            attributes['http.status_code'] = event.status
+        for phase, seconds in event.phases:
+            attributes['icontact.%s_seconds' % phase] = seconds
+
+        span = self.tracer.start_span('iContact %s %s' % (event.method.upper(), event.endpoint),
+                                      kind=trace.SpanKind.CLIENT, attributes=attributes,
+                                      start_time=int(event.started * 1e9))
+        if event.error is not None:
+            span.record_exception(event.error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, str(event.error)))
+        elif event.status is not None and event.status >= 400:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        span.end(end_time=int((event.started + (event.duration or 0.0)) * 1e9))
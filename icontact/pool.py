@@ -0,0 +1,325 @@
+"""
+Clients for many iContact accounts behind one connection pool.
+
+`IContactClientPool` keeps the credentials of every tenant (an account
+and client folder) and creates their `IContactClient` on first use. All
+clients share one `requests.Session`, and so one set of pooled
+connections, while each tenant gets its own rate limiter and concurrency
+cap. Budgets shared by every tenant are enforced on top; a tenant that
+is throttled by iContact only slows down its own budget::
+
+    pool = IContactClientPool(global_limits=dict(per_hour=10000), tenant_limits=dict(per_minute=75),
+                              max_concurrency=32, tenant_concurrency=4)
+    pool.add_tenant('acme', api_key, 'acme-user', 'secret', account_id=123, client_folder_id=456)
+    pool.client('acme').lists()
+    totals = pool.fan_out(lambda client: client.search_contacts().total)
+
+Clients unused for `idle_timeout` seconds are dropped and recreated the
+next time their tenant is used.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from icontact.client import IContactClient
+from icontact.ratelimit import RateLimiter, TokenBucket
+
+
+class _Permits(object):
+    """
+    The semaphores taken for one request, released at most once.
+
+    A thread takes each semaphore once. Requests it makes while an earlier
+    one still holds the semaphore, e.g. calls made while reading a
+    streamed page, share that permit instead of waiting for themselves.
+    """
+
+    _lock = threading.Lock()
+    _local = threading.local()
+
+    def __init__(self, semaphores):
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            counts = self._local.counts = {}
+        # Kept to release the permits from whichever thread finishes the response.
+        self._counts = counts
+        self._taken = []
+        self._held = True
+        try:
+            for semaphore in semaphores:
+                with self._lock:
+                    shared = counts.get(semaphore, 0) > 0
+                if not shared:
+                    semaphore.acquire()
+                with self._lock:
+                    counts[semaphore] = counts.get(semaphore, 0) + 1
+                self._taken.append(semaphore)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        free = []
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+            for semaphore in reversed(self._taken):
+                self._counts[semaphore] -= 1
+                if not self._counts[semaphore]:
+                    del self._counts[semaphore]
+                    free.append(semaphore)
+        for semaphore in free:
+            semaphore.release()
+
+
+class _BoundedSession(object):
+    """
+    Sends requests through a shared session while holding the tenant's
+    and the pool's concurrency semaphores.
+
+    The client streams response bodies, so the semaphores of a streamed
+    response are held until its body has been read or it is closed. Calls
+    the same thread makes meanwhile run under the permits it holds.
+    """
+
+    def __init__(self, session, semaphores):
+        self._session = session
+        self._semaphores = semaphores
+
+    def request(self, *args, **kwargs):
+        permits = _Permits(self._semaphores)
+        try:
+            response = self._session.request(*args, **kwargs)
+        except BaseException:
+            permits.release()
+            raise
+        if not kwargs.get('stream') or response._content_consumed:
+            permits.release()
+        else:
+            self._hold(response, permits)
+        return response
+
+    @staticmethod
+    def _hold(response, permits):
+        """Releases `permits` once the body of `response` is read or it is closed."""
+        iter_content, close = response.iter_content, response.close
+
+        def read(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                yield chunk
+            permits.release()
+
+        def release_and_close():
+            try:
+                close()
+            finally:
+                permits.release()
+        response.iter_content = read
+        response.close = release_and_close
+
+    def close(self):
+        pass
+
+
+def _buckets(limits, store, prefix):
+    """Token buckets for `per_second`/`per_minute`/... limits, keyed under `prefix`."""
+    buckets = []
+    for name, period in (('per_second', 1), ('per_minute', 60), ('per_hour', 3600), ('per_day', 86400)):
+        rate = (limits or {}).get(name)
+        if rate:
+            buckets.append(TokenBucket(rate, period, store=store, key='%s:%g/%g' % (prefix, rate, period)))
+    return buckets
+
+
+class _Tenant(object):
+    __slots__ = ('name', 'api_key', 'username', 'password', 'options', 'client', 'last_used')
+
+    def __init__(self, name, api_key, username, password, options):
+        self.name = name
+        self.api_key = api_key
+        self.username = username
+        self.password = password
+        self.options = options
+        self.client = None
+        self.last_used = 0.0
+
+
+class IContactClientPool(object):
+    """
+    Lazily created, reused `IContactClient` instances keyed by tenant name.
+    """
+
+    def __init__(self, tenants=None, client_class=IContactClient, client_options=None,
+                 global_limits=None, tenant_limits=None, rate_store=None, max_concurrency=None,
+                 tenant_concurrency=None, idle_timeout=600, pool_connections=10, pool_maxsize=50,
+                 session=None):
+        """
+        - tenants: (Optional) mapping of tenant name to the keyword
+          arguments of `add_tenant`
+        - client_class: class of the clients created, e.g. a subclass of
+          `IContactClient`
+        - client_options: keyword arguments passed to every client
+        - global_limits: (Optional) `per_second`/`per_minute`/`per_hour`/
+          `per_day` budgets shared by all tenants
+        - tenant_limits: (Optional) the same budgets, applied to each
+          tenant separately
+        - rate_store: (Optional) store of the token buckets, see
+          `icontact.ratelimit`
+        - max_concurrency: (Optional) requests in flight across all tenants
+        - tenant_concurrency: (Optional) requests in flight per tenant
+        - idle_timeout: seconds after which an unused client is dropped;
+          None keeps clients until `close()`
+        - pool_connections, pool_maxsize: sizing of the shared
+          connection pool
+        - session: (Optional) An existing `requests.Session` to share
+          instead of creating one. It is not closed by `close()`.
+        """
+        self.client_class = client_class
+        self.client_options = dict(client_options or {})
+        self.tenant_limits = dict(tenant_limits or {})
+        self.rate_store = rate_store
+        self.tenant_concurrency = tenant_concurrency
+        self.idle_timeout = idle_timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        self.global_buckets = _buckets(global_limits, rate_store, 'global')
+        self._global_semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+        self._session = session
+        self._owns_session = session is None
+        self._tenants = OrderedDict()
+        self._lock = threading.RLock()
+
+        for name, credentials in (tenants or {}).items():
+            self.add_tenant(name, **credentials)
+
+    @property
+    def session(self):
+        """The `requests.Session` shared by every client of the pool."""
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+            return self._session
+
+    @property
+    def tenants(self):
+        """Names of the registered tenants."""
+        with self._lock:
+            return list(self._tenants)
+
+    def add_tenant(self, name, api_key, username, password, **options):
+        """
+        Registers the credentials of a tenant. `options` (such as
+        `account_id` and `client_folder_id`) are passed to its client,
+        overriding the pool's `client_options`.
+        """
+        with self._lock:
+            self.remove_tenant(name)
+            self._tenants[name] = _Tenant(name, api_key, username, password, options)
+
+    def remove_tenant(self, name):
+        with self._lock:
+            tenant = self._tenants.pop(name, None)
+        if tenant is not None and tenant.client is not None:
+            tenant.client.close()
+
+    def _create_client(self, tenant):
+        options = dict(self.client_options)
+        options.update(tenant.options)
+        semaphores = []
+        if self.tenant_concurrency:
+            semaphores.append(threading.BoundedSemaphore(self.tenant_concurrency))
+        if self._global_semaphore is not None:
+            semaphores.append(self._global_semaphore)
+        options.setdefault('session', _BoundedSession(self.session, semaphores) if semaphores else self.session)
+        if 'rate_limiter' not in options and (self.tenant_limits or self.global_buckets):
+            buckets = _buckets(self.tenant_limits, self.rate_store, 'tenant:%s' % (tenant.name,))
+            options['rate_limiter'] = RateLimiter(buckets=buckets, shared_buckets=self.global_buckets)
+        return self.client_class(tenant.api_key, tenant.username, tenant.password, **options)
+
+    def client(self, name):
+        """Returns the client of a tenant, creating it on first use."""
+        now = time.time()
+        with self._lock:
+            try:
+                tenant = self._tenants[name]
+            except KeyError:
+                raise KeyError('Unknown iContact tenant %r' % (name,))
+            if tenant.client is None:
+                tenant.client = self._create_client(tenant)
+            tenant.last_used = now
+            self.evict_idle(now)
+            return tenant.client
+
+    def evict_idle(self, now=None):
+        """Drops the clients of tenants unused for `idle_timeout` seconds."""
+        if self.idle_timeout is None:
+            return 0
+        now = time.time() if now is None else now
+        evicted = []
+        with self._lock:
+            for tenant in self._tenants.values():
+                if tenant.client is not None and now - tenant.last_used > self.idle_timeout:
+                    evicted.append(tenant.client)
+                    tenant.client = None
+        for client in evicted:
+            client.close()
+        return len(evicted)
+
+    def fan_out(self, func, tenants=None, workers=10, return_exceptions=False):
+        """
+        Calls `func(client)` for every tenant (or the given tenant names)
+        from a pool of `workers` threads and returns an `OrderedDict` of
+        tenant name to result, in tenant order.
+
+        The first exception is raised once every call has finished, unless
+        `return_exceptions` is set, in which case exceptions are returned
+        in place of the results of the failed tenants.
+        """
+        names = self.tenants if tenants is None else list(tenants)
+
+        def call(name):
+            try:
+                return func(self.client(name)), None
+            except Exception as e:
+                if not return_exceptions:
+                    return None, e
+                return e, None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names) or 1))) as executor:
+            outcomes = list(executor.map(call, names))
+
+        results = OrderedDict()
+        for name, (result, error) in zip(names, outcomes):
+            if error is not None:
+                raise error
+            results[name] = result
+        return results
+
+    def close(self):
+        """Closes every client and the shared session if the pool created it."""
+        with self._lock:
+            clients = [t.client for t in self._tenants.values() if t.client is not None]
+            for tenant in self._tenants.values():
+                tenant.client = None
+            session, self._session = self._session, None
+        for client in clients:
+            client.close()
+        if session is not None and self._owns_session:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,203 @@
+"""
+Client side pacing of iContact API calls.
+
+iContact enforces call budgets per account (per minute, hour and day) and
+answers with throttling errors once they are exceeded. A `RateLimiter`
+paces requests to stay within configured budgets and slows down further
+when the server signals throttling::
+
+    limiter = RateLimiter(per_minute=60, per_day=75000)
+    client = IContactClient(key, username, password, rate_limiter=limiter)
+
+One limiter may be shared by any number of clients and threads. To share
+budgets between processes on one host, give every limiter the same
+`FileStore`::
+
+    limiter = RateLimiter(per_minute=60, store=FileStore('/tmp/icontact.bucket'))
+"""
+import calendar
+import json
+import os
+import threading
+import time
+
+from email.utils import parsedate_tz, mktime_tz
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds requested by a `Retry-After` header,
+    given either as a number of seconds or as an HTTP date, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - calendar.timegm(time.gmtime()))
+
+
+class MemoryStore(object):
+    """Keeps bucket state in process memory, shared between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def update(self, key, func):
+        """
+        Atomically replaces the state stored under `key` (None if unset)
+        with the first item returned by `func(state)`, and returns the
+        second item.
+        """
+        with self._lock:
+            self._state[key], result = func(self._state.get(key))
+            return result
+
+
+class FileStore(object):
+    """
+    Keeps bucket state in a JSON file guarded by an exclusive `flock`, so
+    that every process on the host using the same path shares budgets.
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise ImportError('FileStore requires the fcntl module')
+        self.path = path
+        self._lock = threading.Lock()
+
+    def update(self, key, func):
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), 'r+') as f:
+                    content = f.read()
+                    state = json.loads(content) if content else {}
+                    state[key], result = func(state.get(key))
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                return result
+            finally:
+                os.close(fd)
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` calls per `period` seconds, with bursts of up to
+    `capacity` calls (default: `rate`).
+
+    Calls reserve a token immediately, letting the bucket go into debt;
+    the caller then waits for the debt to be repaid. Reservations are a
+    single atomic update, so waiting callers are served in order without
+    polling.
+    """
+
+    def __init__(self, rate, period=60.0, capacity=None, store=None, key=None):
+        self.rate = float(rate)
+        self.period = float(period)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.store = store if store is not None else MemoryStore()
+        self.key = key or '%g/%g' % (self.rate, self.period)
+
+    def reserve(self, factor=1.0, now=None):
+        """
+        Takes one token and returns the number of seconds to wait before
+        the call may proceed. `factor` scales the refill rate down while
+        the server is throttling.
+        """
+        now = time.time() if now is None else now
+        per_second = self.rate * factor / self.period
+
+        def take(state):
+            tokens, updated, paused_until = state or (self.capacity, now, 0.0)
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * per_second) - 1
+            wait = max(-tokens / per_second if tokens < 0 else 0.0, paused_until - now)
+            return [tokens, now, paused_until], wait
+        return self.store.update(self.key, take)
+
+    def pause(self, seconds, now=None):
+        """Blocks all reservations for the given number of seconds."""
+        now = time.time() if now is None else now
+
+        def set_pause(state):
+            tokens, updated, paused_until = state or (self.capacity, now, 0.0)
+            return [tokens, updated, max(paused_until, now + seconds)], None
+        self.store.update(self.key, set_pause)
+
+
+class RateLimiter(object):
+    """
+    Paces calls to stay within every one of its token buckets.
+
+    Budgets are given either as `per_second`/`per_minute`/`per_hour`/
+    `per_day` counts, or as a list of (possibly shared) `TokenBucket`
+    instances. Buckets given as `shared_buckets` are also used by other
+    limiters, allowing one global budget to be combined with per-client
+    budgets.
+
+    The limiter adapts to server throttling: `throttled()` pauses its own
+    buckets (for `Retry-After` seconds when given) and multiplies their
+    call rate by `decrease`, down to `min_factor`. Each successful call
+    then restores `increase` of the full rate. Shared buckets are always
+    charged at the full rate and never paused, so one throttled client
+    does not stall the others.
+    """
+
+    def __init__(self, per_second=None, per_minute=None, per_hour=None, per_day=None,
+                 buckets=None, shared_buckets=None, store=None, decrease=0.5, increase=0.01, min_factor=0.05,
+                 default_pause=5.0, sleep=time.sleep):
+        self.buckets = list(buckets or [])
+        self.shared_buckets = list(shared_buckets or [])
+        for rate, period in ((per_second, 1), (per_minute, 60), (per_hour, 3600), (per_day, 86400)):
+            if rate:
+                self.buckets.append(TokenBucket(rate, period, store=store))
+        self.decrease = decrease
+        self.increase = increase
+        self.min_factor = min_factor
+        self.default_pause = default_pause
+        self.factor = 1.0
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Reserves a call in every bucket and returns the number of seconds
+        to wait before making it, for callers that cannot block (asyncio).
+        """
+        factor = self.factor
+        return max([bucket.reserve(factor) for bucket in self.buckets] +
+                   [bucket.reserve() for bucket in self.shared_buckets] or [0.0])
+
+    def acquire(self):
+        """Blocks until a call is allowed by every bucket. Returns the time waited."""
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after=None):
+        """Called when the server rejects a call for exceeding its limits."""
+        with self._lock:
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+        pause = retry_after if retry_after is not None else self.default_pause
+        for bucket in self.buckets:
+            bucket.pause(pause)
+
+    def succeeded(self):
+        """Called after every call that was not throttled."""
+        if self.factor < 1.0:
+            with self._lock:
+                self.factor = min(1.0, self.factor + self.increase)
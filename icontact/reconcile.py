@@ -0,0 +1,215 @@
+"""
+Reconciliation of list memberships against a desired state.
+
+`SubscriptionReconciler` takes the lists each contact should belong to,
+reads the current subscriptions of the client folder in streamed pages,
+and computes the smallest set of changes:
+
+- create: subscribe a contact to a list it is missing
+- move: move one of the contact's unwanted subscriptions, or its
+  subscription to the holding list, to a missing list
+- retire: move an unwanted subscription to the holding list or, when the
+  contact is already held there or there is no holding list, mark it
+  unsubscribed
+
+Creates and unsubscribing retirements are written through the chunked bulk
+subscription upsert; moves are `move_subscriber` calls made
+from a pool of worker threads::
+
+    reconciler = SubscriptionReconciler(client, holding_list_id=holding, progress=print)
+    report = reconciler.reconcile({contact_id: [list_a, list_b], ...})
+
+Only the managed lists (by default every list named in the desired state)
+and the contacts present in the desired state are touched.
+"""
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from icontact.client import IContactServerError
+
+ACTIVE_STATUSES = ('normal', 'pending')
+
+# `list_id` of a retirement is the holding list, or None to unsubscribe.
+ReconcileAction = namedtuple('ReconcileAction', 'action contact_id list_id from_list_id')
+
+
+class ReconcileReport(object):
+    """
+    Progress and outcome of a reconciliation. `planned` counts the actions
+    per kind, `done` and `errors` the actions applied and failed so far.
+    Failed actions are listed in `failed` as (action, error) pairs.
+    """
+
+    def __init__(self, plan):
+        self.planned = dict(create=0, move=0, retire=0)
+        for action in plan:
+            self.planned[action.action] += 1
+        self.done = 0
+        self.errors = 0
+        self.failed = []
+
+    @property
+    def total(self):
+        return sum(self.planned.values())
+
+    def __repr__(self):
+        return 'ReconcileReport(planned=%r, done=%d, errors=%d)' % (self.planned, self.done, self.errors)
+
+
+class SubscriptionReconciler(object):
+    """
+    - client: the `IContactClient` to reconcile through
+    - holding_list_id: (Optional) list unwanted subscriptions are moved
+      to. Without one they are marked 'unsubscribed'.
+    - status: status of created subscriptions
+    - workers: concurrent requests for moves and bulk chunks
+    - chunk_size: records per bulk request (default: the client's
+      `BULK_CHUNK_SIZE`)
+    - page_size: subscriptions read per page
+    - progress: (Optional) callable receiving the `ReconcileReport` after
+      every bulk chunk and move
+    """
+
+    def __init__(self, client, holding_list_id=None, status='normal', workers=8, chunk_size=None,
+                 page_size=None, progress=None, account_id=None, client_folder_id=None):
+        self.client = client
+        self.holding_list_id = str(holding_list_id) if holding_list_id is not None else None
+        self.status = status
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.page_size = page_size
+        self.progress = progress
+        self.account_id = account_id
+        self.client_folder_id = client_folder_id
+
+    def current(self, contacts, lists):
+        """
+        Returns a dict of contactId to the set of managed lists, and the
+        holding list, the contact is actively subscribed to, for the given
+        contacts.
+        """
+        current = {}
+        for record in self.client.iter_subscriptions(account_id=self.account_id,
+                                                     client_folder_id=self.client_folder_id,
+                                                     page_size=self.page_size, stream=True, raw=True):
+            contact_id = str(record.get('contactId'))
+            list_id = str(record.get('listId'))
+            if (contact_id in contacts and (list_id in lists or list_id == self.holding_list_id) and
+                    record.get('status') in ACTIVE_STATUSES):
+                current.setdefault(contact_id, set()).add(list_id)
+        return current
+
+    def plan(self, desired, lists=None):
+        """
+        Returns the `ReconcileAction`s bringing the memberships of the
+        contacts in `desired` (a mapping of contactId to list ids) in line
+        with it, within the managed `lists`.
+        """
+        desired = dict((str(c), set(str(l) for l in list_ids)) for c, list_ids in desired.items())
+        if lists is None:
+            lists = set()
+            for list_ids in desired.values():
+                lists.update(list_ids)
+        lists = set(str(l) for l in lists)
+        if self.holding_list_id is not None:
+            lists.discard(self.holding_list_id)
+
+        current = self.current(desired, lists)
+        holding = self.holding_list_id
+        actions = []
+        for contact_id in sorted(desired):
+            wanted = desired[contact_id] & lists
+            have = current.get(contact_id, set())
+            held = holding in have
+            have = have - set([holding])
+            missing = sorted(wanted - have)
+            unwanted = sorted(have - wanted)
+            if holding is not None:
+                # A move replaces a create and a retire with one call.
+                while missing and unwanted:
+                    actions.append(ReconcileAction('move', contact_id, missing.pop(0), unwanted.pop(0)))
+                if missing and held:
+                    actions.append(ReconcileAction('move', contact_id, missing.pop(0), holding))
+                    held = False
+            actions.extend(ReconcileAction('create', contact_id, list_id, None) for list_id in missing)
+            for list_id in unwanted:
+                # A contact can only be held once; further retirements unsubscribe.
+                actions.append(ReconcileAction('retire', contact_id, None if held else holding, list_id))
+                held = holding is not None
+        return actions
+
+    def apply(self, plan):
+        """Applies a plan and returns a `ReconcileReport`."""
+        report = ReconcileReport(plan)
+        lock = threading.Lock()
+
+        def record(done, errors, failures=()):
+            with lock:
+                report.done += done
+                report.errors += errors
+                report.failed.extend(failures)
+                if self.progress is not None:
+                    self.progress(report)
+
+        bulk, moves = [], []
+        for action in plan:
+            if action.action == 'create' or (action.action == 'retire' and action.list_id is None):
+                bulk.append(action)
+            else:
+                moves.append(action)
+        if bulk:
+            self._apply_bulk(bulk, record)
+        if moves:
+            self._apply_moves(moves, record)
+        return report
+
+    def reconcile(self, desired, lists=None):
+        """Plans and applies the changes for `desired`. Returns a `ReconcileReport`."""
+        return self.apply(self.plan(desired, lists))
+
+    def _apply_bulk(self, actions, record):
+        records = []
+        for action in actions:
+            if action.action == 'create':
+                records.append(dict(contactId=action.contact_id, listId=action.list_id, status=self.status))
+            else:
+                records.append(dict(contactId=action.contact_id, listId=action.from_list_id, status='unsubscribed'))
+
+        seen = dict(processed=0, errors=0)
+
+        def chunk_done(bulk_report):
+            processed = bulk_report.processed - seen['processed']
+            errors = bulk_report.errors - seen['errors']
+            seen.update(processed=bulk_report.processed, errors=bulk_report.errors)
+            record(processed - errors, errors)
+
+        options = dict(workers=self.workers, progress=chunk_done)
+        if self.chunk_size:
+            options['chunk_size'] = self.chunk_size
+        bulk_report = self.client.bulk_create_or_update_subscription(
+            records, account_id=self.account_id, client_folder_id=self.client_folder_id, **options)
+        failures = [(actions[r.index], r.error or r.warnings or 'not returned by iContact')
+                    for r in bulk_report.failed]
+        if failures:
+            record(0, 0, failures)
+
+    def _apply_moves(self, actions, record):
+        def move(action):
+            try:
+                self.client.move_subscriber(action.from_list_id, action.contact_id, action.list_id,
+                                            account_id=self.account_id, client_folder_id=self.client_folder_id)
+            except IContactServerError as e:
+                if e.http_status == 400 and 'No Changes Made' in (e.errors or []):
+                    record(1, 0)
+                else:
+                    record(0, 1, [(action, e)])
+            except Exception as e:
+                record(0, 1, [(action, e)])
+            else:
+                record(1, 0)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in executor.map(move, actions):
+                pass
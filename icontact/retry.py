@@ -0,0 +1,93 @@
+"""
+Retry policy for transient iContact API failures.
+
+A `RetryPolicy` given to `IContactClient(retry_policy=...)` replays calls
+that fail with a connection error or a transient status, waiting with
+exponential backoff and jitter between attempts::
+
+    policy = RetryPolicy(max_attempts=5, deadline=120, retry_upserts=True)
+    client = IContactClient(key, username, password, retry_policy=policy)
+
+Only idempotent HTTP methods are replayed by default. The bulk
+`create_or_update_*` upserts POST data that can safely be sent twice and
+are replayed too when `retry_upserts` is set; other POSTs never are.
+"""
+import random
+import time
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+if httpx is not None:
+    RETRY_EXCEPTIONS += (httpx.TransportError,)
+
+
+class RetryPolicy(object):
+    """
+    - max_attempts: total number of attempts, including the first one
+    - backoff: delay before the first retry, doubled for every retry
+    - max_backoff: upper bound for a single delay
+    - jitter: randomise delays ("full jitter") so that clients failing at
+      the same moment do not retry in lockstep
+    - deadline: (Optional) total seconds a call may spend, including
+      retries; no retry is attempted that would wait past it
+    - methods: HTTP methods that are always safe to replay
+    - retry_upserts: also replay the idempotent `create_or_update_*` POSTs
+    - statuses: response statuses that are retried
+    - exceptions: transport exceptions that are retried
+    - on_retry: (Optional) callable invoked before every retry as
+      `on_retry(attempt, delay, method, url, status, exception)`, where
+      one of `status` or `exception` is None
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30.0, jitter=True, deadline=None,
+                 methods=('get', 'delete', 'put'), retry_upserts=False,
+                 statuses=(429, 500, 502, 503, 504), exceptions=RETRY_EXCEPTIONS, on_retry=None,
+                 sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.methods = tuple(m.lower() for m in methods)
+        self.retry_upserts = retry_upserts
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.on_retry = on_retry
+        self.sleep = sleep
+
+    def allows(self, method, idempotent=False):
+        """Whether calls with this HTTP method may be replayed at all."""
+        return method.lower() in self.methods or (idempotent and self.retry_upserts)
+
+    def retryable(self, status=None, exception=None):
+        if exception is not None:
+            return isinstance(exception, self.exceptions)
+        return status in self.statuses
+
+    def delay(self, attempt, started, retry_after=None, now=None):
+        """
+        Returns the seconds to wait before retrying after `attempt` failed
+        attempts, or None if the attempt or deadline budget is exhausted.
+        `retry_after` (from the server) is used as a lower bound.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        now = time.time() if now is None else now
+        if self.deadline is not None and now - started + delay > self.deadline:
+            return None
+        return delay
+
+    def notify(self, attempt, delay, method, url, status=None, exception=None):
+        if self.on_retry is not None:
+            self.on_retry(attempt, delay, method, url, status, exception)
@@ -0,0 +1,51 @@
+"""
+Single-flight execution of identical concurrent calls.
+
+When several threads (or tasks) make the same call at the same moment,
+only the first one runs it; the others wait for its outcome and receive
+the same result or exception. `IContactClient` uses this for GET requests
+when created with `single_flight=True`, so a burst of identical lookups,
+e.g. when a cached response expires, costs a single HTTP request.
+
+The asyncio counterpart is `icontact.aio.AsyncSingleFlight`.
+"""
+import threading
+
+from concurrent.futures import Future
+
+
+class SingleFlight(object):
+    """Thread-based single-flight group."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Returns `func()`, or the outcome of the call already in flight for
+        `key` in another thread.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
+
@@ -0,0 +1,146 @@
+"""
+Local SQLite state shared by the features that remember what the client
+has already seen: high-water marks (`get_mark`/`set_mark`) and per-record
+fingerprints (`get_fingerprint`/`set_fingerprints`).
+
+The store may be used from several threads; every statement runs under a
+lock on one connection. Use a file path to persist state between runs, or
+the default ':memory:' for a per-process store.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+
+def fingerprint(record, fields=None):
+    """
+    Returns a stable hash of a json record (or of the given `fields` of
+    it), independent of key order and of numbers being sent as strings.
+    """
+    if fields is not None:
+        record = dict((f, record.get(f)) for f in fields)
+    normalized = dict((k, v if v is None or isinstance(v, (dict, list)) else str(v))
+                      for k, v in record.items())
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class SQLiteStore(object):
+    """Marks and fingerprints kept in one SQLite database."""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS marks (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                resource TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (resource, id)
+            );
+        ''')
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def executemany(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+
+    @contextmanager
+    def transaction(self):
+        """Groups statements into one transaction, rolled back on error."""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_mark(self, name):
+        rows = self.execute('SELECT value FROM marks WHERE name = ?', (name,))
+        return rows[0][0] if rows else None
+
+    def set_mark(self, name, value):
+        self.execute('INSERT OR REPLACE INTO marks (name, value) VALUES (?, ?)', (name, value))
+
+    def get_fingerprint(self, resource, record_id):
+        rows = self.execute('SELECT fingerprint FROM fingerprints WHERE resource = ? AND id = ?',
+                            (resource, str(record_id)))
+        return rows[0][0] if rows else None
+
+    def set_fingerprints(self, resource, items):
+        """Stores `(id, fingerprint)` pairs for the resource."""
+        self.executemany('INSERT OR REPLACE INTO fingerprints (resource, id, fingerprint) VALUES (?, ?, ?)',
+                         [(resource, str(record_id), fp) for record_id, fp in items])
+
+    def delete_fingerprints(self, resource, record_ids):
+        self.executemany('DELETE FROM fingerprints WHERE resource = ? AND id = ?',
+                         [(resource, str(record_id)) for record_id in record_ids])
+
+
+class FingerprintIndex(object):
+    """
+    Remembers a hash of every field value last written for a record, so
+    writes that would not change anything can be dropped before they are
+    sent. Used by `IContactClient` when passed as `fingerprints`.
+
+    Records are identified by a resource name and a key (e.g. a
+    contactId). A write is unchanged when every field it sets has the
+    value last written; fields it does not set are ignored. The hashes
+    are kept in a table of their own, so the store can be shared with
+    `DeltaSync` and other users of the `fingerprints` table.
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else SQLiteStore()
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS written_fields (
+                resource TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                PRIMARY KEY (resource, id)
+            )''')
+
+    @staticmethod
+    def _hashes(data):
+        return dict((field, fingerprint({'v': value})[:16]) for field, value in data.items())
+
+    def _known(self, resource, key):
+        rows = self.store.execute('SELECT fields FROM written_fields WHERE resource = ? AND id = ?',
+                                  (resource, str(key)))
+        return json.loads(rows[0][0]) if rows else {}
+
+    def known(self, resource, key):
+        """True if a write of the record has been remembered."""
+        return bool(self._known(resource, key))
+
+    def unchanged(self, resource, key, data):
+        known = self._known(resource, key)
+        if not known:
+            return False
+        return all(known.get(field) == value for field, value in self._hashes(data).items())
+
+    def remember(self, resource, key, data):
+        with self.store.transaction():
+            known = self._known(resource, key)
+            known.update(self._hashes(data))
+            self.store.execute('INSERT OR REPLACE INTO written_fields (resource, id, fields) VALUES (?, ?, ?)',
+                               (resource, str(key), json.dumps(known, sort_keys=True)))
+
+    def forget(self, resource, key):
+        self.store.execute('DELETE FROM written_fields WHERE resource = ? AND id = ?', (resource, str(key)))
@@ -0,0 +1,164 @@
+"""
+Incremental parsing of large iContact collection responses.
+
+Collection endpoints answer with a single json object holding one array
+of records plus a few metadata fields::
+
+    {"contacts": [{...}, {...}, ...], "limit": 500, "offset": 0, "total": 2000000}
+
+`StreamedCollection` reads such a body chunk by chunk and yields the
+records of the array as soon as each one has been received, so neither
+the raw body nor the complete parsed array is ever held in memory.
+"""
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+
+# Characters that may continue a json number.
+_NUMBER_CHARS = '0123456789.eE+-'
+
+# Yielded by the parser when it reaches the start of the collection array.
+_ARRAY_START = object()
+
+
+class StreamedCollection(object):
+    """
+    Iterates over the records of the array named `collection` in a json
+    object read from `chunks`, an iterable of bytes.
+
+    The other top level fields are collected in `metadata` and are also
+    readable as attributes. Reading an attribute before iterating parses
+    the body up to the start of the array; fields that follow the array
+    (iContact sends `total` last) are only available once iteration has
+    finished. The collection can be iterated once.
+
+    - wrap: (Optional) callable applied to every record before it is yielded
+    - close: (Optional) callable invoked once the body has been consumed
+      or iteration is abandoned, e.g. to release the HTTP connection
+    """
+
+    def __init__(self, chunks, collection, wrap=None, close=None):
+        self.collection = collection
+        self.metadata = {}
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._scanner = json.JSONDecoder()
+        self._wrap = wrap
+        self._close = close
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._started = False
+        self._parser = self._parse()
+        self._primed = False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self.metadata and not self._started:
+            self._prime()
+        try:
+            return self.metadata[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _prime(self):
+        """Parses the fields preceding the collection array."""
+        if not self._primed:
+            self._primed = True
+            for item in self._parser:
+                if item is _ARRAY_START:
+                    break
+
+    def __iter__(self):
+        if self._started:
+            raise RuntimeError('a StreamedCollection can only be iterated once')
+        self._started = True
+        self._prime()
+        try:
+            for record in self._parser:
+                yield self._wrap(record) if self._wrap is not None else record
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close is not None:
+            close, self._close = self._close, None
+            close()
+
+    def _fill(self):
+        """Appends the next chunk to the buffer. Returns False at end of body."""
+        if self._eof:
+            return False
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self._buffer += text
+                return True
+        self._buffer += self._decoder.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def _next_char(self):
+        """Skips whitespace and returns the next character, without consuming it."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of json response')
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError('Expected %r in json response, found %r' % (chars, char))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Decodes the next complete json value, reading more of the body as needed."""
+        self._next_char()
+        while True:
+            try:
+                value, end = self._scanner.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                # A number running to the buffer end may continue in the next
+                # chunk, including one cut inside its fraction or exponent,
+                # which the scanner decodes as a shorter number ('12.', '2e').
+                tail = end
+                while tail < len(self._buffer) and self._buffer[tail] in _NUMBER_CHARS:
+                    tail += 1
+                if tail == len(self._buffer) and self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    def _parse(self):
+        self._expect('{')
+        if self._next_char() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self.collection and self._next_char() == '[':
+                self._pos += 1
+                yield _ARRAY_START
+                if self._next_char() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.metadata[key] = self._value()
+            if self._expect(',}') == '}':
+                return
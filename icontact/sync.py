@@ -0,0 +1,162 @@
+"""
+Incremental mirroring of contacts and subscriptions.
+
+`DeltaSync` remembers, in a `icontact.store.SQLiteStore`, the newest
+cursor value (`createDate` for contacts, `addDate` for subscriptions) and
+a fingerprint of every record it has reported. Each run only requests
+records past the stored cursor and reports them as change events::
+
+    sync = DeltaSync(client, SQLiteStore('icontact-sync.db'))
+    for event in sync.changes():
+        if event.action == 'delete':
+            db.delete(event.id)
+        else:
+            db.upsert(event.id, event.record)
+
+iContact offers no modification date filter, so changes to records older
+than the cursor are only found by a full scan (`changes(full=True)`),
+which also reports records that disappeared as deletes.
+"""
+import uuid
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from icontact.store import fingerprint
+
+ChangeEvent = namedtuple('ChangeEvent', 'action resource id record')
+
+# Identifier and cursor field of each resource that can be synced.
+RESOURCES = {
+    'contacts': ('contactId', 'createDate'),
+    'subscriptions': ('subscriptionId', 'addDate'),
+}
+
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+
+class DeltaSync(object):
+    """
+    - client: the `IContactClient` to sync from
+    - store: a `SQLiteStore` holding marks and fingerprints
+    - resource: 'contacts' or 'subscriptions'
+    - cursor_field: (Optional) date field used as the high-water mark,
+      replacing the resource's default
+    - fields: (Optional) fields compared to detect updates; by default
+      the whole record is compared
+    - overlap: seconds subtracted from the stored mark when querying, so
+      records created in the same second as the last run are not missed.
+      Records already reported unchanged are not reported again.
+    - filters: (Optional) extra search filters
+    """
+
+    def __init__(self, client, store, resource='contacts', cursor_field=None, fields=None, overlap=60,
+                 filters=None, page_size=None, account_id=None, client_folder_id=None):
+        if resource not in RESOURCES:
+            raise ValueError('Cannot sync %r, expected one of %s' % (resource, ', '.join(sorted(RESOURCES))))
+        self.client = client
+        self.store = store
+        self.resource = resource
+        self.id_field, default_cursor = RESOURCES[resource]
+        self.cursor_field = cursor_field or default_cursor
+        self.fields = fields
+        self.overlap = overlap
+        self.filters = filters
+        self.page_size = page_size
+        self.account_id = account_id
+        self.client_folder_id = client_folder_id
+
+    def _records(self, filters):
+        options = dict(account_id=self.account_id, client_folder_id=self.client_folder_id,
+                       page_size=self.page_size, stream=True, raw=True)
+        if self.resource == 'contacts':
+            return self.client.iter_contacts(filters, **options)
+        return self.client.iter_subscriptions(filters=filters, **options)
+
+    def _since(self, mark):
+        for date_format in _DATE_FORMATS:
+            try:
+                since = datetime.strptime(mark[:19], date_format) - timedelta(seconds=self.overlap)
+            except ValueError:
+                continue
+            return since.strftime(date_format)
+        return mark
+
+    def changes(self, full=None):
+        """
+        Yields a `ChangeEvent` for every record created since the last
+        run. The first run, and runs with `full` set, scan every record and
+        also report records changed since they were last seen as updates and
+        records no longer present as deletes. Incremental runs do not see
+        changes to records created before the mark.
+
+        A record's fingerprint is stored once its event has been consumed,
+        so an interrupted run is resumed by the next one without
+        reporting consumed events twice. The mark only advances when the
+        generator is exhausted.
+        """
+        account_id, client_folder_id = self.client.resolve_folder(self.account_id, self.client_folder_id)
+        scope = 'a/%s/c/%s/%s' % (account_id, client_folder_id, self.resource)
+        mark_name = '%s:%s' % (scope, self.cursor_field)
+        mark = self.store.get_mark(mark_name)
+        if full is None:
+            full = mark is None
+
+        filters = dict(self.filters or {})
+        if not full:
+            filters[self.cursor_field] = self._since(mark)
+            filters['%sSearchType' % self.cursor_field] = 'gt'
+        if full:
+            # Runs sharing the store's connection keep their seen ids apart.
+            run = uuid.uuid4().hex
+            self.store.execute('CREATE TEMP TABLE IF NOT EXISTS sync_seen '
+                               '(run TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (run, id))')
+
+        newest = mark
+        consumed = []
+        try:
+            for record in self._records(filters):
+                record_id = str(record.get(self.id_field))
+                cursor = record.get(self.cursor_field)
+                if cursor and (newest is None or cursor > newest):
+                    newest = cursor
+                if full:
+                    self.store.execute('INSERT OR IGNORE INTO sync_seen (run, id) VALUES (?, ?)', (run, record_id))
+
+                fp = fingerprint(record, self.fields)
+                known = self.store.get_fingerprint(scope, record_id)
+                if known == fp:
+                    continue
+                yield ChangeEvent('insert' if known is None else 'update', self.resource, record_id, record)
+                consumed.append((record_id, fp))
+                if len(consumed) >= 500:
+                    self.store.set_fingerprints(scope, consumed)
+                    consumed = []
+
+            if full:
+                gone = self.store.execute(
+                    'SELECT id FROM fingerprints WHERE resource = ? AND id NOT IN '
+                    '(SELECT id FROM sync_seen WHERE run = ?)', (scope, run))
+                for (record_id,) in gone:
+                    yield ChangeEvent('delete', self.resource, record_id, None)
+                    self.store.delete_fingerprints(scope, [record_id])
+        finally:
+            self.store.set_fingerprints(scope, consumed)
+            if full:
+                self.store.execute('DELETE FROM sync_seen WHERE run = ?', (run,))
+
+        if newest is not None:
+            self.store.set_mark(mark_name, newest)
+
+    def run(self, handler, full=None):
+        """
+        Calls `handler(event)` for every change and returns the number of
+        events per action. As with `changes`, edits and deletes are only
+        reported by full runs; schedule one with `full=True` as often as
+        updates must be picked up.
+        """
+        counts = dict(insert=0, update=0, delete=0)
+        for event in self.changes(full):
+            handler(event)
+            counts[event.action] += 1
+        return counts
@@ -0,0 +1,251 @@
+"""
+Client performance benchmarks against `MockIContactServer`.
+
+Measures throughput, latency percentiles and peak memory of single calls,
+pagination, bulk upserts and statistics parsing, so regressions in client
+overhead are caught without touching the live API::
+
+    python -m icontact.tests.benchmarks
+    python -m icontact.tests.benchmarks --contacts 50000 --latency 0.005 --json results.json
+    python -m icontact.tests.benchmarks --baseline results.json --tolerance 0.2
+
+With `--baseline` the run fails (exit status 1) when a benchmark's
+throughput drops by more than the tolerance, or its peak memory grows
+by more than it.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from xml.etree import ElementTree
+
+from icontact.client import IContactClient
+from icontact.retry import RetryPolicy
+from icontact.tests.mockserver import MockIContactServer
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Result(object):
+    """Outcome of one benchmark."""
+
+    def __init__(self, name, operations, seconds, latencies=None, peak_memory=None):
+        self.name = name
+        self.operations = operations
+        self.seconds = seconds
+        self.latencies = latencies or []
+        self.peak_memory = peak_memory
+
+    @property
+    def throughput(self):
+        return self.operations / self.seconds if self.seconds else float('inf')
+
+    def as_dict(self):
+        return dict(name=self.name, operations=self.operations, seconds=self.seconds,
+                    throughput=self.throughput, p50=percentile(self.latencies, 0.5),
+                    p95=percentile(self.latencies, 0.95), p99=percentile(self.latencies, 0.99),
+                    peak_memory=self.peak_memory)
+
+
+class Benchmarks(object):
+    """
+    - server: a started `MockIContactServer`
+    - calls: number of single calls per single-call benchmark
+    - threads: worker threads of the concurrent benchmarks
+    - bulk_records: records written by the bulk upsert benchmark
+    """
+
+    def __init__(self, server, calls=200, threads=8, bulk_records=5000):
+        self.server = server
+        self.calls = calls
+        self.threads = threads
+        self.bulk_records = bulk_records
+
+    def client(self, **options):
+        options.setdefault('pool_maxsize', self.threads)
+        if self.server.error_rate or self.server.throttle_rate:
+            options.setdefault('retry_policy', RetryPolicy(max_attempts=10, backoff=0.01, retry_upserts=True))
+        return IContactClient('key', 'user', 'password', url=self.server.url,
+                              account_id=MockIContactServer.ACCOUNT_ID,
+                              client_folder_id=MockIContactServer.CLIENT_FOLDER_ID, **options)
+
+    def cases(self):
+        """(name, function) pairs; each function returns (operations, latencies)."""
+        return [
+            ('single_call', self.single_call),
+            ('concurrent_calls', self.concurrent_calls),
+            ('paginate', self.paginate),
+            ('paginate_streamed', self.paginate_streamed),
+            ('paginate_raw', self.paginate_raw),
+            ('bulk_upsert', self.bulk_upsert),
+            ('stats_parse', self.stats_parse),
+            ('stats_iterparse', self.stats_iterparse),
+        ]
+
+    def _timed_calls(self, func, count):
+        latencies = []
+        for i in range(count):
+            started = time.time()
+            func(i)
+            latencies.append(time.time() - started)
+        return count, latencies
+
+    def single_call(self):
+        with self.client() as client:
+            return self._timed_calls(
+                lambda i: client.search_contacts({'email': 'contact%d@example.com' % (i + 1)}), self.calls)
+
+    def concurrent_calls(self):
+        with self.client() as client:
+            def call(i):
+                started = time.time()
+                client.lists()
+                return time.time() - started
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                latencies = list(executor.map(call, range(self.calls)))
+        return len(latencies), latencies
+
+    def _paginate(self, **options):
+        with self.client() as client:
+            count = 0
+            for _ in client.iter_contacts(page_size=1000, **options):
+                count += 1
+        return count, []
+
+    def paginate(self):
+        return self._paginate()
+
+    def paginate_streamed(self):
+        return self._paginate(stream=True)
+
+    def paginate_raw(self):
+        return self._paginate(stream=True, raw=True)
+
+    def bulk_upsert(self):
+        records = (dict(email='bulk%d@example.com' % i, firstName='Bulk', lastName=str(i))
+                   for i in range(self.bulk_records))
+        with self.client() as client:
+            report = client.bulk_create_or_update_contact(records)
+        return report.processed, []
+
+    def _statistics(self, client):
+        message_id = self.server.data['messages'][0]['messageId']
+        response = client.session.get('%sa/%s/c/%s/messages/%s/statistics' % (
+            self.server.url, MockIContactServer.ACCOUNT_ID, MockIContactServer.CLIENT_FOLDER_ID, message_id))
+        return response.content
+
+    def stats_parse(self):
+        with self.client() as client:
+            document = self._statistics(client)
+            stats = client._parse_stats(ElementTree.fromstring(document).find('stats'))
+        return len(stats['contacts']), []
+
+    def stats_iterparse(self):
+        with self.client() as client:
+            document = self._statistics(client)
+            count = sum(1 for _ in client._iter_stats(document, summary={}))
+        return count, []
+
+    def run(self, names=None, memory=True):
+        """Runs the selected benchmarks (default: all) and returns their `Result`s."""
+        results = []
+        for name, func in self.cases():
+            if names and name not in names:
+                continue
+            started = time.time()
+            operations, latencies = func()
+            seconds = time.time() - started
+            peak = None
+            if memory:
+                # Measured in a second run, as tracing slows the code down.
+                tracemalloc.start()
+                try:
+                    func()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            results.append(Result(name, operations, seconds, latencies, peak))
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a message for every result that regressed against the baseline rows."""
+    previous = dict((row['name'], row) for row in baseline)
+    regressions = []
+    for result in results:
+        row = previous.get(result.name)
+        if row is None:
+            continue
+        if result.throughput < row['throughput'] * (1 - tolerance):
+            regressions.append('%s: throughput %.1f/s, baseline %.1f/s' % (
+                result.name, result.throughput, row['throughput']))
+        if result.peak_memory and row.get('peak_memory') and \
+                result.peak_memory > row['peak_memory'] * (1 + tolerance):
+            regressions.append('%s: peak memory %d bytes, baseline %d bytes' % (
+                result.name, result.peak_memory, row['peak_memory']))
+    return regressions
+
+
+def format_table(results):
+    def ms(value):
+        return '%.2f' % (value * 1000) if value is not None else '-'
+
+    lines = ['%-20s %10s %10s %12s %8s %8s %8s %10s' % (
+        'benchmark', 'ops', 'seconds', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'peak KiB')]
+    for result in results:
+        row = result.as_dict()
+        lines.append('%-20s %10d %10.3f %12.1f %8s %8s %8s %10s' % (
+            row['name'], row['operations'], row['seconds'], row['throughput'], ms(row['p50']),
+            ms(row['p95']), ms(row['p99']),
+            '%d' % (row['peak_memory'] // 1024) if row['peak_memory'] is not None else '-'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the iContact client against a local mock server.')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--contacts', type=int, default=10000, help='contacts served by the mock')
+    parser.add_argument('--stats-contacts', type=int, default=2000, help='contacts per statistics summary')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of 429 responses')
+    parser.add_argument('--calls', type=int, default=200, help='calls per single-call benchmark')
+    parser.add_argument('--threads', type=int, default=8, help='threads of the concurrent benchmark')
+    parser.add_argument('--bulk-records', type=int, default=5000, help='records of the bulk benchmark')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory measurement')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    server = MockIContactServer(contacts=args.contacts, stats_contacts=args.stats_contacts, latency=args.latency,
+                                error_rate=args.error_rate, throttle_rate=args.throttle_rate, retry_after=0)
+    with server:
+        benchmarks = Benchmarks(server, calls=args.calls, threads=args.threads, bulk_records=args.bulk_records)
+        results = benchmarks.run(args.benchmarks, memory=not args.no_memory)
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([result.as_dict() for result in results], f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print('REGRESSION %s' % message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""
+pytest fixtures running the client against a `MockIContactServer`.
+"""
+import pytest
+
+from icontact.client import IContactClient
+from icontact.tests.mockserver import MockIContactServer
+
+
+@pytest.fixture
+def server():
+    with MockIContactServer(contacts=50, lists=5, messages=2, stats_contacts=20) as server:
+        yield server
+
+
+@pytest.fixture
+def make_client(server):
+    """Returns a factory of clients of the mock server's client folder."""
+    clients = []
+
+    def make(api_key='key', username='user', **options):
+        options.setdefault('account_id', server.ACCOUNT_ID)
+        options.setdefault('client_folder_id', server.CLIENT_FOLDER_ID)
+        client = IContactClient(api_key, username, 'password', url=server.url, **options)
+        clients.append(client)
+        return client
+    yield make
+    for client in clients:
+        client.close()
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
@@ -0,0 +1,114 @@
+"""
+In-process stand-in for the iContact API, for tests that need responses
+but no server.
+
+`FakeAPI` answers every request with `handler(method, path, params, body)`:
+`path` is relative to the API root (e.g. 'a/100/c/200/contacts/'),
+`params` holds the query parameters and `body` the decoded JSON or form
+body, if any. The handler returns the JSON payload, or a
+`(status, payload)` or `(status, payload, headers)` tuple. The default
+account and client folder are looked up without calling the handler.
+
+`client()` returns a blocking client of the fake client folder, sending
+its requests through the transport adapter of `adapter()`. Async clients
+send theirs through the `httpx.AsyncClient` of `async_client()`.
+"""
+import collections
+import itertools
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from icontact.client import IContactClient
+
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    from urlparse import parse_qsl, urlsplit
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class FakeAPI(object):
+    ACCOUNT_ID = '100'
+    CLIENT_FOLDER_ID = '200'
+    _hosts = itertools.count(1)
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda method, path, params, body: {})
+        # A host of its own keeps the ids discovered by clients apart.
+        self.url = 'http://api%d.icontact.test/icp/' % next(self._hosts)
+        self.requests = collections.Counter()
+        self._folder = 'a/%s/c/%s/' % (self.ACCOUNT_ID, self.CLIENT_FOLDER_ID)
+
+    def respond(self, method, url, body):
+        """Returns the status, headers and body bytes answering a request."""
+        parts = urlsplit(url)
+        path = parts.path[len(urlsplit(self.url).path):]
+        params = dict(parse_qsl(parts.query))
+        if body:
+            body = body.decode('utf-8') if isinstance(body, bytes) else body
+            try:
+                body = json.loads(body)
+            except ValueError:
+                body = dict(parse_qsl(body))
+
+        if path == 'a':
+            resource, result = 'accounts', {'accounts': [{'accountId': self.ACCOUNT_ID}]}
+        elif path == 'a/%s/c/' % self.ACCOUNT_ID:
+            resource, result = 'clientfolders', {'clientfolders': [{'clientFolderId': self.CLIENT_FOLDER_ID}]}
+        else:
+            resource = path[len(self._folder):].split('/')[0] if path.startswith(self._folder) else path
+            result = self.handler(method.lower(), path, params, body or None)
+        self.requests['%s %s' % (method.upper(), resource)] += 1
+
+        status, headers = 200, {}
+        if isinstance(result, tuple):
+            status, result, headers = (result + ({},))[:3]
+        headers = dict(headers, **{'Content-Type': 'application/json'})
+        return status, headers, json.dumps(result).encode('utf-8')
+
+    def client(self, **options):
+        """An `IContactClient` of the fake client folder."""
+        options.setdefault('account_id', self.ACCOUNT_ID)
+        options.setdefault('client_folder_id', self.CLIENT_FOLDER_ID)
+        options.setdefault('adapter', self.adapter())
+        return IContactClient('key', 'user', 'password', url=self.url, **options)
+
+    def adapter(self):
+        """A `requests` transport adapter sending every request to this API."""
+        return FakeAdapter(self)
+
+    def async_client(self):
+        """An `httpx.AsyncClient` sending every request to this API."""
+        def handle(request):
+            status, headers, content = self.respond(request.method, str(request.url), request.content)
+            return httpx.Response(status, headers=headers, content=content)
+        return httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+
+class FakeAdapter(BaseAdapter):
+
+    def __init__(self, api):
+        super(FakeAdapter, self).__init__()
+        self.api = api
+
+    def send(self, request, **kwargs):
+        status, headers, content = self.api.respond(request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
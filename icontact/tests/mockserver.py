@@ -0,0 +1,296 @@
+"""
+Local stand-in for the iContact API, used by the benchmarks.
+
+`MockIContactServer` serves one account (`MockIContactServer.ACCOUNT_ID`)
+holding one client folder (`CLIENT_FOLDER_ID`) with generated contacts,
+lists, subscriptions, messages and sends, plus an XML statistics document
+per message. It understands `limit`/`offset` paging and equality filters,
+echoes POSTed records back with ids assigned and removes DELETEd ones.
+Form bodies are only accepted as the flat fields of one record. Latency,
+a page size cap and error or throttle responses can be injected::
+
+    with MockIContactServer(contacts=50000, latency=0.02, throttle_rate=0.01) as server:
+        client = IContactClient('key', 'user', 'password', url=server.url)
+        client.search_contacts({'email': 'contact1@example.com'})
+"""
+import json
+import random
+import re
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+
+_FOLDER_PATH = re.compile(r'^/icp/a/(\d+)/c/(\d+)/(\w+)/(?:([^/]+)/?(\w+)?/?)?$')
+
+XLINK = 'http://www.w3.org/1999/xlink'
+
+STATS_SUMMARIES = ('released', 'bounces', 'unsubscribes', 'opens', 'clicks', 'forwards', 'comments',
+                   'complaintss')
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Headers and body are written separately; without this, delayed
+        # ACKs add ~40ms to every keep-alive response.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        server = self.server.mock
+        status, payload, content_type, headers = server.dispatch(method, url.path, dict(parse_qsl(url.query)), body)
+        self._respond(status, payload, content_type, headers)
+
+    def do_GET(self):
+        self._handle('get')
+
+    def do_POST(self):
+        self._handle('post')
+
+    def do_PUT(self):
+        self._handle('put')
+
+    def do_DELETE(self):
+        self._handle('delete')
+
+
+class MockIContactServer(object):
+    """
+    - contacts, lists, messages: number of generated records
+    - subscriptions_per_contact: lists each contact is subscribed to
+    - stats_contacts: contacts listed under each summary of a message's
+      statistics document
+    - latency: seconds added to every response
+    - max_page_size: largest `limit` honoured by collection endpoints
+    - error_rate: fraction of requests answered with a 500 error
+    - throttle_rate: fraction of requests answered with a 429 and a
+      `Retry-After` of `retry_after` seconds
+    - seed: seed of the error and throttle injection
+    - reject: (Optional) callable `reject(resource, record)` returning a
+      warning for POSTed records to refuse. Refused records are left out
+      of the response and their warnings listed in its `warnings`.
+    """
+
+    ACCOUNT_ID = '100'
+    CLIENT_FOLDER_ID = '200'
+
+    def __init__(self, contacts=10000, lists=20, messages=20, subscriptions_per_contact=1, stats_contacts=1000,
+                 latency=0.0, max_page_size=10000, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=0,
+                 host='127.0.0.1', port=0, reject=None):
+        self.latency = latency
+        self.reject = reject
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stats_contacts = stats_contacts
+        self.host = host
+        self.port = port
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._stats = {}
+
+        self.data = dict(contacts=[], lists=[], subscriptions=[], messages=[], sends=[])
+        for i in range(1, lists + 1):
+            self.data['lists'].append(dict(listId=str(i), name='List %d' % i, publicname='List %d' % i,
+                                           description='', emailOwnerOnChange='0', welcomeOnManualAdd='0',
+                                           welcomeOnSignupAdd='0', welcomeMessageId='0'))
+        for i in range(1, contacts + 1):
+            self.data['contacts'].append(dict(
+                contactId=str(i), email='contact%d@example.com' % i, prefix='', firstName='First%d' % i,
+                lastName='Last%d' % i, suffix='', street='%d Main St' % i, street2='', city='Springfield',
+                state='NC', postalCode='27601', phone='', fax='', business='', status='normal',
+                createDate='2020-01-%02d %02d:%02d:00' % (1 + i % 28, i % 24, i % 60), bounceCount='0'))
+            for j in range(subscriptions_per_contact):
+                list_id = str(1 + (i + j) % max(lists, 1))
+                self.data['subscriptions'].append(dict(
+                    subscriptionId='%s_%d' % (list_id, i), contactId=str(i), listId=list_id, status='normal',
+                    addDate='2020-02-01 00:00:00', confirmationMessageId=''))
+        for i in range(1, messages + 1):
+            self.data['messages'].append(dict(
+                messageId=str(i), subject='Message %d' % i, messageType='normal', messageName='message-%d' % i,
+                campaignId='1', htmlBody='<p>%s</p>' % ('lorem ipsum ' * 50), textBody='lorem ipsum ' * 50,
+                createDate='2020-03-01 00:00:00'))
+        self._next_id = contacts + 1
+
+    @property
+    def url(self):
+        return 'http://%s:%s/icp/' % self._server.server_address[:2]
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.mock = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='icontact-mock-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+
+    def _count(self, method, resource):
+        key = '%s %s' % (method.upper(), resource)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            return self._random.random()
+
+    def dispatch(self, method, path, query, body):
+        """Returns (status, body, content type, headers) for a request."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        match = _FOLDER_PATH.match(path)
+        resource = match.group(3) if match else path
+        roll = self._count(method, resource)
+        if roll < self.throttle_rate:
+            return 429, {'errors': ['Too Many Requests']}, 'application/json', {'Retry-After': str(self.retry_after)}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'errors': ['Internal Server Error']}, 'application/json', None
+
+        if path == '/icp/a':
+            return self._ok({'accounts': [{'accountId': self.ACCOUNT_ID, 'enabled': 1}]})
+        if path in ('/icp/a/%s/c' % self.ACCOUNT_ID, '/icp/a/%s/c/' % self.ACCOUNT_ID):
+            return self._ok({'clientfolders': [{'clientFolderId': self.CLIENT_FOLDER_ID}], 'total': 1})
+        if match is None or match.group(1) != self.ACCOUNT_ID or match.group(2) != self.CLIENT_FOLDER_ID:
+            return 404, {'errors': ['Not Found']}, 'application/json', None
+
+        resource, record_id, sub = match.group(3), match.group(4), match.group(5)
+        if resource not in self.data:
+            return 404, {'errors': ['Not Found']}, 'application/json', None
+        if sub == 'statistics' and resource == 'messages':
+            return 200, self._statistics(record_id), 'text/xml', None
+        if method == 'get':
+            if record_id:
+                return self._get(resource, record_id)
+            return self._collection(resource, query)
+        if method == 'post' and not record_id:
+            return self._create(resource, body)
+        if method == 'put' and record_id:
+            return 400, {'errors': ['No Changes Made']}, 'application/json', None
+        if method == 'delete' and record_id:
+            return self._delete(resource, record_id)
+        return 405, {'errors': ['Method Not Allowed']}, 'application/json', None
+
+    @staticmethod
+    def _ok(payload):
+        return 200, payload, 'application/json', None
+
+    def _get(self, resource, record_id):
+        singular = resource[:-1]
+        for record in self.data[resource]:
+            if record.get('%sId' % singular) == record_id:
+                return self._ok({singular: record})
+        return 404, {'errors': ['Not Found']}, 'application/json', None
+
+    def _delete(self, resource, record_id):
+        id_field = '%sId' % resource[:-1]
+        with self._lock:
+            records = self.data[resource]
+            for i, record in enumerate(records):
+                if record.get(id_field) == record_id:
+                    del records[i]
+                    return self._ok({})
+        return 404, {'errors': ['Not Found']}, 'application/json', None
+
+    def _collection(self, resource, query):
+        limit = min(int(query.pop('limit', 20)), self.max_page_size)
+        offset = int(query.pop('offset', 0))
+        records = self.data[resource]
+        filters = dict((k, v) for k, v in query.items() if not k.endswith('SearchType'))
+        if filters:
+            records = [r for r in records if all(str(r.get(k)) == v for k, v in filters.items())]
+        return self._ok({resource: records[offset:offset + limit], 'limit': limit, 'offset': offset,
+                         'total': len(records)})
+
+    def _create(self, resource, body):
+        singular = resource[:-1]
+        try:
+            payload = json.loads(body.decode('utf-8')) if body else []
+        except ValueError:
+            # Form encoded single record. A nested record, encoded by
+            # requests as its field names (`contact=email&contact=status`),
+            # is refused like the API does.
+            fields = parse_qsl(body.decode('utf-8'))
+            payload = [dict(fields)]
+            if singular in payload[0] or len(payload[0]) != len(fields):
+                return 400, {'errors': ['Invalid %s data' % singular]}, 'application/json', None
+        if isinstance(payload, dict):
+            payload = list(payload.values())
+        created, warnings = [], []
+        with self._lock:
+            for record in payload:
+                record = dict(record)
+                warning = self.reject(resource, record) if self.reject is not None else None
+                if warning:
+                    warnings.append(warning)
+                    continue
+                if not record.get('%sId' % singular):
+                    record['%sId' % singular] = str(self._next_id)
+                    self._next_id += 1
+                created.append(record)
+        return self._ok({resource: created, 'warnings': warnings})
+
+    def _statistics(self, message_id):
+        """An XML statistics document for the message, built once."""
+        document = self._stats.get(message_id)
+        if document is None:
+            parts = ['<?xml version="1.0" encoding="UTF-8"?>',
+                     '<response xmlns:xlink="%s"><stats>' % XLINK]
+            contacts = self.data['contacts'][:self.stats_contacts]
+            for tag in STATS_SUMMARIES:
+                parts.append('<%s count="%d" unique="%d" percent="12.5" xlink:href="/stats/%s">' % (
+                    tag, len(contacts), len(contacts), tag))
+                for contact in contacts:
+                    parts.append('<contact email="%s" name="%s %s" xlink:href="/contacts/%s">'
+                                 '<event date="2020-03-0%dT10:%02d:00-05:00"/></contact>' % (
+                                     contact['email'], contact['firstName'], contact['lastName'],
+                                     contact['contactId'], 1 + int(contact['contactId']) % 9,
+                                     int(contact['contactId']) % 60))
+                parts.append('</%s>' % tag)
+            parts.append('</stats></response>')
+            document = self._stats[message_id] = ''.join(parts).encode('utf-8')
+        return document
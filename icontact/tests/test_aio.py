@@ -0,0 +1,144 @@
+"""
+Tests of `icontact.aio.AsyncIContactClient`.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('httpx')
+
+from icontact.aio import AsyncIContactClient
+from icontact.client import IContactServerError
+from icontact.tests.fakes import FakeAPI
+
+CONTACTS = [{'contactId': str(i), 'email': 'contact%d@example.com' % i} for i in range(1, 51)]
+
+
+def _contacts(method, path, params, body):
+    if method == 'get' and path.endswith('/contacts/'):
+        found = [c for c in CONTACTS if params.get('email', c['email']) == c['email']]
+        offset, limit = int(params.get('offset', 0)), int(params.get('limit', len(found)))
+        return {'contacts': found[offset:offset + limit], 'total': len(found)}
+    if method == 'put':
+        return 400, {'errors': ['No Changes Made']}
+    if method == 'post':
+        return {path.split('/')[4]: body if isinstance(body, list) else list(body.values())}
+    return {}
+
+
+def _run(api, func, **options):
+    async def main():
+        async with AsyncIContactClient('key', 'user', 'password', url=api.url, http_client=api.async_client(),
+                                       **options) as client:
+            return await func(client)
+    return asyncio.run(main())
+
+
+def test_default_folder_is_resolved():
+    api = FakeAPI(_contacts)
+
+    async def search(client):
+        return await client.search_contacts({'email': 'contact2@example.com'})
+    assert [c.contactId for c in _run(api, search).contacts] == ['2']
+    assert (api.requests['GET accounts'], api.requests['GET clientfolders']) == (1, 1)
+
+
+def test_resolve_folder():
+    api = FakeAPI(_contacts)
+
+    async def resolve(client):
+        return [await client.resolve_folder(), await client.resolve_folder('1', '2')]
+    assert _run(api, resolve) == [(api.ACCOUNT_ID, api.CLIENT_FOLDER_ID), ('1', '2')]
+    assert (api.requests['GET accounts'], api.requests['GET clientfolders']) == (1, 1)
+
+
+def test_given_ids_are_not_looked_up():
+    api = FakeAPI(_contacts)
+
+    async def calls(client):
+        await client.search_contacts({'email': 'contact2@example.com'}, api.ACCOUNT_ID, api.CLIENT_FOLDER_ID)
+        [c async for c in client.iter_contacts(account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID)]
+        await client.create_contact('new@example.com', account_id=api.ACCOUNT_ID,
+                                    client_folder_id=api.CLIENT_FOLDER_ID)
+    _run(api, calls)
+    assert (api.requests['GET accounts'], api.requests['GET clientfolders']) == (0, 0)
+
+    async def folder_only(client):
+        await client.lists(client_folder_id=api.CLIENT_FOLDER_ID)
+        await client.update_contact('3', client_folder_id=api.CLIENT_FOLDER_ID, lastName='Changed')
+    _run(api, folder_only)
+    assert (api.requests['GET accounts'], api.requests['GET clientfolders']) == (1, 0)
+
+
+def test_iter_methods_are_async_generators():
+    api = FakeAPI(_contacts)
+
+    async def collect(client):
+        return [c.contactId async for c in client.iter_contacts(page_size=20)]
+    assert _run(api, collect) == [str(i) for i in range(1, 51)]
+    assert api.requests['GET contacts'] == 3
+
+
+def test_writes():
+    api = FakeAPI(_contacts)
+
+    async def write(client):
+        await client.create_contact('new@example.com', firstName='New')
+        await client.update_contact('3', lastName='Changed')
+        subscribed = await client.create_or_update_subscription(data={'contactId': '3', 'listId': '2'})
+        await client.delete_contact('3')
+        return subscribed
+    subscribed = _run(api, write)
+    assert [(s.contactId, s.listId) for s in subscribed.subscriptions] == [('3', '2')]
+    assert (api.requests['POST contacts'], api.requests['POST subscriptions'],
+            api.requests['DELETE contacts']) == (2, 1, 1)
+
+
+def test_server_errors_are_raised_when_awaited():
+    async def move(client):
+        with pytest.raises(IContactServerError) as error:
+            await client.move_subscriber('1', '7', '2')
+        return error.value
+    assert _run(FakeAPI(_contacts), move).errors == ['No Changes Made']
+
+
+def test_bulk_upsert_reports_every_record():
+    api = FakeAPI(lambda method, path, params, body: {
+        'contacts': [r for r in body if '@' in r['email']],
+        'warnings': ['Invalid email: %s' % r['email'] for r in body if '@' not in r['email']]})
+    records = [{'email': 'new%d@example.com' % i} for i in range(11)] + [{'email': 'invalid'}]
+
+    async def upsert(client):
+        return await client.bulk_create_or_update_contact(iter(records), chunk_size=5)
+    report = _run(api, upsert)
+    assert (report.processed, report.errors, report.chunks) == (12, 1, 3)
+    assert [r.record for r in report.failed] == [{'email': 'invalid'}]
+    assert [r.result.email for r in report.succeeded] == [r['email'] for r in records[:11]]
+
+
+def test_streaming_is_refused():
+    api = FakeAPI(_contacts)
+
+    async def stream(client):
+        with pytest.raises(TypeError):
+            await client._do_request('a/%s/c/%s/contacts/' % (api.ACCOUNT_ID, api.CLIENT_FOLDER_ID),
+                                     stream='contacts')
+        with pytest.raises(TypeError):
+            async for _ in client.iter_contacts(stream=True):
+                pass
+    _run(api, stream, account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID)
+    assert api.requests['GET contacts'] == 0
+
+
+def test_email_lookups():
+    api = FakeAPI(_contacts)
+
+    emails = ['contact5@example.com', 'nobody@example.com', 'contact6@example.com']
+
+    async def lookup(client):
+        return (await client.find_contact_by_email('contact4@example.com'),
+                await client.contact_ids_for_emails(emails, workers=2))
+    found, many = _run(api, lookup, account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID)
+    assert found == '4'
+    assert many == {'contact5@example.com': '5', 'contact6@example.com': '6'}
+    assert api.requests['GET contacts'] == 4
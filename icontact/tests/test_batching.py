@@ -0,0 +1,98 @@
+"""
+Tests of `icontact.batching.WriteBatcher`.
+"""
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from icontact.batching import WriteBatcher
+from icontact.client import json_to_obj
+from icontact.tests.fakes import FakeAPI
+
+
+def _echo(dropped=(), calls=None):
+    """A `send` returning every record but those whose email is in `dropped`."""
+    def send(records):
+        if calls is not None:
+            calls.append(list(records))
+        returned = [dict(r, contactId=str(100 + i)) for i, r in enumerate(records) if r['email'] not in dropped]
+        warnings = ['Invalid email: %s' % e for e in dropped if e in [r['email'] for r in records]]
+        return json_to_obj({'contacts': returned, 'warnings': warnings})
+    return send
+
+
+def test_results_are_routed_to_their_records():
+    calls = []
+    send = _echo(dropped=['c@example.com'], calls=calls)
+    with WriteBatcher(max_delay=0.2, max_batch=10) as batcher:
+        futures = [batcher.submit('contacts', send, 'contacts', {'email': email})
+                   for email in ('a@example.com', 'b@example.com', 'c@example.com', 'd@example.com')]
+        results = [future.result(5) for future in futures]
+    assert len(calls) == 1
+    assert [r.contacts[0].email if r.contacts else None for r in results] == [
+        'a@example.com', 'b@example.com', None, 'd@example.com']
+    assert results[2].warnings == ['Invalid email: c@example.com']
+
+
+def test_batches_are_kept_apart_per_key():
+    calls = []
+    send = _echo(calls=calls)
+    with WriteBatcher(max_delay=0.2) as batcher:
+        first = batcher.submit('folder-1', send, 'contacts', {'email': 'a@example.com'})
+        second = batcher.submit('folder-2', send, 'contacts', {'email': 'b@example.com'})
+        assert first.result(5).contacts[0].email == 'a@example.com'
+        assert second.result(5).contacts[0].email == 'b@example.com'
+    assert sorted(len(c) for c in calls) == [1, 1]
+
+
+def test_full_batches_are_posted_without_waiting():
+    calls = []
+    send = _echo(calls=calls)
+    with WriteBatcher(max_delay=60, max_batch=3) as batcher:
+        futures = [batcher.submit('contacts', send, 'contacts', {'email': '%d@example.com' % i}) for i in range(3)]
+        assert [f.result(5).contacts[0].email for f in futures] == ['0@example.com', '1@example.com', '2@example.com']
+
+
+def test_a_failed_call_fails_every_record_of_the_batch():
+    def send(records):
+        raise IOError('connection reset')
+    with WriteBatcher(max_delay=0.05) as batcher:
+        futures = [batcher.submit('contacts', send, 'contacts', {'email': '%d@example.com' % i}) for i in range(2)]
+        for future in futures:
+            with pytest.raises(IOError):
+                future.result(5)
+
+
+def _subscribe(method, path, params, body):
+    records = body if isinstance(body, list) else [body]
+    return {'subscriptions': [r for r in records if r['listId'] != '3'],
+            'warnings': ['Rejected' for r in records if r['listId'] == '3']}
+
+
+def test_client_writes_from_many_threads_get_their_own_results():
+    api = FakeAPI(_subscribe)
+    with WriteBatcher(max_delay=0.05) as batcher:
+        client = api.client(write_batcher=batcher)
+
+        def subscribe(contact_id):
+            list_id = str(1 + int(contact_id) % 5)
+            return list_id, client.create_subscription(contact_id, list_id)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = dict(zip(range(1, 41), executor.map(subscribe, [str(i) for i in range(1, 41)])))
+    assert api.requests['POST subscriptions'] < 40
+    for contact_id, (list_id, result) in results.items():
+        if list_id == '3':
+            assert result.subscriptions == []
+        else:
+            assert [(s.contactId, s.listId) for s in result.subscriptions] == [(str(contact_id), list_id)]
+
+
+def test_submit_after_close_is_refused():
+    batcher = WriteBatcher()
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit('contacts', _echo(), 'contacts', {'email': 'a@example.com'})
+    assert not [t for t in threading.enumerate() if t.name == 'icontact-write-batcher' and t.is_alive()]
@@ -0,0 +1,123 @@
+"""
+Tests of `icontact.bulk`.
+"""
+import pytest
+
+from icontact.bulk import BulkUpsert, iter_chunks, match_records
+from icontact.client import json_to_obj
+from icontact.tests.fakes import FakeAPI
+
+
+def _response(collection, records, warnings=()):
+    return json_to_obj({collection: records, 'warnings': list(warnings)})
+
+
+def test_chunks_are_bounded_by_count_and_size():
+    records = [{'email': '%d@example.com' % i} for i in range(7)]
+    assert [len(c) for c in iter_chunks(records, 3)] == [3, 3, 1]
+    assert [[i for i, _ in c] for c in iter_chunks(records, 100, max_bytes=60)] == [[0, 1], [2, 3], [4, 5], [6]]
+
+
+def test_records_are_paired_in_order_when_all_are_returned():
+    chunk = list(enumerate([{'email': 'a@example.com'}, {'email': 'b@example.com'}]))
+    response = _response('contacts', [{'contactId': '1', 'email': 'a@example.com'},
+                                      {'contactId': '2', 'email': 'b@example.com'}])
+    outcomes, warnings = match_records(chunk, response, 'contacts')
+    assert [o.result.contactId for o in outcomes] == ['1', '2']
+    assert warnings == []
+
+
+def test_rejected_contacts_get_the_warning_naming_them():
+    chunk = list(enumerate([{'email': 'a@example.com'}, {'email': 'bad'}, {'email': 'c@example.com'},
+                            {'email': 'worse'}]))
+    response = _response('contacts', [{'contactId': '3', 'email': 'c@example.com'},
+                                      {'contactId': '1', 'email': 'a@example.com'}],
+                         ['Invalid email: bad', 'Invalid email: worse'])
+    outcomes, warnings = match_records(chunk, response, 'contacts')
+    assert [(o.ok, o.result.contactId if o.ok else None) for o in outcomes] == [
+        (True, '1'), (False, None), (True, '3'), (False, None)]
+    assert [o.warnings for o in outcomes] == [[], ['Invalid email: bad'], [], ['Invalid email: worse']]
+    assert warnings == ['Invalid email: bad', 'Invalid email: worse']
+
+
+def test_unattributed_warnings_go_to_every_rejected_record():
+    chunk = list(enumerate([{'email': 'a@example.com'}, {'email': 'b@example.com'}, {'email': 'c@example.com'}]))
+    response = _response('contacts', [{'contactId': '1', 'email': 'a@example.com'}], ['Records skipped'])
+    outcomes, _ = match_records(chunk, response, 'contacts')
+    assert [o.warnings for o in outcomes] == [[], ['Records skipped'], ['Records skipped']]
+
+
+def test_custom_objects_are_paired_by_the_values_they_echo():
+    chunk = list(enumerate([{'orderId': 'A1', 'total': 10}, {'orderId': 'A2', 'total': -1},
+                            {'orderId': 'A3', 'total': 30}]))
+    response = _response('data', [{'dataId': '7', 'orderId': 'A1', 'total': '10'},
+                                  {'dataId': '8', 'orderId': 'A3', 'total': '30'}], ['Invalid total for A2'])
+    outcomes, _ = match_records(chunk, response, 'data')
+    assert [o.result.dataId if o.ok else None for o in outcomes] == ['7', None, '8']
+    assert outcomes[1].warnings == ['Invalid total for A2']
+
+
+def test_custom_objects_are_paired_by_match_keys():
+    chunk = list(enumerate([{'orderId': 'A1', 'note': 'First'}, {'orderId': 'A2', 'note': 'Second'}]))
+    # Returned out of order and with the note rewritten by the server.
+    response = _response('data', [{'dataId': '8', 'orderId': 'A2', 'note': 'second'}])
+    outcomes, _ = match_records(chunk, response, 'data', match_keys=[('orderId',)])
+    assert [o.result.dataId if o.ok else None for o in outcomes] == [None, '8']
+
+
+def test_records_skipped_as_unchanged():
+    first, second = {'email': 'a@example.com'}, {'email': 'b@example.com'}
+    response = _response('contacts', [{'contactId': '2', 'email': 'b@example.com'}])
+    response.skipped = [first]
+    outcomes, _ = match_records(list(enumerate([first, second])), response, 'contacts')
+    assert sorted((o.index, o.skipped, o.ok) for o in outcomes) == [(0, True, True), (1, False, True)]
+
+
+def test_bulk_upsert_reports_every_record_in_order():
+    calls = []
+    progress = []
+
+    def send(records):
+        calls.append(len(records))
+        return _response('data', [dict(r, dataId=str(r['n'])) for r in records if r['n'] % 10],
+                         ['Rejected %d' % r['n'] for r in records if not r['n'] % 10])
+    upsert = BulkUpsert(send, 'data', chunk_size=7, workers=3, match_keys=[('n',)],
+                        progress=lambda report: progress.append(report.processed))
+    report = upsert.run({'n': n} for n in range(1, 51))
+    assert sum(calls) == 50 and max(calls) == 7
+    assert (report.processed, report.errors, report.chunks) == (50, 5, len(calls))
+    assert [r.index for r in report] == list(range(50))
+    assert [(r.record['n'], r.warnings) for r in report.failed] == [
+        (n, ['Rejected %d' % n]) for n in (10, 20, 30, 40, 50)]
+    assert sorted(progress)[-1] == 50
+
+
+def test_failed_chunks_fail_each_of_their_records():
+    def send(records):
+        if records[0]['n'] == 0:
+            raise IOError('connection reset')
+        return _response('data', records)
+    report = BulkUpsert(send, 'data', chunk_size=2, workers=1).run({'n': n} for n in range(5))
+    assert [(r.index, r.ok) for r in report] == [(0, False), (1, False), (2, True), (3, True), (4, True)]
+    assert isinstance(report.records[0].error, IOError)
+
+
+def _upsert_contacts(method, path, params, body):
+    """Returns the posted contacts with an id, rejecting emails without '@'."""
+    accepted = [dict(r, contactId=str(i)) for i, r in enumerate(body, 1) if '@' in r['email']]
+    return {'contacts': accepted, 'warnings': ['Invalid email: %s' % r['email'] for r in body if '@' not in r['email']]}
+
+
+def test_client_bulk_upsert():
+    api = FakeAPI(_upsert_contacts)
+    records = [{'email': 'new%d@example.com' % i} for i in range(9)] + [{'email': 'invalid'}]
+    report = api.client().bulk_create_or_update_contact(iter(records), chunk_size=4, workers=2)
+    assert (report.processed, report.errors, report.chunks) == (10, 1, 3)
+    assert [(r.record, r.warnings) for r in report.failed] == [({'email': 'invalid'}, ['Invalid email: invalid'])]
+    assert api.requests['POST contacts'] == 3
+
+
+@pytest.mark.parametrize('option', ['chunk', 'color'])
+def test_unknown_bulk_options_are_refused(option):
+    with pytest.raises(TypeError):
+        FakeAPI().client().bulk_create_or_update_contact([], **{option: 1})
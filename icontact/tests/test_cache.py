@@ -0,0 +1,82 @@
+"""
+Tests of `icontact.cache` and of the caches used by the client.
+"""
+from icontact.cache import FileCache, MemoryCache, ResponseCache
+from icontact.client import IContactClient
+from icontact.tests.fakes import FakeAPI
+
+
+def _client(api, username='user', **options):
+    return IContactClient('key', username, 'password', url=api.url, adapter=api.adapter(), **options)
+
+
+def _discoveries(api):
+    return api.requests['GET accounts'], api.requests['GET clientfolders']
+
+
+def test_memory_cache_evicts_the_least_recently_used_entry():
+    cache = MemoryCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert [cache.get(k) for k in 'abc'] == [1, None, 3]
+
+
+def test_entries_expire(tmp_path):
+    for cache in (MemoryCache(), FileCache(str(tmp_path))):
+        cache.set('a', {'id': '1'}, ttl=-1)
+        cache.set('b', {'id': '2'}, ttl=60)
+        assert (cache.get('a'), cache.get('b')) == (None, {'id': '2'})
+
+
+def test_clients_share_discovered_folders():
+    api = FakeAPI()
+    first, second = _client(api), _client(api)
+    assert first._required_values(None, None) == (api.ACCOUNT_ID, api.CLIENT_FOLDER_ID)
+    assert second._required_values(None, None) == (api.ACCOUNT_ID, api.CLIENT_FOLDER_ID)
+    assert _discoveries(api) == (1, 1)
+
+    # Other credentials look their folder up again.
+    _client(api, username='other')._required_values(None, None)
+    assert _discoveries(api) == (2, 2)
+
+
+def test_discovery_cache_can_be_shared_between_processes_or_disabled(tmp_path):
+    api = FakeAPI()
+    for _ in range(2):
+        _client(api, discovery_cache=FileCache(str(tmp_path)))._required_values(None, None)
+    assert _discoveries(api) == (1, 1)
+
+    for _ in range(2):
+        _client(api, discovery_cache=None)._required_values(None, None)
+    assert _discoveries(api) == (3, 3)
+
+
+def test_writes_invalidate_cached_responses():
+    api = FakeAPI(lambda method, path, params, body: {'lists': [{'listId': '1'}]})
+    client = api.client(response_cache=ResponseCache())
+    client.lists()
+    client.lists()
+    assert api.requests['GET lists'] == 1
+
+    client.create_list('New list', 0, 0, 0, 0)
+    client.lists()
+    assert api.requests['GET lists'] == 2
+
+    # Subscriptions change the subscriber counts of lists.
+    client.create_subscription('1', '1')
+    client.lists()
+    assert api.requests['GET lists'] == 3
+
+
+def test_raw_results_do_not_share_the_cached_response():
+    api = FakeAPI(lambda method, path, params, body: {'lists': [{'listId': '1', 'name': 'List 1'}]})
+    client = api.client(response_cache=ResponseCache())
+    stored = client.lists(raw=True)
+    stored['lists'][0]['name'] = 'Changed'
+    served = client.lists(raw=True)
+    assert served['lists'][0]['name'] == 'List 1'
+    served['lists'].append({'listId': '2'})
+    assert [entry.listId for entry in client.lists().lists] == ['1']
+    assert api.requests['GET lists'] == 1
@@ -0,0 +1,97 @@
+"""
+Tests of the record and replay transports of `icontact.cassette`.
+"""
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from icontact.cassette import Cassette, CassetteError, RecordingTransport, ReplayTransport
+from icontact.client import IContactClient
+
+OFFLINE_URL = 'http://offline.icontact.test/icp/'
+
+
+def _record(server, make_client, path, calls):
+    with Cassette(path) as cassette:
+        client = make_client(transport=RecordingTransport(cassette))
+        return [call(client) for call in calls]
+
+
+def _replay(server, path, **options):
+    replay = ReplayTransport(Cassette(path), speed=None)
+    return IContactClient('key', 'user', 'password', url=OFFLINE_URL, account_id=server.ACCOUNT_ID,
+                          client_folder_id=server.CLIENT_FOLDER_ID, transport=replay, **options)
+
+
+def _search(email):
+    return lambda client: [c.contactId for c in client.search_contacts({'email': email}).contacts]
+
+
+def _upsert(email):
+    return lambda client: [c.email for c in client.create_or_update_contact(data={'email': email}).contacts]
+
+
+def test_recorded_calls_are_replayed_without_the_server(server, make_client, tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    recorded = _record(server, make_client, path, [
+        _search('contact1@example.com'),
+        _upsert('new@example.com'),
+    ])
+    requests_made = dict(server.requests)
+
+    client = _replay(server, path)
+    assert _search('contact1@example.com')(client) == recorded[0]
+    assert _upsert('new@example.com')(client) == recorded[1]
+    assert server.requests == requests_made
+    with pytest.raises(CassetteError):
+        client.search_contacts({'email': 'contact2@example.com'})
+
+    with gzip.open(path, 'rt') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0] == {'version': 1}
+    assert 'password' not in json.dumps(lines[1:])
+
+
+def test_a_second_session_is_appended(server, make_client, tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    first = _record(server, make_client, path, [_search('contact1@example.com')])
+    second = _record(server, make_client, path, [_search('contact2@example.com')])
+    assert len(Cassette(path)) == 2
+
+    client = _replay(server, path)
+    assert _search('contact1@example.com')(client) == first[0]
+    assert _search('contact2@example.com')(client) == second[0]
+    with gzip.open(path, 'rt') as f:
+        assert sum(1 for line in f if 'version' in json.loads(line)) == 1
+
+
+def test_repeated_calls_replay_in_order(server, make_client, tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    search = lambda client: client.search_contacts({'email': 'new@example.com'}).total
+
+    def add_contact(client):
+        server.data['contacts'].append({'contactId': '1000', 'email': 'new@example.com'})
+    recorded = _record(server, make_client, path, [search, add_contact, search])
+    assert (recorded[0], recorded[2]) == (0, 1)
+
+    client = _replay(server, path)
+    assert [search(client) for _ in range(3)] == [0, 1, 1]
+    client.transport.rewind()
+    assert search(client) == 0
+
+
+def test_async_replay(server, make_client, tmp_path):
+    pytest.importorskip('httpx')
+    from icontact.aio import AsyncIContactClient
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    recorded = _record(server, make_client, path, [_search('contact3@example.com')])
+
+    async def main():
+        async with AsyncIContactClient('key', 'user', 'password', url=OFFLINE_URL,
+                                       account_id=server.ACCOUNT_ID, client_folder_id=server.CLIENT_FOLDER_ID,
+                                       transport=ReplayTransport(Cassette(path), speed=None)) as client:
+            result = await client.search_contacts({'email': 'contact3@example.com'})
+            return [c.contactId for c in result.contacts]
+    assert asyncio.run(main()) == recorded[0]
@@ -0,0 +1,87 @@
+"""
+Tests of the `icontact` command line export and import against `MockIContactServer`.
+"""
+import csv
+import json
+import os
+import socket
+
+import pytest
+
+from icontact import cli
+
+
+@pytest.fixture
+def run(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+
+    def run(*argv):
+        return cli.main(['--api-key', 'key', '--username', 'user', '--password', 'password', '--url', server.url,
+                         '--processes', '2'] + list(argv))
+    return run
+
+
+def _lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_export(run):
+    assert run('export', 'contacts', 'contacts.ndjson', '--shard-size', '20', '--page-size', '7') == 0
+    assert [r['contactId'] for r in _lines('contacts.ndjson')] == [str(i) for i in range(1, 51)]
+    assert sorted(os.listdir('.')) == ['contacts.ndjson']
+
+
+def test_resumed_export_follows_the_stored_plan(server, run):
+    job = dict(command='export', resource='contacts', custom_object_id=None, filters={},
+               output=os.path.abspath('contacts.ndjson'), format='ndjson', shard_size=20)
+    checkpoint = cli.Checkpoint('contacts.ndjson.checkpoint', job, lambda: [[0, 0, 20], [1, 20, 20], [2, 40, 10]])
+    os.makedirs('contacts.ndjson.parts')
+    with open(os.path.join('contacts.ndjson.parts', '000000'), 'w') as f:
+        f.write('{"contactId": "exported before"}\n')
+    checkpoint.add(0)
+    checkpoint.close()
+
+    # Records added since the export started are not part of it.
+    for i in range(51, 71):
+        server.data['contacts'].append(dict(contactId=str(i), email='contact%d@example.com' % i))
+    assert run('export', 'contacts', 'contacts.ndjson', '--shard-size', '20') == 0
+    ids = [r['contactId'] for r in _lines('contacts.ndjson')]
+    assert ids == ['exported before'] + [str(i) for i in range(21, 51)]
+
+
+def test_export_of_another_job_is_refused(run):
+    cli.Checkpoint('contacts.ndjson.checkpoint', dict(command='import'), lambda: []).close()
+    with pytest.raises(SystemExit):
+        run('export', 'contacts', 'contacts.ndjson')
+
+
+def test_rejected_records_are_reported_with_their_input_line(server, run):
+    server.reject = lambda resource, record: 'Invalid email' if '@' not in record['email'] else None
+    with open('contacts.ndjson', 'w') as f:
+        for email in ('a@example.com', 'b@example.com', 'invalid', 'c@example.com', 'd@example.com'):
+            f.write(json.dumps(dict(email=email)) + '\n')
+    assert run('import', 'contacts', 'contacts.ndjson', '--chunk-size', '2') == 1
+    assert _lines('contacts.ndjson.errors') == [dict(line=3, record=dict(email='invalid'), error='Invalid email')]
+    assert server.requests['POST contacts'] == 3
+    assert not os.path.exists('contacts.ndjson.checkpoint')
+
+
+def test_csv_lines_count_the_header(server, run):
+    server.reject = lambda resource, record: 'Invalid email' if '@' not in record['email'] else None
+    with open('contacts.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerows([['email', 'firstName'], ['a@example.com', 'Ann'], ['invalid', '']])
+    assert run('import', 'contacts', 'contacts.csv') == 1
+    assert _lines('contacts.csv.errors') == [dict(line=3, record=dict(email='invalid'), error='Invalid email')]
+
+
+def test_unreachable_server_is_reported(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/icp/' % s.getsockname()[1]
+    assert cli.main(['--api-key', 'key', '--username', 'user', '--password', 'password', '--url', url,
+                     '--retries', '0', 'export', 'contacts', 'contacts.ndjson']) == 1
+    assert capsys.readouterr().err.startswith('icontact: cannot reach %s: ' % url)
@@ -0,0 +1,217 @@
+"""
+Tests of `icontact.client`.
+"""
+import copy
+import json
+import pickle
+
+from xml.etree import ElementTree
+
+import pytest
+
+from dateutil.parser import parse
+
+from icontact.client import STATS_SUMMARIES, IContactClient, IContactServerError, Object, json_to_obj, parse_date
+from icontact.store import FingerprintIndex, SQLiteStore
+from icontact.sync import DeltaSync
+from icontact.tests.fakes import FakeAPI
+
+XLINK = 'http://www.w3.org/1999/xlink'
+
+
+class Contacts(object):
+    """
+    Contacts of a fake client folder. Posted contacts are stored unless
+    `reject(record)` returns a warning; subscription moves change nothing.
+    """
+
+    def __init__(self, count=0):
+        self.contacts = [{'contactId': str(i), 'email': 'contact%d@example.com' % i,
+                          'createDate': '2020-01-01 10:%02d:00' % i} for i in range(1, count + 1)]
+        self.reject = lambda record: None
+
+    def __call__(self, method, path, params, body):
+        if method == 'put':
+            return 400, {'errors': ['No Changes Made']}
+        if method == 'get':
+            offset, limit = int(params['offset']), int(params['limit'])
+            return {'contacts': self.contacts[offset:offset + limit], 'total': len(self.contacts)}
+        if not isinstance(body, list):
+            # Single contacts are posted form encoded, which keeps no field
+            # names; they are acknowledged but not stored.
+            warning = self.reject({})
+            return {'contacts': [] if warning else [{}], 'warnings': [warning] if warning else []}
+        accepted, warnings = [], []
+        for record in body:
+            warning = self.reject(record)
+            if warning:
+                warnings.append(warning)
+            else:
+                accepted.append(dict(record, contactId=record.get('contactId') or str(len(self.contacts) + 1)))
+                self.contacts.append(accepted[-1])
+        return {'contacts': accepted, 'warnings': warnings}
+
+
+def _stats_document(contacts=3):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>', '<response xmlns:xlink="%s"><stats>' % XLINK]
+    # 'complaintss' is the tag iContact actually sends.
+    for tag in ('released', 'bounces', 'unsubscribes', 'opens', 'clicks', 'forwards', 'comments', 'complaintss'):
+        parts.append('<%s count="%d" unique="%d" percent="12.5" xlink:href="/stats/%s">' % (
+            tag, contacts, contacts, tag))
+        for i in range(1, contacts + 1):
+            parts.append('<contact email="c%d@example.com" name="Contact %d" xlink:href="/contacts/%d">'
+                         '<event date="2020-03-0%dT10:%02d:00-05:00"/></contact>' % (i, i, i, i, i))
+        parts.append('</%s>' % tag)
+    parts.append('</stats></response>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _contact():
+    return json_to_obj({'contacts': [{'contactId': '1', 'email': 'a@example.com', 'fields': {'age': 30}}],
+                        'total': 1})
+
+
+def test_records_give_attribute_access_to_nested_data():
+    result = _contact()
+    contact = result.contacts[0]
+    assert (contact.contactId, contact.fields.age, result.total) == ('1', 30, 1)
+    # Nested values are converted once.
+    assert result.contacts is result.contacts
+    with pytest.raises(AttributeError):
+        contact.phone
+    assert getattr(contact, 'phone', None) is None
+
+
+def test_assigned_and_deleted_attributes_leave_the_data_alone():
+    data = {'contactId': '1', 'email': 'a@example.com'}
+    contact = Object(data)
+    contact.status = 'normal'
+    contact.email = 'b@example.com'
+    del contact.contactId
+    assert vars(contact) == {'email': 'b@example.com', 'status': 'normal'}
+    assert sorted(dir(contact)) == ['email', 'status']
+    assert not hasattr(contact, 'contactId')
+    assert data == {'contactId': '1', 'email': 'a@example.com'}
+
+
+def test_changes_to_vars_are_written_through():
+    data = {'contactId': '1', 'email': 'a@example.com', 'phone': ''}
+    contact = Object(data)
+    attributes = vars(contact)
+    attributes['status'] = 'normal'
+    attributes.update(email='b@example.com')
+    del attributes['contactId']
+    assert attributes.pop('phone') == ''
+    assert attributes.setdefault('status', 'deleted') == 'normal'
+    assert (contact.status, contact.email) == ('normal', 'b@example.com')
+    assert not hasattr(contact, 'contactId') and not hasattr(contact, 'phone')
+    assert vars(contact) == attributes == {'email': 'b@example.com', 'status': 'normal'}
+    assert json.loads(json.dumps(vars(contact))) == attributes
+    assert data == {'contactId': '1', 'email': 'a@example.com', 'phone': ''}
+
+
+def test_records_survive_pickling_and_copying():
+    result = _contact()
+    result.contacts[0].status = 'normal'
+    del result.contacts[0].fields
+    for clone in (pickle.loads(pickle.dumps(result)), copy.deepcopy(result)):
+        assert clone.contacts[0].status == 'normal'
+        assert not hasattr(clone.contacts[0], 'fields')
+        assert vars(clone.contacts[0]) == {'contactId': '1', 'email': 'a@example.com', 'status': 'normal'}
+
+
+def test_repr_shows_the_values():
+    assert repr(Object({'listId': '7'})) == "icontact.client.Object({'listId': '7'})"
+
+
+@pytest.mark.parametrize('value', [
+    '2010-05-20T13:28:41-04:00',
+    '2010-05-20T13:28:41+05:30',
+    '2010-05-20T13:28:41Z',
+    '2010-05-20T13:28:41.123-04:00',
+    '2010-05-20T13:28:41.123456+0000',
+    '2010-05-20 13:28:41',
+    '2010-05-20',
+    'May 20 2010 1:28PM',
+])
+def test_parse_date_matches_dateutil(value):
+    parsed, expected = parse_date(value), parse(value)
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
+
+
+def test_iter_stats_matches_parse_stats():
+    client = IContactClient('key', 'user', 'password')
+    document = _stats_document()
+    parsed = client._parse_stats(ElementTree.fromstring(document).find('stats'))
+
+    summary = {}
+    contacts = list(client._iter_stats(document, summary))
+    assert contacts == parsed.pop('contacts')
+    assert len(contacts) == 3 * len(set(STATS_SUMMARIES.values()))
+    assert summary == parsed
+
+
+def test_resolve_folder_looks_up_only_missing_ids():
+    api = FakeAPI()
+    client = api.client(account_id=None, client_folder_id=None)
+    assert client.resolve_folder('1', '2') == ('1', '2')
+    assert api.requests == {}
+    assert client.resolve_folder() == (api.ACCOUNT_ID, api.CLIENT_FOLDER_ID)
+    assert client.resolve_folder(client_folder_id='2') == (api.ACCOUNT_ID, '2')
+    assert (api.requests['GET accounts'], api.requests['GET clientfolders']) == (1, 1)
+
+
+def test_move_subscriber_is_sent_again_after_moving_back():
+    api = FakeAPI(Contacts())
+    client = api.client(fingerprints=FingerprintIndex())
+    for old_list, new_list in (('1', '2'), ('2', '1'), ('1', '2')):
+        with pytest.raises(IContactServerError):
+            client.move_subscriber(old_list, '7', new_list)
+    assert api.requests['PUT subscriptions'] == 3
+
+    result = client.move_subscriber('1', '7', '2')
+    assert result.skipped == [{'listId': '2'}]
+    assert api.requests['PUT subscriptions'] == 3
+
+
+def test_rejected_upserts_are_not_remembered():
+    folder = Contacts()
+    folder.reject = lambda record: None if '@' in record['email'] else 'Invalid email address: %s' % record['email']
+    api = FakeAPI(folder)
+    client = api.client(fingerprints=FingerprintIndex())
+    records = [{'email': 'new@example.com', 'firstName': 'New'}, {'email': 'invalid', 'firstName': 'Bad'}]
+
+    first = client.create_or_update_contact(data=[dict(r) for r in records])
+    assert [c.email for c in first.contacts] == ['new@example.com']
+
+    second = client.create_or_update_contact(data=[dict(r) for r in records])
+    assert second.skipped == [records[0]]
+    assert second.warnings == ['Invalid email address: invalid']
+    assert api.requests['POST contacts'] == 2
+
+
+def test_rejected_contact_update_is_sent_again():
+    folder = Contacts()
+    folder.reject = lambda record: 'Contact is locked'
+    api = FakeAPI(folder)
+    client = api.client(fingerprints=FingerprintIndex())
+    assert client.update_contact('5', firstName='Changed').contacts == []
+    client.update_contact('5', firstName='Changed')
+    assert api.requests['POST contacts'] == 2
+
+    folder.reject = lambda record: None
+    client.update_contact('5', firstName='Changed')
+    assert client.update_contact('5', firstName='Changed').skipped
+    assert api.requests['POST contacts'] == 3
+
+
+def test_write_fingerprints_do_not_disturb_delta_sync():
+    store = SQLiteStore()
+    client = FakeAPI(Contacts(20)).client(fingerprints=FingerprintIndex(store))
+    sync = DeltaSync(client, store)
+    assert sync.run(lambda event: None) == dict(insert=20, update=0, delete=0)
+
+    client.create_or_update_contact(data=[{'email': 'other@example.com'}])
+    client.update_contact('1', firstName='First1')
+    assert sync.run(lambda event: None, full=True) == dict(insert=1, update=0, delete=0)
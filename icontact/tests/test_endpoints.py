@@ -0,0 +1,121 @@
+"""
+Tests of the client methods generated from `icontact.endpoints.ENDPOINTS`.
+"""
+import inspect
+
+import pytest
+
+from icontact import endpoints
+from icontact.client import IContactClient, Object
+from icontact.tests.fakes import FakeAPI
+
+
+def _echo(method, path, params, body):
+    """Answers with the request path, and with two records on the first page of a collection."""
+    records = [{'id': '1'}, {'id': '2'}] if int(params.get('offset', 0)) == 0 else []
+    return {'path': path, 'contacts': records, 'data': records, 'total': 2}
+
+
+def test_every_endpoint_is_installed():
+    for endpoint in endpoints.ENDPOINTS:
+        method = getattr(IContactClient, endpoint.name)
+        assert method.endpoint is endpoint
+        assert method.__doc__ == endpoint.doc
+        if endpoint.iter_name:
+            assert getattr(IContactClient, endpoint.iter_name).endpoint is endpoint
+
+
+def test_signatures_keep_the_hand_written_arguments():
+    assert str(inspect.signature(IContactClient.search_contacts)) == (
+        '(self, params=None, account_id=None, client_folder_id=None, raw=False, **kwargs)')
+    assert str(inspect.signature(IContactClient.get_message)) == (
+        '(self, message_id, account_id=None, client_folder_id=None, raw=False)')
+    assert str(inspect.signature(IContactClient.create_list)) == (
+        '(self, name, email_owner_on_change, welcome_on_manual_add, welcome_on_signup_add, welcome_message_id, '
+        'description=None, account_id=None, client_folder_id=None, raw=False)')
+    assert str(inspect.signature(IContactClient.create_send)) == (
+        '(self, message_id, include_list_ids, account_id=None, client_folder_id=None, raw=False, **kwargs)')
+    assert str(inspect.signature(IContactClient.iter_lists)) == (
+        '(self, account_id=None, client_folder_id=None, filters=None, page_size=None, prefetch=True, '
+        'stream=False, raw=False)')
+
+
+@pytest.mark.parametrize('call, method, path, params', [
+    (lambda c: c.search_contacts({'status': 'normal'}, email='a@example.com'),
+     'get', 'contacts/', {'status': 'normal', 'email': 'a@example.com'}),
+    (lambda c: c.contact_history('7', filters={'limit': '5'}), 'get', 'contacts/7/actions/', {'limit': '5'}),
+    (lambda c: c.list(3), 'get', 'lists/3/', {}),
+    (lambda c: c.get_message(message_id='9'), 'get', 'messages/9', {}),
+    (lambda c: c.delete_send('4'), 'delete', 'sends/4', {}),
+    (lambda c: c.get_custom_object_data('5', limit=10), 'get', 'customobjects/5/data/', {'limit': '10'}),
+    (lambda c: c.delete_custom_object_data('5', '6'), 'delete', 'customobjects/5/data/6/', {}),
+])
+def test_generated_methods_call_their_endpoint(call, method, path, params):
+    calls = []
+    api = FakeAPI(lambda *request: calls.append(request[:3]) or {})
+    call(api.client())
+    assert calls == [(method, api._folder + path, params)]
+
+
+@pytest.mark.parametrize('call, path, posted', [
+    (lambda c: c.create_list('News', 0, 1, 1, '5'), 'lists/',
+     {'name': 'News', 'emailOwnerOnChange': 0, 'welcomeOnManualAdd': 1, 'welcomeOnSignupAdd': 1,
+      'welcomeMessageId': '5'}),
+    (lambda c: c.create_segment('Active', '3', description='Opened lately'), 'segments/',
+     {'name': 'Active', 'listId': '3', 'description': 'Opened lately'}),
+    (lambda c: c.create_criterion('4', 'email', 'eq', 'a@example.com'), 'segments/4/criteria/',
+     {'fieldName': 'email', 'operator': 'eq', 'values': 'a@example.com'}),
+    (lambda c: c.create_message('Hello', 'normal', campaignId='1'), 'messages/',
+     {'message': {'subject': 'Hello', 'messageType': 'normal', 'campaignId': '1'}}),
+    (lambda c: c.create_send('9', ['1', '2'], scheduledTime='2020-01-01'), 'sends/',
+     {'send': {'messageId': '9', 'includeListIds': '1,2', 'scheduledTime': '2020-01-01'}}),
+])
+def test_posted_records_are_built_from_the_arguments(call, path, posted):
+    api = FakeAPI()
+    client = api.client()
+    calls = []
+    client._do_request = lambda call_path, parameters=None, method='get', raw=False: calls.append(
+        (method, call_path, parameters))
+    call(client)
+    assert calls == [('post', api._folder + path, posted)]
+
+
+def test_posted_fields_are_required():
+    client = FakeAPI().client()
+    with pytest.raises(TypeError):
+        client.create_segment('Active')
+    with pytest.raises(TypeError):
+        client.create_list('News', 0, 1, 1)
+
+
+def test_folder_ids_can_be_given_per_call():
+    api = FakeAPI(_echo)
+    result = api.client().lists('1', '2', raw=True)
+    assert result['path'] == 'a/1/c/2/lists/'
+
+
+def test_raw_calls_return_plain_dicts():
+    api = FakeAPI(_echo)
+    client = api.client()
+    result = client.search_contacts({'email': 'a@example.com'}, raw=True)
+    assert isinstance(result, dict)
+    assert result['contacts'] == [{'id': '1'}, {'id': '2'}]
+    assert isinstance(client.search_contacts({'email': 'a@example.com'}), Object)
+
+
+def test_iter_methods_page_through_the_collection():
+    client = FakeAPI(_echo).client()
+    assert [c.id for c in client.iter_contacts(page_size=2)] == ['1', '2']
+    assert list(client.iter_custom_object_data('5', page_size=2, raw=True)) == [{'id': '1'}, {'id': '2'}]
+
+
+def test_bad_arguments_are_refused():
+    client = FakeAPI(_echo).client()
+    with pytest.raises(TypeError):
+        client.get_message()
+    with pytest.raises(TypeError):
+        client.lists(filter={'limit': 1})
+    with pytest.raises(TypeError):
+        client.get_send('1', send_id='1')
+    with pytest.raises(TypeError):
+        client.get_send('1', '100', '200', True, 'extra')
@@ -0,0 +1,67 @@
+"""
+Tests of `icontact.export.ColumnarExporter`.
+"""
+import csv
+import io
+
+import pytest
+
+from icontact.export import CONTACT_FIELDS, ColumnarExporter
+from icontact.tests.fakes import FakeAPI
+
+CONTACTS = [{'contactId': str(i), 'email': 'contact%d@example.com' % i, 'bounceCount': i % 3, 'plan': 'gold'}
+            for i in range(1, 8)]
+CONTACTS[2]['plan'] = None
+del CONTACTS[4]['email']
+
+
+def _client():
+    def handler(method, path, params, body):
+        offset, limit = int(params['offset']), int(params['limit'])
+        if path.endswith('/subscriptions/'):
+            return {'subscriptions': [{'subscriptionId': '1_2', 'contactId': '2', 'listId': 1}], 'total': 1}
+        return {'contacts': CONTACTS[offset:offset + limit], 'total': len(CONTACTS)}
+    return FakeAPI(handler).client()
+
+
+def test_batches_hold_every_field_as_text():
+    exporter = ColumnarExporter(_client(), fields=['contactId', 'email', 'bounceCount'], custom_fields=['plan'],
+                                batch_size=3, page_size=2)
+    batches = list(exporter.batches())
+    assert [len(b['contactId']) for b in batches] == [3, 3, 1]
+    assert batches[0] == {'contactId': ['1', '2', '3'],
+                          'email': ['contact1@example.com', 'contact2@example.com', 'contact3@example.com'],
+                          'bounceCount': ['1', '2', '0'], 'plan': ['gold', 'gold', None]}
+    assert batches[1]['email'] == ['contact4@example.com', None, 'contact6@example.com']
+
+
+def test_csv_export():
+    out = io.StringIO()
+    assert ColumnarExporter(_client(), batch_size=4).to_csv(out) == 7
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows[0] == list(CONTACT_FIELDS)
+    assert [row[0] for row in rows[1:]] == [str(i) for i in range(1, 8)]
+    assert rows[1][CONTACT_FIELDS.index('email')] == 'contact1@example.com'
+
+
+def test_subscriptions_export(tmp_path):
+    path = str(tmp_path / 'subscriptions.csv')
+    exporter = ColumnarExporter(_client(), 'subscriptions', fields=['subscriptionId', 'listId'])
+    assert exporter.to_csv(path, header=False) == 1
+    with open(path, newline='') as f:
+        assert f.read() == '1_2,1\r\n'
+
+
+def test_unknown_resources_are_refused():
+    with pytest.raises(ValueError):
+        ColumnarExporter(_client(), 'messages')
+
+
+def test_arrow_and_numpy_batches():
+    pyarrow = pytest.importorskip('pyarrow')
+    pytest.importorskip('numpy')
+    exporter = ColumnarExporter(_client(), fields=['contactId'], custom_fields=['plan'], batch_size=5)
+    batches = list(exporter.arrow_batches())
+    assert [b.num_rows for b in batches] == [5, 2]
+    assert batches[0].schema == pyarrow.schema([('contactId', pyarrow.string()), ('plan', pyarrow.string())])
+    assert list(next(exporter.numpy_batches())['plan']) == ['gold', 'gold', None, 'gold', 'gold']
@@ -0,0 +1,98 @@
+"""
+Tests of `icontact.index.ContactIndex` and the client's email lookups.
+"""
+import pytest
+
+from icontact.index import ContactIndex
+from icontact.tests.fakes import FakeAPI
+
+
+def test_populate_indexes_every_contact(server, make_client):
+    index = ContactIndex()
+    client = make_client(contact_index=index)
+    assert index.populate(client, page_size=20, batch_size=7) == 50
+    assert server.requests['GET contacts'] == 3
+
+    server.reset_counts()
+    assert client.find_contact_by_email('Contact7@Example.com ') == '7'
+    assert client.contact_ids_for_emails(['contact1@example.com', 'contact50@example.com']) == {
+        'contact1@example.com': '1', 'contact50@example.com': '50'}
+    assert server.requests == {}
+
+
+def test_misses_fall_back_to_the_api_and_are_indexed(server, make_client):
+    client = make_client(contact_index=ContactIndex())
+    assert client.find_contact_by_email('contact3@example.com') == '3'
+    assert client.find_contact_by_email('contact3@example.com') == '3'
+    assert server.requests['GET contacts'] == 1
+
+    found = client.contact_ids_for_emails(['contact3@example.com', 'contact4@example.com', 'nobody@example.com'])
+    assert found == {'contact3@example.com': '3', 'contact4@example.com': '4'}
+    assert server.requests['GET contacts'] == 3
+
+
+def test_stale_entries_are_looked_up_again(server, make_client):
+    index = ContactIndex(max_age=60)
+    client = make_client(contact_index=index)
+    scope = client._fingerprint_scope(server.ACCOUNT_ID, server.CLIENT_FOLDER_ID, 'contacts')
+    index.put(scope, [('contact5@example.com', '999')])
+    index.store.execute('UPDATE contact_index SET updated = updated - 120')
+    assert index.get(scope, 'contact5@example.com') is None
+
+    assert client.find_contact_by_email('contact5@example.com') == '5'
+    assert server.requests['GET contacts'] == 1
+    assert index.get(scope, 'contact5@example.com') == '5'
+
+
+def test_deleted_contacts_leave_the_index(server, make_client):
+    index = ContactIndex()
+    client = make_client(contact_index=index)
+    index.populate(client)
+    client.delete_contact('7')
+
+    server.reset_counts()
+    assert client.find_contact_by_email('contact7@example.com') is None
+    assert server.requests['GET contacts'] == 1
+    assert client.find_contact_by_email('contact8@example.com') == '8'
+    assert server.requests['GET contacts'] == 1
+
+
+def test_lookups_without_an_index_call_the_api(server, make_client):
+    client = make_client()
+    assert client.find_contact_by_email('contact2@example.com') == '2'
+    assert client.find_contact_by_email('nobody@example.com') is None
+    assert server.requests['GET contacts'] == 2
+
+
+def _contacts(method, path, params, body):
+    if method == 'get':
+        found = [{'contactId': '8', 'email': 'old@example.com'}] if params['email'] == 'old@example.com' else []
+        return {'contacts': found, 'total': len(found)}
+    if method == 'post':
+        return {'contacts': [{'contactId': '8', 'email': 'new@example.com'}]}
+    return {}
+
+
+def test_written_contacts_update_the_index():
+    api = FakeAPI(_contacts)
+    index = ContactIndex()
+    client = api.client(contact_index=index)
+    scope = client._fingerprint_scope(api.ACCOUNT_ID, api.CLIENT_FOLDER_ID, 'contacts')
+
+    assert client.find_contact_by_email('old@example.com') == '8'
+    client.update_contact('8', email='new@example.com')
+    assert index.get(scope, 'old@example.com') is None
+    assert client.find_contact_by_email('new@example.com') == '8'
+    assert api.requests['GET contacts'] == 1
+
+    client.delete_contact('8')
+    assert index.get(scope, 'new@example.com') is None
+    assert client.find_contact_by_email('new@example.com') is None
+    assert api.requests['GET contacts'] == 2
+
+
+def test_async_client_refuses_an_index():
+    pytest.importorskip('httpx')
+    from icontact.aio import AsyncIContactClient
+    with pytest.raises(TypeError):
+        AsyncIContactClient('key', 'user', 'password', contact_index=ContactIndex())
@@ -0,0 +1,130 @@
+"""
+Tests of the `RequestEvent`s reported to client hooks.
+
+The phases of a call are only timed on real sockets, so these tests run
+against a small local HTTP server.
+"""
+import asyncio
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from icontact.client import IContactClient, IContactServerError
+from icontact.metrics import EndpointStats
+from icontact.retry import RetryPolicy
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        failures = self.server.failures
+        if failures:
+            self.server.failures -= 1
+            status, payload = 503, {'errors': ['Service Unavailable']}
+        elif '/contacts/' in self.path:
+            status, payload = 200, {'contacts': [{'contactId': '1'}], 'total': 1}
+        else:
+            status, payload = 200, {'lists': [{'listId': '1', 'name': 'List 1'}]}
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.failures = 0
+    server.url = 'http://127.0.0.1:%d/icp/' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(http_server, **options):
+    return IContactClient('key', 'user', 'password', url=http_server.url, account_id='100',
+                          client_folder_id='200', **options)
+
+
+def test_phases_of_a_blocking_call(http_server):
+    events = []
+    with _client(http_server, hooks=[events.append]) as client:
+        client.lists()
+        client.lists()
+    for event in events:
+        assert (event.method, event.endpoint, event.status, event.attempts) == ('get', 'a/{id}/c/{id}/lists/', 200, 1)
+        # Connection setup is part of the time to the first byte.
+        assert event.connect is None
+        assert event.ttfb > 0
+        assert None not in (event.download, event.parse, event.convert)
+        assert event.response_bytes > 0
+
+
+def test_a_custom_session_is_timed(http_server):
+    events = []
+    client = _client(http_server, hooks=[events.append], session=requests.Session())
+    client.lists()
+    assert events[0].ttfb > 0
+    assert events[0].download is not None
+
+
+def test_retried_calls_report_their_attempts(http_server):
+    http_server.failures = 1
+    events = []
+    with _client(http_server, hooks=[events.append],
+                 retry_policy=RetryPolicy(backoff=0, jitter=False, sleep=lambda delay: None)) as client:
+        client.lists()
+    assert [(e.status, e.attempts, e.retries) for e in events] == [(200, 2, 1)]
+
+
+def test_failed_calls_report_their_error(http_server):
+    http_server.failures = 1
+    events = []
+    with _client(http_server, hooks=[events.append]) as client:
+        with pytest.raises(IContactServerError):
+            client.lists()
+    assert (events[0].status, events[0].attempts) == (503, 1)
+    assert isinstance(events[0].error, IContactServerError)
+
+
+def test_phases_of_an_async_call(http_server):
+    pytest.importorskip('httpx')
+    from icontact.aio import AsyncIContactClient
+    events = []
+
+    async def main():
+        async with AsyncIContactClient('key', 'user', 'password', url=http_server.url, account_id='100',
+                                       client_folder_id='200', hooks=[events.append]) as client:
+            await client.lists()
+            await client.lists()
+    asyncio.run(main())
+    first, second = events
+    assert first.connect > 0
+    assert second.connect == 0.0
+    for event in events:
+        assert event.ttfb > 0
+        assert event.download is not None
+
+
+def test_endpoint_stats(http_server):
+    stats = EndpointStats()
+    with _client(http_server, hooks=[stats]) as client:
+        for _ in range(3):
+            client.lists()
+        client.search_contacts({'email': 'contact1@example.com'})
+    calls = sorted((row['endpoint'], row['calls'], row['errors']) for row in stats.summary())
+    assert calls == [('a/{id}/c/{id}/contacts/', 1, 0), ('a/{id}/c/{id}/lists/', 3, 0)]
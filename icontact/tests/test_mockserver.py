@@ -0,0 +1,66 @@
+"""
+Checks of `MockIContactServer` and the benchmark harness built on it.
+"""
+import json
+
+import requests
+
+from icontact.tests import benchmarks
+from icontact.tests.mockserver import MockIContactServer
+
+
+def _get(server, resource, **query):
+    return requests.get(server.url + 'a/%s/c/%s/%s/' % (server.ACCOUNT_ID, server.CLIENT_FOLDER_ID, resource),
+                        params=query)
+
+
+def test_pages_and_filters(server):
+    page = _get(server, 'contacts', limit=10, offset=45).json()
+    assert [c['contactId'] for c in page['contacts']] == ['46', '47', '48', '49', '50']
+    assert (page['limit'], page['offset'], page['total']) == (10, 45, 50)
+    assert [c['contactId'] for c in _get(server, 'contacts', email='contact7@example.com').json()['contacts']] == ['7']
+    assert server.requests['GET contacts'] == 2
+
+
+def test_posted_records_are_echoed_unless_rejected(server):
+    server.reject = lambda resource, record: 'Invalid email' if record['email'] == 'bad' else None
+    response = requests.post(server.url + 'a/%s/c/%s/contacts/' % (server.ACCOUNT_ID, server.CLIENT_FOLDER_ID),
+                             data=json.dumps([{'email': 'new@example.com'}, {'email': 'bad'}])).json()
+    assert response == {'contacts': [{'email': 'new@example.com', 'contactId': '51'}], 'warnings': ['Invalid email']}
+
+
+def test_nested_form_records_are_refused(server):
+    url = server.url + 'a/%s/c/%s/contacts/' % (server.ACCOUNT_ID, server.CLIENT_FOLDER_ID)
+    response = requests.post(url, data={'contact': {'email': 'new@example.com', 'status': 'normal'}})
+    assert response.status_code == 400
+    assert requests.post(url, data={'email': 'new@example.com'}).json()['contacts'] == [
+        {'email': 'new@example.com', 'contactId': '51'}]
+
+
+def test_deleted_records_are_removed(server):
+    url = server.url + 'a/%s/c/%s/contacts/7' % (server.ACCOUNT_ID, server.CLIENT_FOLDER_ID)
+    assert requests.delete(url).status_code == 200
+    assert requests.get(url).status_code == 404
+    assert requests.delete(url).status_code == 404
+    assert _get(server, 'contacts').json()['total'] == 49
+
+
+def test_injected_throttling():
+    with MockIContactServer(contacts=1, throttle_rate=1.0, retry_after=7) as server:
+        response = _get(server, 'contacts')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_benchmarks_run_and_compare():
+    with MockIContactServer(contacts=300, stats_contacts=10) as server:
+        results = benchmarks.Benchmarks(server, calls=5, threads=2, bulk_records=30).run(memory=False)
+    counts = dict((r.name, r.operations) for r in results)
+    assert counts == dict(single_call=5, concurrent_calls=5, paginate=300, paginate_streamed=300,
+                          paginate_raw=300, bulk_upsert=30, stats_parse=10 * 8, stats_iterparse=10 * 8)
+
+    baseline = [dict(r.as_dict(), throughput=r.throughput * 2) if r.name == 'paginate' else r.as_dict()
+                for r in results]
+    regressions = benchmarks.compare(results, baseline, 0.2)
+    assert [message.split(':')[0] for message in regressions] == ['paginate']
+    assert 'paginate' in benchmarks.format_table(results)
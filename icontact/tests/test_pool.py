@@ -0,0 +1,100 @@
+"""
+Tests of `icontact.pool.IContactClientPool`.
+"""
+import io
+import threading
+
+import requests
+
+from icontact.pool import IContactClientPool
+from icontact.tests.fakes import FakeAdapter, FakeAPI
+
+
+def _search(method, path, params, body):
+    return {'contacts': [{'contactId': '1', 'email': params.get('email')}], 'total': 1}
+
+
+class _StreamingAdapter(FakeAdapter):
+    """Leaves the body of streamed responses unread, like a real connection."""
+
+    def send(self, request, stream=False, **kwargs):
+        response = super(_StreamingAdapter, self).send(request, **kwargs)
+        if stream:
+            response.raw = io.BytesIO(response._content)
+            response._content, response._content_consumed = False, False
+        return response
+
+
+def _pool(api, adapter=None, **options):
+    session = requests.Session()
+    session.mount('http://', adapter or api.adapter())
+    tenants = dict((name, dict(api_key='key-' + name, username=name, password='password',
+                               account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID))
+                   for name in ('a', 'b'))
+    return IContactClientPool(tenants, client_options=dict(url=api.url), session=session, **options)
+
+
+def test_clients_share_one_session():
+    api = FakeAPI(_search)
+    with _pool(api) as pool:
+        assert pool.client('a') is pool.client('a')
+        assert pool.client('a').session is pool.client('b').session
+        results = pool.fan_out(lambda client: client.search_contacts({'email': 'contact1@example.com'}))
+        assert sorted((name, r.contacts[0].contactId) for name, r in results.items()) == [('a', '1'), ('b', '1')]
+    assert api.requests['GET contacts'] == 2
+
+
+def test_idle_clients_are_dropped():
+    with _pool(FakeAPI(_search), idle_timeout=60) as pool:
+        client = pool.client('a')
+        assert pool.evict_idle(now=pool._tenants['a'].last_used + 61) == 1
+        assert pool.client('a') is not client
+
+
+def test_throttling_one_tenant_does_not_pause_the_others():
+    with _pool(FakeAPI(_search), global_limits=dict(per_second=100), tenant_limits=dict(per_second=100)) as pool:
+        throttled, other = pool.client('a').rate_limiter, pool.client('b').rate_limiter
+        assert other.shared_buckets == throttled.shared_buckets == pool.global_buckets
+
+        throttled.throttled(retry_after=30)
+        assert throttled.reserve() > 29
+        assert other.reserve() < 1
+        assert other.factor == 1.0
+
+
+def test_streamed_responses_hold_their_permits_until_read():
+    api = FakeAPI(_search)
+    with _pool(api, _StreamingAdapter(api), max_concurrency=1) as pool:
+        client, permits = pool.client('a'), pool._global_semaphore
+        contacts = client._do_request(client._folder_prefix() + 'contacts/', stream='contacts')
+        assert not permits.acquire(blocking=False)
+        assert [c.contactId for c in contacts] == ['1']
+        assert permits.acquire(blocking=False)
+        permits.release()
+
+        client._do_request(client._folder_prefix() + 'contacts/', stream='contacts').close()
+        assert permits.acquire(blocking=False)
+        permits.release()
+
+        # Hooks stream every response to time its download.
+        client.hooks.append(lambda event: None)
+        assert client.search_contacts({'email': 'contact1@example.com'}).total == 1
+        assert permits.acquire(blocking=False)
+
+
+def test_calls_made_while_reading_a_streamed_page_share_its_permits():
+    api = FakeAPI(_search)
+    with _pool(api, _StreamingAdapter(api), max_concurrency=1, tenant_concurrency=1) as pool:
+        client, permits = pool.client('a'), pool._global_semaphore
+        histories = []
+
+        def sync():
+            for contact in client.iter_contacts(stream=True):
+                histories.append(client.contact_history(contact.contactId))
+        thread = threading.Thread(target=sync)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert len(histories) == 1
+        assert permits.acquire(blocking=False)
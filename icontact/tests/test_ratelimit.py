@@ -0,0 +1,75 @@
+"""
+Tests of `icontact.ratelimit`.
+"""
+import pytest
+
+from icontact.client import IContactServerError
+from icontact.ratelimit import FileStore, RateLimiter, TokenBucket, parse_retry_after
+from icontact.tests.fakes import FakeAPI
+
+
+def test_bucket_allows_a_burst_then_paces_calls():
+    bucket = TokenBucket(2, period=1.0)
+    assert [bucket.reserve(now=100.0) for _ in range(2)] == [0.0, 0.0]
+    assert [bucket.reserve(now=100.0) for _ in range(3)] == [0.5, 1.0, 1.5]
+    # A second repays two of the three tokens owed.
+    assert bucket.reserve(now=101.0) == pytest.approx(1.0)
+
+
+def test_bucket_refills_no_further_than_its_capacity():
+    bucket = TokenBucket(2, period=1.0, capacity=3)
+    bucket.reserve(now=100.0)
+    assert [bucket.reserve(now=1000.0) for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_limiter_sleeps_for_the_slowest_bucket():
+    slept = []
+    limiter = RateLimiter(per_second=10, per_minute=2, sleep=slept.append)
+    assert [limiter.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(30.0, abs=0.1)
+    assert len(slept) == 1 and slept[0] == pytest.approx(30.0, abs=0.1)
+
+
+def test_throttling_pauses_and_slows_down_until_calls_succeed():
+    limiter = RateLimiter(per_second=100, decrease=0.5, increase=0.25, min_factor=0.2)
+    limiter.throttled(retry_after=30)
+    assert limiter.factor == 0.5
+    assert limiter.reserve() == pytest.approx(30.0, abs=0.1)
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.factor == 0.2
+    limiter.succeeded()
+    assert limiter.factor == pytest.approx(0.45)
+    for _ in range(5):
+        limiter.succeeded()
+    assert limiter.factor == 1.0
+
+
+def test_limiters_sharing_a_file_store_share_budgets(tmp_path):
+    path = str(tmp_path / 'bucket')
+    first = RateLimiter(per_minute=3, store=FileStore(path))
+    second = RateLimiter(per_minute=3, store=FileStore(path))
+    assert [first.reserve(), second.reserve(), first.reserve()] == [0.0, 0.0, 0.0]
+    assert second.reserve() == pytest.approx(20.0, abs=0.1)
+
+    second.throttled(retry_after=60)
+    assert first.reserve() >= 59.0
+
+
+def test_client_reports_throttling_to_its_limiter():
+    responses = [(200, {'lists': []}), (429, {'errors': ['Too many requests']}, {'Retry-After': '7'})]
+    api = FakeAPI(lambda method, path, params, body: responses.pop(0))
+    limiter = RateLimiter(per_second=100)
+    client = api.client(rate_limiter=limiter)
+    client.lists()
+    assert limiter.factor == 1.0
+    with pytest.raises(IContactServerError):
+        client.lists()
+    assert limiter.factor == 0.5
+    assert limiter.reserve() == pytest.approx(7.0, abs=0.1)
+
+
+@pytest.mark.parametrize('value, seconds', [('12', 12.0), ('-3', 0.0), ('soon', None), (None, None),
+                                            ('Thu, 01 Jan 1970 00:00:00 GMT', 0.0)])
+def test_parse_retry_after(value, seconds):
+    assert parse_retry_after(value) == seconds
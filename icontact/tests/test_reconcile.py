@@ -0,0 +1,57 @@
+"""
+Tests of `icontact.reconcile.SubscriptionReconciler` against `MockIContactServer`.
+"""
+from icontact.reconcile import ReconcileAction, SubscriptionReconciler
+
+HOLDING = '5'
+
+
+def _subscribe(server, contact_id, list_id, status='normal'):
+    server.data['subscriptions'].append(dict(subscriptionId='%s_%s' % (list_id, contact_id), contactId=contact_id,
+                                             listId=list_id, status=status))
+
+
+def test_plan_uses_the_holding_list(server, client):
+    # Contact i starts out subscribed to list 1 + i % 5.
+    _subscribe(server, '1', HOLDING)
+    _subscribe(server, '6', '3')
+    _subscribe(server, '6', HOLDING)
+    _subscribe(server, '7', '1', status='unsubscribed')
+    desired = {'1': ['2', '3'], '2': ['1'], '4': ['1'], '5': [], '6': [], '7': ['1', '3']}
+    plan = SubscriptionReconciler(client, holding_list_id=HOLDING).plan(desired, lists=['1', '2', '3'])
+    assert plan == [
+        # Held contacts are moved out of the holding list.
+        ReconcileAction('move', '1', '3', HOLDING),
+        ReconcileAction('move', '2', '1', '3'),
+        ReconcileAction('move', '4', '1', HOLDING),
+        ReconcileAction('retire', '5', HOLDING, '1'),
+        # Already held: unsubscribe.
+        ReconcileAction('retire', '6', None, '2'),
+        ReconcileAction('retire', '6', None, '3'),
+        # Inactive subscriptions are not counted.
+        ReconcileAction('create', '7', '1', None),
+    ]
+
+
+def test_plan_without_a_holding_list_unsubscribes(server, client):
+    plan = SubscriptionReconciler(client).plan({'1': ['1'], '2': ['3']}, lists=['1', '2', '3'])
+    assert plan == [ReconcileAction('create', '1', '1', None), ReconcileAction('retire', '1', None, '2')]
+
+
+def test_reconcile_applies_every_action(server, client):
+    _subscribe(server, '6', HOLDING)
+    reports = []
+    reconciler = SubscriptionReconciler(client, holding_list_id=HOLDING, chunk_size=2, progress=reports.append)
+    report = reconciler.reconcile({'1': ['1', '3'], '2': [], '6': ['2', '3']}, lists=['1', '2', '3'])
+    assert report.planned == dict(create=1, move=2, retire=1)
+    assert (report.done, report.errors, report.failed) == (4, 0, [])
+    assert reports[-1] is report
+    assert server.requests['PUT subscriptions'] == 3
+    assert server.requests['POST subscriptions'] == 1
+
+
+def test_failed_bulk_records_are_reported(server, client):
+    server.reject = lambda resource, record: 'List is locked' if record['listId'] == '3' else None
+    report = SubscriptionReconciler(client).reconcile({'1': ['1', '3']}, lists=['1', '2', '3'])
+    assert (report.done, report.errors) == (2, 1)
+    assert [action for action, error in report.failed] == [ReconcileAction('create', '1', '3', None)]
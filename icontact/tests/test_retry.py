@@ -0,0 +1,59 @@
+"""
+Tests of `icontact.retry` and of retried client calls.
+"""
+import pytest
+
+from icontact.client import IContactServerError
+from icontact.retry import RetryPolicy
+from icontact.tests.fakes import FakeAPI
+
+
+def _flaky(failures, status=503):
+    """Fails the first `failures` calls with `status`, then answers them."""
+    calls = []
+
+    def handler(method, path, params, body):
+        calls.append(method)
+        if len(calls) <= failures:
+            return status, {'errors': ['Try again later']}
+        return {'lists': [{'listId': '1'}]}
+    return handler
+
+
+def test_delays_back_off_up_to_the_limits():
+    policy = RetryPolicy(max_attempts=5, backoff=1.0, max_backoff=3.0, jitter=False, deadline=10)
+    assert [policy.delay(attempt, started=0.0, now=0.0) for attempt in range(1, 6)] == [1.0, 2.0, 3.0, 3.0, None]
+    assert policy.delay(1, started=0.0, retry_after=6.0, now=0.0) == 6.0
+    assert policy.delay(1, started=0.0, now=9.5) is None
+
+
+def test_only_idempotent_calls_are_replayed():
+    policy = RetryPolicy()
+    assert policy.allows('GET') and policy.allows('put') and not policy.allows('post')
+    assert not policy.allows('post', idempotent=True)
+    assert RetryPolicy(retry_upserts=True).allows('post', idempotent=True)
+
+
+def test_transient_failures_are_retried():
+    retries = []
+    api = FakeAPI(_flaky(2))
+    client = api.client(retry_policy=RetryPolicy(max_attempts=3, backoff=0.001, jitter=False,
+                                                 on_retry=lambda *args: retries.append(args[0])))
+    assert [l.listId for l in client.lists().lists] == ['1']
+    assert api.requests['GET lists'] == 3
+    assert retries == [1, 2]
+
+
+def test_retried_calls_report_their_attempts():
+    api = FakeAPI(_flaky(10, status=429))
+    client = api.client(retry_policy=RetryPolicy(max_attempts=4, backoff=0.001, jitter=False))
+    with pytest.raises(IContactServerError) as error:
+        client.lists()
+    assert (error.value.http_status, error.value.attempts) == (429, 4)
+    assert api.requests['GET lists'] == 4
+
+    # Plain POSTs are never replayed.
+    with pytest.raises(IContactServerError) as error:
+        client.create_list('New list', 0, 0, 0, 0)
+    assert error.value.attempts == 1
+    assert api.requests['POST lists'] == 1
@@ -0,0 +1,125 @@
+"""
+Tests of `icontact.singleflight.SingleFlight` and single-flight GETs.
+"""
+import asyncio
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from icontact.client import IContactServerError
+from icontact.singleflight import SingleFlight
+from icontact.tests.fakes import FakeAPI
+
+
+def _slow(payload, latency=0.2):
+    """A handler answering every request with `payload` after `latency` seconds."""
+    def handler(method, path, params, body):
+        time.sleep(latency)
+        return payload
+    return handler
+
+
+def _concurrently(func, count=8):
+    """Runs `func` from `count` threads started together; returns results or exceptions."""
+    barrier = threading.Barrier(count)
+
+    def call(_):
+        barrier.wait()
+        try:
+            return func()
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(call, range(count)))
+
+
+def test_concurrent_calls_share_one_run():
+    runs = []
+
+    def func():
+        runs.append(1)
+        time.sleep(0.2)
+        return 'result'
+    flights = SingleFlight()
+    assert _concurrently(lambda: flights.do('key', func)) == ['result'] * 8
+    assert len(runs) == 1
+    assert len(flights) == 0
+
+
+def test_identical_concurrent_gets_make_one_request():
+    api = FakeAPI(_slow({'contacts': [{'contactId': '1', 'email': 'a@example.com'}], 'total': 1}))
+    client = api.client(single_flight=True)
+    results = _concurrently(lambda: client.search_contacts({'email': 'a@example.com'}))
+    assert api.requests['GET contacts'] == 1
+    assert [r.contacts[0].contactId for r in results] == ['1'] * 8
+    # Every waiter gets its own view of the shared response.
+    results[0].contacts[0].email = 'changed@example.com'
+    assert results[1].contacts[0].email == 'a@example.com'
+
+
+def test_raw_waiters_get_their_own_copy():
+    api = FakeAPI(_slow({'contacts': [{'contactId': '1', 'email': 'a@example.com'}], 'total': 1}))
+    client = api.client(single_flight=True)
+    results = _concurrently(lambda: client.search_contacts({'email': 'a@example.com'}, raw=True))
+    assert api.requests['GET contacts'] == 1
+    results[0]['contacts'][0]['email'] = 'changed@example.com'
+    assert [r['contacts'][0]['email'] for r in results[1:]] == ['a@example.com'] * 7
+
+
+def test_different_parameters_are_not_shared():
+    api = FakeAPI(_slow({'contacts': [], 'total': 0}, latency=0.1))
+    client = api.client(single_flight=True)
+    emails = iter(['%d@example.com' % i for i in range(4)])
+    lock = threading.Lock()
+
+    def search():
+        with lock:
+            email = next(emails)
+        return client.search_contacts({'email': email})
+    _concurrently(search, count=4)
+    assert api.requests['GET contacts'] == 4
+
+
+def test_errors_reach_every_waiter():
+    api = FakeAPI(_slow((500, {'errors': ['Internal Error']})))
+    client = api.client(single_flight=True)
+    results = _concurrently(lambda: client.search_contacts({'email': 'a@example.com'}))
+    assert api.requests['GET contacts'] == 1
+    assert all(isinstance(r, IContactServerError) for r in results)
+    assert [r.errors for r in results] == [['Internal Error']] * 8
+
+
+def test_writes_are_not_shared():
+    api = FakeAPI(_slow({'contacts': [{'contactId': '1', 'email': 'a@example.com'}]}, latency=0.05))
+    client = api.client(single_flight=True)
+    _concurrently(lambda: client.create_contact('a@example.com'), count=4)
+    assert api.requests['POST contacts'] == 4
+
+
+def test_async_gets_share_one_request():
+    pytest.importorskip('httpx')
+    from icontact.aio import AsyncIContactClient
+
+    api = FakeAPI(lambda method, path, params, body: {'contacts': [{'contactId': '1'}], 'total': 1})
+
+    async def main():
+        async with AsyncIContactClient('key', 'user', 'password', url=api.url, http_client=api.async_client(),
+                                       account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID,
+                                       single_flight=True) as client:
+            return await asyncio.gather(*[client.search_contacts({'email': 'a@example.com'}) for _ in range(5)])
+    results = asyncio.run(main())
+    assert api.requests['GET contacts'] == 1
+    assert [r.contacts[0].contactId for r in results] == ['1'] * 5
+
+    async def main_raw():
+        async with AsyncIContactClient('key', 'user', 'password', url=api.url, http_client=api.async_client(),
+                                       account_id=api.ACCOUNT_ID, client_folder_id=api.CLIENT_FOLDER_ID,
+                                       single_flight=True) as client:
+            return await asyncio.gather(*[client.search_contacts({'email': 'a@example.com'}, raw=True)
+                                          for _ in range(3)])
+    first, *others = asyncio.run(main_raw())
+    first['contacts'].clear()
+    assert [r['contacts'] for r in others] == [[{'contactId': '1'}]] * 2
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of `icontact.streaming.StreamedCollection` and of streamed client calls.
+"""
+import json
+
+import pytest
+
+from icontact.streaming import StreamedCollection
+from icontact.tests.fakes import FakeAPI
+
+DOCUMENT = {
+    'limit': 3,
+    'offset': 0,
+    'contacts': [
+        {'contactId': '1', 'email': 'ann@example.com', 'firstName': u'Zoë', 'tags': ['a', 'b']},
+        {'contactId': '2', 'email': 'bob@example.com', 'note': u'quote " and \\ and ☃ snowman',
+         'address': {'street': '1 Main St', 'lines': [None, True, 1.5e3]}},
+        {'contactId': '3', 'email': 'cy@example.com', 'empty': {}, 'none': []},
+    ],
+    'total': 3,
+}
+
+
+def _chunks(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64, 100000])
+def test_records_split_across_chunk_boundaries(size):
+    body = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    collection = StreamedCollection(_chunks(body, size), 'contacts')
+    assert list(collection) == DOCUMENT['contacts']
+    assert collection.metadata == dict(limit=3, offset=0, total=3)
+
+
+def test_every_split_point_of_the_body():
+    body = json.dumps(DOCUMENT, indent=1, ensure_ascii=False).encode('utf-8')
+    for split in range(1, len(body)):
+        collection = StreamedCollection([body[:split], body[split:]], 'contacts')
+        assert list(collection) == DOCUMENT['contacts'], split
+
+
+def test_numbers_split_at_every_offset():
+    body = b'{"score":12.5,"data":[1.5,2e3,7,-0.25E-2],"total":3}'
+    for split in range(1, len(body)):
+        collection = StreamedCollection([body[:split], body[split:]], 'data')
+        assert list(collection) == [1.5, 2e3, 7, -0.25e-2], body[:split]
+        assert collection.metadata == dict(score=12.5, total=3)
+    collection = StreamedCollection(_chunks(body, 1), 'data')
+    assert list(collection) == [1.5, 2e3, 7, -0.25e-2]
+
+
+def test_metadata_before_the_array_is_readable_first():
+    body = json.dumps(DOCUMENT).encode('utf-8')
+    collection = StreamedCollection(_chunks(body, 4), 'contacts', wrap=lambda record: record['contactId'])
+    assert collection.limit == 3
+    assert list(collection) == ['1', '2', '3']
+    assert collection.total == 3
+
+
+def test_close_is_called_when_iteration_is_abandoned():
+    closed = []
+    body = json.dumps(DOCUMENT).encode('utf-8')
+    collection = StreamedCollection(_chunks(body, 8), 'contacts', close=lambda: closed.append(True))
+    for record in collection:
+        break
+    collection.close()
+    assert closed == [True]
+
+
+def test_empty_collection():
+    collection = StreamedCollection([b'{"contacts": [], "total": 0}'], 'contacts')
+    assert list(collection) == []
+    assert collection.total == 0
+
+
+def test_client_streams_every_page():
+    contacts = [{'contactId': str(i)} for i in range(1, 26)]
+
+    def handler(method, path, params, body):
+        offset, limit = int(params['offset']), int(params['limit'])
+        return {'contacts': contacts[offset:offset + limit], 'total': len(contacts)}
+    api = FakeAPI(handler)
+    records = list(api.client().iter_contacts(page_size=10, stream=True))
+    assert [c.contactId for c in records] == [c['contactId'] for c in contacts]
+    assert api.requests['GET contacts'] == 3
@@ -0,0 +1,82 @@
+"""
+Tests of `icontact.sync.DeltaSync`.
+"""
+from icontact.store import SQLiteStore
+from icontact.sync import DeltaSync
+from icontact.tests.fakes import FakeAPI
+
+
+class Folder(object):
+    """Contacts of a fake client folder, searchable by creation date."""
+
+    def __init__(self, count):
+        self.contacts = [self.contact(i) for i in range(1, count + 1)]
+        self.searches = []
+
+    @staticmethod
+    def contact(i):
+        return {'contactId': str(i), 'email': 'contact%d@example.com' % i,
+                'createDate': '2020-01-01 10:%02d:00' % i}
+
+    def __call__(self, method, path, params, body):
+        found = self.contacts
+        if 'createDate' in params:
+            self.searches.append(params['createDate'])
+            found = [c for c in found if c['createDate'] > params['createDate']]
+        offset, limit = int(params['offset']), int(params['limit'])
+        return {'contacts': found[offset:offset + limit], 'total': len(found)}
+
+
+def _events(sync, **options):
+    return [(e.action, e.id) for e in sync.changes(**options)]
+
+
+def test_runs_report_only_new_records():
+    folder = Folder(5)
+    sync = DeltaSync(FakeAPI(folder).client(), SQLiteStore(), page_size=2)
+    assert sync.run(lambda event: None) == dict(insert=5, update=0, delete=0)
+
+    folder.contacts.append(Folder.contact(6))
+    assert _events(sync) == [('insert', '6')]
+    # The mark overlaps the last run by a minute.
+    assert folder.searches == ['2020-01-01 10:04:00']
+    assert _events(sync) == []
+
+
+def test_full_runs_report_updates_and_deletes():
+    folder = Folder(5)
+    sync = DeltaSync(FakeAPI(folder).client(), SQLiteStore())
+    sync.run(lambda event: None)
+
+    folder.contacts[0]['email'] = 'changed@example.com'
+    del folder.contacts[2]
+    assert _events(sync, full=True) == [('update', '1'), ('delete', '3')]
+    assert _events(sync, full=True) == []
+
+
+def test_interrupted_runs_resume_at_the_unconsumed_event():
+    sync = DeltaSync(FakeAPI(Folder(5)).client(), SQLiteStore())
+    changes = sync.changes()
+    assert [next(changes).id for _ in range(2)] == ['1', '2']
+    # The second event counts as consumed once the next one is requested.
+    changes.close()
+    assert [e.id for e in sync.changes()] == ['2', '3', '4', '5']
+
+
+def test_concurrent_full_runs_on_one_store_keep_their_seen_records_apart():
+    class OtherFolderAPI(FakeAPI):
+        CLIENT_FOLDER_ID = '201'
+
+    store = SQLiteStore()
+    folder = Folder(5)
+    sync, other = DeltaSync(FakeAPI(folder).client(), store), DeltaSync(OtherFolderAPI(Folder(0)).client(), store)
+    sync.run(lambda event: None)
+    other.run(lambda event: None)
+
+    folder.contacts[1]['email'] = 'changed@example.com'
+    del folder.contacts[2]
+    changes = sync.changes(full=True)
+    assert next(changes) == ('update', 'contacts', '2', folder.contacts[1])
+    assert _events(other, full=True) == []
+    assert [(e.action, e.id) for e in changes] == [('delete', '3')]
+    assert store.execute('SELECT COUNT(*) FROM sync_seen') == [(0,)]
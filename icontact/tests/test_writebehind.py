@@ -0,0 +1,134 @@
+"""
+Tests of `icontact.writebehind.WriteBehindQueue` against `MockIContactServer`.
+"""
+import pytest
+
+from icontact import writebehind
+from icontact.retry import RetryPolicy
+from icontact.store import SQLiteStore
+from icontact.writebehind import WriteBehindQueue
+
+
+def _queue(store=None):
+    return WriteBehindQueue(store, poll_interval=0.02,
+                            retry_policy=RetryPolicy(max_attempts=3, backoff=0.01, jitter=False))
+
+
+def test_writes_are_acknowledged_then_sent(server, make_client):
+    queue = _queue()
+    client = make_client(write_behind=queue)
+    try:
+        result = client.create_contact('new@example.com')
+        assert len(result.queued) == 1
+        assert queue.join(5)
+        assert server.requests['POST contacts'] == 1
+        assert queue.counts() == dict(pending=0, inflight=0, failed=0)
+    finally:
+        queue.stop()
+
+
+def test_entries_in_flight_when_the_process_died_are_sent_on_restart(tmp_path, server, make_client):
+    path = str(tmp_path / 'outbox.db')
+    crashed = _queue(SQLiteStore(path))
+    client = make_client()
+    crashed.put(client, server.ACCOUNT_ID, server.CLIENT_FOLDER_ID, 'contacts',
+                [{'email': '%d@example.com' % i} for i in range(5)])
+    # A worker claimed the batch, then the process died before posting it.
+    crashed.store.execute('UPDATE write_behind SET state = ?', (writebehind.INFLIGHT,))
+    assert crashed.counts()['inflight'] == 5
+    crashed.store.close()
+
+    restarted = _queue(SQLiteStore(path))
+    try:
+        restarted.start(client)
+        assert restarted.join(5)
+        assert server.requests['POST contacts'] == 1
+        assert restarted.counts() == dict(pending=0, inflight=0, failed=0)
+    finally:
+        restarted.stop()
+
+
+def test_writes_are_sent_with_the_credentials_that_queued_them(server, make_client):
+    queue = _queue()
+    events = dict(a=[], b=[])
+    first = make_client('key-a', 'user-a', write_behind=queue, hooks=[events['a'].append])
+    second = make_client('key-b', 'user-b', write_behind=queue, hooks=[events['b'].append])
+    try:
+        first.create_contact('a@example.com')
+        second.create_contact('b1@example.com')
+        second.create_subscription('1', '2')
+        assert queue.join(5)
+    finally:
+        queue.stop()
+    assert sorted(e.endpoint for e in events['a']) == ['a/{id}/c/{id}/contacts/']
+    assert sorted(e.endpoint for e in events['b']) == ['a/{id}/c/{id}/contacts/', 'a/{id}/c/{id}/subscriptions/']
+
+
+def test_rejected_records_are_kept_as_failed(server, make_client):
+    server.reject = lambda resource, record: 'Invalid email' if record['email'] == 'bad' else None
+    queue = _queue()
+    client = make_client(write_behind=queue)
+    try:
+        client.create_contact('good@example.com')
+        bad = client.create_contact('bad').queued[0]
+        assert queue.join(5)
+    finally:
+        queue.stop()
+    failed = queue.failed()
+    assert [(entry.id, entry.record['email'], entry.error) for entry in failed] == [(bad, 'bad', 'Invalid email')]
+
+
+def test_workers_survive_errors_outside_the_call(server, make_client, monkeypatch):
+    match_records = writebehind.match_records
+    errors = []
+
+    def flaky(*args):
+        if not errors:
+            errors.append(True)
+            raise RuntimeError('lost the outcome')
+        return match_records(*args)
+    monkeypatch.setattr(writebehind, 'match_records', flaky)
+
+    queue = _queue()
+    client = make_client(write_behind=queue)
+    try:
+        client.create_contact('new@example.com')
+        assert queue.join(5)
+        assert errors and all(thread.is_alive() for thread in queue._threads)
+        # The interrupted batch was sent again.
+        assert server.requests['POST contacts'] == 2
+        assert queue.counts() == dict(pending=0, inflight=0, failed=0)
+    finally:
+        queue.stop()
+
+
+def test_failed_entries_can_be_retried(server, make_client):
+    server.throttle_rate = 1.0
+    server.retry_after = 0
+    queue = _queue()
+    client = make_client(write_behind=queue)
+    try:
+        client.create_contact('new@example.com')
+        assert queue.join(5)
+        assert [entry.attempts for entry in queue.failed()] == [3]
+
+        server.throttle_rate = 0.0
+        queue.retry()
+        assert queue.join(5)
+        assert queue.counts() == dict(pending=0, inflight=0, failed=0)
+    finally:
+        queue.stop()
+
+
+@pytest.mark.parametrize('ids', [None, 'one'])
+def test_discard_drops_failed_entries(server, make_client, ids):
+    server.reject = lambda resource, record: 'Invalid email'
+    queue = _queue()
+    client = make_client(write_behind=queue)
+    try:
+        entry = client.create_contact('bad').queued[0]
+        assert queue.join(5)
+    finally:
+        queue.stop()
+    queue.discard(None if ids is None else [entry])
+    assert queue.get(entry) is None
@@ -0,0 +1,351 @@
+"""
+Durable write-behind queue for contact, subscription and custom object writes.
+
+A client created with `write_behind=WriteBehindQueue(...)` does not call
+iContact from `create_contact`, `create_subscription` and
+`create_or_update_custom_object`. It appends the records to a journal
+table in a `SQLiteStore` and returns at once. Background workers read the
+journal and post the queued records in batches through the list-POST form
+of each endpoint. Failed batches are retried with backoff, and the
+client's rate limiter paces the calls::
+
+    queue = WriteBehindQueue(SQLiteStore('outbox.db'))
+    client = IContactClient(key, username, password, write_behind=queue)
+    queue.start(client)
+    result = client.create_contact('jane@example.com')   # journaled; result.queued holds its entry id
+    queue.failed()                                       # entries given up on, with their last error
+
+A write is acknowledged once it is committed to the journal. It is
+removed from the journal once iContact has accepted it. Entries still in
+flight when the process died are sent again by the next `start()`, so
+every write reaches iContact at least once. Drain each journal from a
+single process.
+
+Entries are tagged with the credentials of the client that queued them
+and are only sent through a client started with the same credentials.
+Several clients may share one queue; each is started by its first write.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from collections import namedtuple
+
+from icontact.bulk import match_records
+from icontact.client import IContactServerError
+from icontact.retry import RetryPolicy
+from icontact.store import SQLiteStore
+
+PENDING = 'pending'
+INFLIGHT = 'inflight'
+FAILED = 'failed'
+
+QueuedWrite = namedtuple('QueuedWrite', 'id client target account_id client_folder_id record state attempts '
+                                        'next_attempt created error')
+
+_COLUMNS = ('id, client, target, account_id, client_folder_id, record, state, attempts, next_attempt, created, '
+            'error')
+
+log = logging.getLogger('icontact')
+
+
+def _entry(row):
+    return QueuedWrite(*(row[:5] + (json.loads(row[5]),) + row[6:]))
+
+
+def client_identity(client):
+    """Hash of the credentials and API url of `client`, stored with its queued writes."""
+    identity = '%s\0%s\0%s' % (client.api_key, client.username, client.url)
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def collection_of(target):
+    """Name of the response attribute listing the records written to `target`."""
+    return 'data' if target.startswith('customobjects/') else target
+
+
+class WriteBehindQueue(object):
+    """
+    - store: the `SQLiteStore` holding the journal (default: in memory,
+      which is not durable)
+    - workers: number of batches posted concurrently
+    - max_batch: largest number of records posted in one call
+    - retry_policy: `icontact.retry.RetryPolicy` deciding which failures
+      are retried and how long to wait. Its `deadline` is counted from
+      the time a write was queued. Writes that run out of attempts or
+      fail with a permanent error are kept as failed entries.
+    - poll_interval: seconds an idle worker waits before looking for
+      writes that are due for retry
+    - match_keys: (Optional) mapping of a target such as
+      'customobjects/5/data' to the identifying fields of its records,
+      see `icontact.bulk.match_records`
+    """
+
+    def __init__(self, store=None, workers=2, max_batch=500, retry_policy=None, poll_interval=1.0,
+                 match_keys=None):
+        self.store = store if store is not None else SQLiteStore()
+        self.workers = workers
+        self.max_batch = max_batch
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(
+            max_attempts=10, backoff=1.0, max_backoff=300.0)
+        self.poll_interval = poll_interval
+        self.match_keys = dict(match_keys or {})
+        self.clients = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._local = threading.local()
+        self._stopping = False
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS write_behind (
+                id TEXT PRIMARY KEY,
+                client TEXT NOT NULL,
+                target TEXT NOT NULL,
+                account_id TEXT NOT NULL,
+                client_folder_id TEXT NOT NULL,
+                record TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                next_attempt REAL NOT NULL,
+                created REAL NOT NULL,
+                error TEXT
+            )''')
+        self.store.execute('CREATE INDEX IF NOT EXISTS write_behind_due ON write_behind (state, next_attempt)')
+
+    @property
+    def draining(self):
+        """True in the worker threads, whose writes must reach iContact directly."""
+        return getattr(self._local, 'draining', False)
+
+    def put(self, client, account_id, client_folder_id, target, records):
+        """
+        Journals `records` of `client` for the endpoint `target` (e.g.
+        'contacts' or 'customobjects/5/data') of a client folder and
+        returns their entry ids.
+        """
+        now = time.time()
+        identity = client_identity(client)
+        ids = [uuid.uuid4().hex for _ in records]
+        self.store.executemany(
+            'INSERT INTO write_behind (%s) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, NULL)' % _COLUMNS,
+            [(entry_id, identity, target, str(account_id), str(client_folder_id),
+              json.dumps(record, separators=(',', ':')), PENDING, now, now)
+             for entry_id, record in zip(ids, records)])
+        with self._cond:
+            self._cond.notify()
+        return ids
+
+    def start(self, client):
+        """
+        Starts draining the entries queued with the credentials of
+        `client` through it. Entries left in flight by an earlier process
+        are queued again when the first client starts. Does nothing if a
+        client with the same credentials is already draining.
+        """
+        identity = client_identity(client)
+        with self._cond:
+            if identity in self.clients and self._threads:
+                return
+            self.clients[identity] = client
+            self._cond.notify_all()
+            if self._threads:
+                return
+            self._stopping = False
+            self.store.execute('UPDATE write_behind SET state = ? WHERE state = ?', (PENDING, INFLIGHT))
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name='icontact-write-behind-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stops the workers once their current batches are done. Queued writes stay in the journal."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    close = stop
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def join(self, timeout=None):
+        """
+        Waits until no write of a started client is pending or in flight.
+        Returns False if writes remain after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._outstanding():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(self.poll_interval if remaining is None else min(remaining, self.poll_interval))
+        return True
+
+    def _outstanding(self):
+        identities = list(self.clients)
+        if not identities:
+            return 0
+        return self.store.execute(
+            'SELECT COUNT(*) FROM write_behind WHERE state IN (?, ?) AND client IN (%s)' % ','.join(
+                '?' * len(identities)), [PENDING, INFLIGHT] + identities)[0][0]
+
+    def counts(self):
+        """Returns a dict of state ('pending', 'inflight', 'failed') to number of entries."""
+        counts = dict((state, 0) for state in (PENDING, INFLIGHT, FAILED))
+        counts.update(self.store.execute('SELECT state, COUNT(*) FROM write_behind GROUP BY state'))
+        return counts
+
+    def _select(self, states, limit):
+        sql = 'SELECT %s FROM write_behind WHERE state IN (%s) ORDER BY rowid' % (
+            _COLUMNS, ','.join('?' * len(states)))
+        params = list(states)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [_entry(row) for row in self.store.execute(sql, params)]
+
+    def get(self, entry_id):
+        """Returns the `QueuedWrite` of an entry, or None once it has been written."""
+        rows = self.store.execute('SELECT %s FROM write_behind WHERE id = ?' % _COLUMNS, (entry_id,))
+        return _entry(rows[0]) if rows else None
+
+    def pending(self, limit=None):
+        """Returns the `QueuedWrite`s not written yet, oldest first."""
+        return self._select((PENDING, INFLIGHT), limit)
+
+    def failed(self, limit=None):
+        """Returns the `QueuedWrite`s given up on, oldest first."""
+        return self._select((FAILED,), limit)
+
+    def retry(self, ids=None):
+        """Queues failed entries (default: all) again with a fresh attempt budget."""
+        now = time.time()
+        if ids is None:
+            self.store.execute('UPDATE write_behind SET state = ?, attempts = 0, next_attempt = ?, created = ? '
+                               'WHERE state = ?', (PENDING, now, now, FAILED))
+        else:
+            self.store.executemany('UPDATE write_behind SET state = ?, attempts = 0, next_attempt = ?, created = ? '
+                                   'WHERE id = ? AND state = ?', [(PENDING, now, now, i, FAILED) for i in ids])
+        with self._cond:
+            self._cond.notify_all()
+
+    def discard(self, ids=None):
+        """Deletes failed entries (default: all)."""
+        if ids is None:
+            self.store.execute('DELETE FROM write_behind WHERE state = ?', (FAILED,))
+        else:
+            self.store.executemany('DELETE FROM write_behind WHERE id = ? AND state = ?',
+                                   [(i, FAILED) for i in ids])
+
+    def _claim(self):
+        """
+        Marks the next batch of due entries of a started client in flight
+        and returns them.
+        """
+        now = time.time()
+        with self._cond:
+            identities = list(self.clients)
+        if not identities:
+            return []
+        with self.store.transaction():
+            rows = self.store.execute(
+                'SELECT client, target, account_id, client_folder_id FROM write_behind '
+                'WHERE state = ? AND next_attempt <= ? AND client IN (%s) ORDER BY rowid LIMIT 1' % ','.join(
+                    '?' * len(identities)), [PENDING, now] + identities)
+            if not rows:
+                return []
+            rows = self.store.execute(
+                'SELECT %s FROM write_behind WHERE state = ? AND next_attempt <= ? AND client = ? AND target = ? '
+                'AND account_id = ? AND client_folder_id = ? ORDER BY rowid LIMIT ?' % _COLUMNS,
+                (PENDING, now) + tuple(rows[0]) + (self.max_batch,))
+            self.store.executemany('UPDATE write_behind SET state = ? WHERE id = ?',
+                                   [(INFLIGHT, row[0]) for row in rows])
+        return [_entry(row) for row in rows]
+
+    def _run(self):
+        self._local.draining = True
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+            batch = []
+            try:
+                batch = self._claim()
+                if batch:
+                    self._post(batch)
+            except Exception as e:
+                # Keep draining: a batch whose outcome was not recorded is sent again.
+                log.exception('iContact write-behind worker failed')
+                self._recover(batch, e)
+                batch = []
+            with self._cond:
+                self._cond.notify_all()
+                if not batch and not self._stopping:
+                    self._cond.wait(self.poll_interval)
+
+    def _recover(self, batch, error):
+        """
+        Schedules a retry of the entries of a batch interrupted by `error`,
+        whatever the error, until they run out of attempts.
+        """
+        if not batch:
+            return
+        try:
+            self._failed_batch(batch, error, retryable=True)
+        except Exception:
+            log.exception('iContact write-behind could not reschedule %d entries', len(batch))
+
+    def _send(self, client, target, account_id, client_folder_id, records):
+        if target == 'contacts':
+            return client.create_or_update_contact(account_id, client_folder_id, data=records)
+        if target == 'subscriptions':
+            return client.create_or_update_subscription(account_id, client_folder_id, data=records)
+        custom_object_id = target.split('/')[1]
+        return client.create_or_update_custom_object(custom_object_id, account_id, client_folder_id, data=records)
+
+    def _post(self, batch):
+        first = batch[0]
+        try:
+            response = self._send(self.clients[first.client], first.target, first.account_id,
+                                  first.client_folder_id, [entry.record for entry in batch])
+        except Exception as e:
+            self._failed_batch(batch, e)
+            return
+
+        chunk = [(pos, entry.record) for pos, entry in enumerate(batch)]
+        outcomes, _ = match_records(chunk, response, collection_of(first.target), self.match_keys.get(first.target))
+        rejected = [(FAILED, '; '.join(str(w) for w in o.warnings) or 'not returned by iContact', batch[o.index].id)
+                    for o in outcomes if not o.ok]
+        with self.store.transaction():
+            self.store.executemany('DELETE FROM write_behind WHERE id = ?',
+                                   [(batch[o.index].id,) for o in outcomes if o.ok])
+            self.store.executemany('UPDATE write_behind SET state = ?, error = ? WHERE id = ?', rejected)
+
+    def _failed_batch(self, batch, error, retryable=None):
+        """Schedules a retry of a batch whose call failed, or gives up on it."""
+        policy = self.retry_policy
+        if retryable is None and isinstance(error, IContactServerError):
+            retryable = policy.retryable(status=error.http_status)
+        elif retryable is None:
+            retryable = policy.retryable(exception=error)
+        now = time.time()
+        rows = []
+        for entry in batch:
+            attempts = entry.attempts + 1
+            delay = policy.delay(attempts, entry.created, now=now) if retryable else None
+            if delay is None:
+                rows.append((FAILED, attempts, entry.next_attempt, str(error), entry.id))
+            else:
+                rows.append((PENDING, attempts, now + delay, str(error), entry.id))
+        self.store.executemany('UPDATE write_behind SET state = ?, attempts = ?, next_attempt = ?, error = ? '
+                               'WHERE id = ?', rows)
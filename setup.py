@@ -2,8 +2,12 @@
 Based entirely on Django's own ``setup.py``.
 """
 import os
+
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 from distutils.command.install import INSTALL_SCHEMES
-from distutils.core import setup
 
 
 def fullsplit(path, result=None):
@@ -61,10 +65,17 @@ setup(
     author_email='jmurty@gmail.com',
     url='http://code.google.com/p/python-icontact/',
     packages=packages,
+    python_requires='>=3.7',
     install_requires=[
         'python-dateutil', 'requests'
     ],
+    extras_require={
+        'async': ['httpx'],
+    },
     data_files=data_files,
+    entry_points={
+        'console_scripts': ['icontact = icontact.cli:main'],
+    },
     classifiers=['Development Status :: 4 - Beta',
                  'Intended Audience :: Developers',
                  'License :: OSI Approved :: Apache License',